@@ -1,3 +1,10 @@
-from pkg_resources import get_distribution
+try:
+    # much faster to import than pkg_resources
+    from importlib.metadata import version as _distribution_version
+except ImportError:  # Python < 3.8
+    from pkg_resources import get_distribution
 
-version = __version__ = get_distribution('astroNN').version
+    def _distribution_version(name):
+        return get_distribution(name).version
+
+version = __version__ = _distribution_version('astroNN')
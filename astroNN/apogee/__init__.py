@@ -1,15 +1,20 @@
-from astroNN.apogee.apogee_shared import apogee_default_dr
-from astroNN.apogee.chips import bitmask_boolean
-from astroNN.apogee.chips import bitmask_decompositor
-from astroNN.apogee.chips import chips_pix_info
-from astroNN.apogee.chips import chips_split
-from astroNN.apogee.chips import continuum, apogee_continuum
-from astroNN.apogee.chips import gap_delete
-from astroNN.apogee.chips import wavelength_solution
-from astroNN.apogee.downloader import allstar
-from astroNN.apogee.downloader import allstarcannon
-from astroNN.apogee.downloader import allvisit
-from astroNN.apogee.downloader import apogee_distances
-from astroNN.apogee.downloader import apogee_vac_rc
-from astroNN.apogee.downloader import combined_spectra
-from astroNN.apogee.downloader import visit_spectra
+from astroNN.shared.lazy_import import lazy_import
+
+# downloaders need astropy, only import them when they are used
+lazy_import(__name__, {'apogee_default_dr': 'astroNN.apogee.apogee_shared.apogee_default_dr',
+                       'bitmask_boolean': 'astroNN.apogee.chips.bitmask_boolean',
+                       'bitmask_decompositor': 'astroNN.apogee.chips.bitmask_decompositor',
+                       'chips_pix_info': 'astroNN.apogee.chips.chips_pix_info',
+                       'chips_split': 'astroNN.apogee.chips.chips_split',
+                       'continuum': 'astroNN.apogee.chips.continuum',
+                       'apogee_continuum': 'astroNN.apogee.chips.apogee_continuum',
+                       'gap_delete': 'astroNN.apogee.chips.gap_delete',
+                       'wavelength_solution': 'astroNN.apogee.chips.wavelength_solution',
+                       'wavelength_windows_mask': 'astroNN.apogee.chips.wavelength_windows_mask',
+                       'allstar': 'astroNN.apogee.downloader.allstar',
+                       'allstarcannon': 'astroNN.apogee.downloader.allstarcannon',
+                       'allvisit': 'astroNN.apogee.downloader.allvisit',
+                       'apogee_distances': 'astroNN.apogee.downloader.apogee_distances',
+                       'apogee_vac_rc': 'astroNN.apogee.downloader.apogee_vac_rc',
+                       'combined_spectra': 'astroNN.apogee.downloader.combined_spectra',
+                       'visit_spectra': 'astroNN.apogee.downloader.visit_spectra'})
@@ -18,9 +18,9 @@ def apogee_env():
     HISTORY:
         2017-Oct-26 - Written - Henry Leung
     """
-    from astroNN.config import ENVVAR_WARN_FLAG
+    from astroNN.config import CONFIG
     _APOGEE = os.getenv('SDSS_LOCAL_SAS_MIRROR')
-    if _APOGEE is None and ENVVAR_WARN_FLAG is True:
+    if _APOGEE is None and CONFIG.envvar_warning is True:
         print("WARNING! APOGEE environment variable SDSS_LOCAL_SAS_MIRROR not set")
 
     return _APOGEE
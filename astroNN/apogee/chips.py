@@ -146,6 +146,28 @@ def chips_split(spectra, dr=None):
     return spectra_blue, spectra_green, spectra_red
 
 
+def wavelength_windows_mask(windows, dr=None):
+    """
+    To turn a list of wavelength windows into a boolean pixel mask of gap deleted spectra, useful to only calculate
+    jacobian for pixels inside windows (e.g. ASPCAP element windows)
+
+    :param windows: List of (starting wavelength, ending wavelength) in Angstrom
+    :type windows: list
+    :param dr: data release
+    :type dr: Union(int, NoneType)
+    :return: Boolean array of gap deleted spectra pixels, True for pixels inside any of the windows
+    :rtype: ndarray
+    """
+    dr = apogee_default_dr(dr=dr)
+    wavelength = np.concatenate(wavelength_solution(dr=dr))
+
+    mask = np.zeros(wavelength.shape[0], dtype=bool)
+    for start, end in windows:
+        mask |= (wavelength >= start) & (wavelength <= end)
+
+    return mask
+
+
 def bitmask_boolean(bitmask, target_bit):
     """
     NAME:
@@ -31,6 +31,11 @@ def config_path(flag=None):
         custom_model_init = 'None'
         cpu_fallback_init = False
         gpu_memratio_init = True
+        num_workers_init = 'None'
+        prefetch_depth_init = 10
+        cache_dir_init = astroNN_CACHE_DIR
+        cache_max_size_init = 'None'
+        model_pool_size_init = 4
 
         # Set flag back to 0 as flag=1 probably just because the file not even exists (example: first time using it)
         if not os.path.isfile(fullpath):
@@ -65,6 +70,26 @@ def config_path(flag=None):
                 gpu_memratio_init = config['NeuralNet']['GPU_Mem_ratio']
             except KeyError:
                 pass
+            try:
+                num_workers_init = config['Performance']['NumWorkers']
+            except KeyError:
+                pass
+            try:
+                prefetch_depth_init = config['Performance']['PrefetchDepth']
+            except KeyError:
+                pass
+            try:
+                cache_dir_init = config['Performance']['CacheDir']
+            except KeyError:
+                pass
+            try:
+                cache_max_size_init = config['Performance']['CacheMaxSize']
+            except KeyError:
+                pass
+            try:
+                model_pool_size_init = config['Performance']['ModelPoolSize']
+            except KeyError:
+                pass
         elif flag == 2:
             # pass because flag==2 is resetting the file
             pass
@@ -90,6 +115,11 @@ def config_path(flag=None):
         config['NeuralNet'] = {'CustomModelPath': custom_model_init,
                                'CPUFallback': cpu_fallback_init,
                                'GPU_Mem_ratio': gpu_memratio_init}
+        config['Performance'] = {'NumWorkers': num_workers_init,
+                                 'PrefetchDepth': prefetch_depth_init,
+                                 'CacheDir': cache_dir_init,
+                                 'CacheMaxSize': cache_max_size_init,
+                                 'ModelPoolSize': model_pool_size_init}
 
         with open(fullpath, 'w') as configfile:
             config.write(configfile)
@@ -103,69 +133,143 @@ def config_path(flag=None):
     return fullpath
 
 
+def _parse_bool(string):
+    return True if string.upper() == 'TRUE' else False
+
+
+def _parse_optional(parser):
+    def parse(string):
+        return None if string.upper() == 'NONE' else parser(string)
+    return parse
+
+
+def _parse_num_workers(string):
+    # None or 0 to use all CPU cores
+    return _parse_optional(int)(string) or os.cpu_count()
+
+
+def _parse_gpu_mem_ratio(string):
+    if string.upper() in ['TRUE', 'FALSE']:
+        return _parse_bool(string)
+    return _parse_optional(float)(string)
+
+
+def _parse_custom_model_path(string):
+    if string.upper() == 'NONE':
+        return None
+    string = string.split(';')
+    i = 0
+    while i < len(string):
+        string[i] = os.path.expanduser(string[i])
+        if not os.path.isfile(string[i]):
+            print(f'astroNN cannot find "{string[i]}" on your system, deleted from model path reader')
+            print(f'Please go and check "custommodelpath" in configuration file located at {config_path()}')
+            del string[i]
+        else:
+            i += 1
+    return string
+
+
+# attribute name of AstroNNConfig -> (section, key in config.ini, parser)
+_SETTINGS = {'magic_number': ('Basics', 'MagicNumber', float),
+             'multiprocessing_generator': ('Basics', 'Multiprocessing_Generator', _parse_bool),
+             'envvar_warning': ('Basics', 'EnvironmentVariableWarning', _parse_bool),
+             'tf_keras': ('Basics', 'Tensorflow_Keras', str.upper),
+             'custom_model_path': ('NeuralNet', 'CustomModelPath', _parse_custom_model_path),
+             'cpu_fallback': ('NeuralNet', 'CPUFallback', _parse_bool),
+             'gpu_mem_ratio': ('NeuralNet', 'GPU_Mem_ratio', _parse_gpu_mem_ratio),
+             'num_workers': ('Performance', 'NumWorkers', _parse_num_workers),
+             'prefetch_depth': ('Performance', 'PrefetchDepth', int),
+             'cache_dir': ('Performance', 'CacheDir', os.path.expanduser),
+             'cache_max_size': ('Performance', 'CacheMaxSize', _parse_optional(float)),
+             'model_pool_size': ('Performance', 'ModelPoolSize', int)}
+
+
+class AstroNNConfig(object):
+    """
+    astroNN configuration, config.ini is parsed once per process and cached. Every setting can be overridden by an
+    environment variable named ASTRONN_ followed by the upper case attribute name, e.g. ASTRONN_NUM_WORKERS=4
+
+    :ivar magic_number: Magic number representing missing labels/data
+    :ivar multiprocessing_generator: Whether to enable multiprocessing in astroNN data generator
+    :ivar envvar_warning: Whether to warn about not setting APOGEE and Gaia environment variables
+    :ivar tf_keras: 'AUTO', 'TENSORFLOW' or 'KERAS' to decide whether to use keras or tensorflow.keras
+    :ivar custom_model_path: List of paths to custom models or None
+    :ivar cpu_fallback: Whether to force Tensorflow to use CPU
+    :ivar gpu_mem_ratio: True to dynamically allocate GPU memory, a float to limit the ratio of GPU memory
+    :ivar num_workers: Number of threads feeding data generator to Keras during training
+    :ivar prefetch_depth: Maximum number of batches prepared in advance by data generator during training
+    :ivar cache_dir: Folder to cache datasets downloaded by astroNN
+    :ivar cache_max_size: Maximum size of datasets in cache_dir in MB, least recently used files are deleted when
+                          exceeded, None for no limit
+    :ivar model_pool_size: Maximum number of models kept loaded by load_folder(..., cache=True)
+    """
+    def __init__(self):
+        self.path = None
+        self.reload()
+
+    def reload(self):
+        """
+        Parse config.ini and environment variables again, module-level constants like MAGIC_NUMBER imported by other
+        modules are not updated
+
+        :return: None
+        :rtype: NoneType
+        """
+        self.path = config_path()
+        config = configparser.ConfigParser()
+        config.read(self.path)
+
+        try:
+            strings = {name: config[section][key] for name, (section, key, parser) in _SETTINGS.items()}
+        except KeyError:
+            # migrate old config.ini to have all settings
+            config_path(flag=1)
+            return self.reload()
+
+        for name, (section, key, parser) in _SETTINGS.items():
+            setattr(self, name, parser(os.getenv(f'ASTRONN_{name.upper()}', strings[name])))
+
+        return None
+
+
 def magic_num_reader():
     """
     NAME: magic_num_reader
-    PURPOSE: to read magic number from configuration file
+    PURPOSE: to read magic number from configuration
     INPUT:
     OUTPUT:
         (float)
     HISTORY:
         2018-Jan-25 - Written - Henry Leung (University of Toronto)
     """
-    cpath = config_path()
-    config = configparser.ConfigParser()
-    config.read(cpath)
-
-    try:
-        return float(config['Basics']['MagicNumber'])
-    except KeyError:
-        config_path(flag=1)
-        return magic_num_reader()
+    return CONFIG.magic_number
 
 
 def multiprocessing_flag_reader():
     """
-    NAME: multiprocessing_flag_readertf.keras
-    PURPOSE: to read multiprocessing flag from configuration file
+    NAME: multiprocessing_flag_reader
+    PURPOSE: to read multiprocessing flag from configuration
     INPUT:
     OUTPUT:
-        (string or boolean)
+        (boolean)
     HISTORY:
         2018-Jan-25 - Written - Henry Leung (University of Toronto)
     """
-    cpath = config_path()
-    config = configparser.ConfigParser()
-    config.read(cpath)
-
-    try:
-        string = config['Basics']['Multiprocessing_Generator']
-        return True if string.upper() == 'TRUE' else False
-    except KeyError:
-        config_path(flag=1)
-        return multiprocessing_flag_reader()
+    return CONFIG.multiprocessing_generator
 
 
 def envvar_warning_flag_reader():
     """
     NAME: envvar_warning_flag_reader
-    PURPOSE: to read environment variable warning flag from configuration file
+    PURPOSE: to read environment variable warning flag from configuration
     INPUT:
     OUTPUT:
-        (string or boolean)
+        (boolean)
     HISTORY:
         2018-Feb-10 - Written - Henry Leung (University of Toronto)
     """
-    cpath = config_path()
-    config = configparser.ConfigParser()
-    config.read(cpath)
-
-    try:
-        string = config['Basics']['EnvironmentVariableWarning']
-        return True if string.upper() == 'TRUE' else False
-    except KeyError:
-        config_path(flag=1)
-        return envvar_warning_flag_reader()
+    return CONFIG.envvar_warning
 
 
 def tf_keras_flag_reader():
@@ -178,16 +282,7 @@ def tf_keras_flag_reader():
     HISTORY:
         2018-Feb-10 - Written - Henry Leung (University of Toronto)
     """
-    cpath = config_path()
-    config = configparser.ConfigParser()
-    config.read(cpath)
-
-    try:
-        string = config['Basics']['Tensorflow_Keras']
-        return string.upper()
-    except KeyError:
-        config_path(flag=1)
-        return tf_keras_flag_reader()
+    return CONFIG.tf_keras
 
 
 def custom_model_path_reader():
@@ -196,33 +291,11 @@ def custom_model_path_reader():
     PURPOSE: to read path of custom models
     INPUT:
     OUTPUT:
-        (string)
+        (list or None)
     HISTORY:
         2018-Mar-09 - Written - Henry Leung (University of Toronto)
     """
-    cpath = config_path()
-    config = configparser.ConfigParser()
-    config.read(cpath)
-
-    try:
-        string = config['NeuralNet']['CustomModelPath']
-        if string.upper() != 'NONE':
-            string = string.split(';')
-            i = 0
-            while i < len(string):
-                string[i] = os.path.expanduser(string[i])
-                if not os.path.isfile(string[i]):
-                    print(f'astroNN cannot find "{string[i]}" on your system, deleted from model path reader')
-                    print(f'Please go and check "custommodelpath" in configuration file located at {cpath}')
-                    del string[i]
-                else:
-                    i += 1
-            return string
-        else:
-            return None
-    except KeyError:
-        config_path(flag=1)
-        return custom_model_path_reader()
+    return CONFIG.custom_model_path
 
 
 def cpu_gpu_reader():
@@ -231,23 +304,11 @@ def cpu_gpu_reader():
     PURPOSE: to read cpu gpu setting in config
     INPUT:
     OUTPUT:
-        (string)
+        (tuple)
     HISTORY:
         2018-Mar-14 - Written - Henry Leung (University of Toronto)
     """
-    cpath = config_path()
-    config = configparser.ConfigParser()
-    config.read(cpath)
-
-    try:
-        cpu_string = config['NeuralNet']['CPUFallback']
-        gpu_string = config['NeuralNet']['GPU_Mem_ratio']
-        cpu_string = True if cpu_string.upper() == 'TRUE' else False
-        gpu_string = True if gpu_string.upper() == 'TRUE' else False
-        return cpu_string, gpu_string
-    except KeyError:
-        config_path(flag=1)
-        return cpu_gpu_reader()
+    return CONFIG.cpu_fallback, CONFIG.gpu_mem_ratio
 
 
 def keras_import_manager():
@@ -314,12 +375,23 @@ def cpu_gpu_check():
     fallback_cpu, limit_gpu_mem = cpu_gpu_reader()
     if fallback_cpu is True:
         cpu_fallback()
+
+    import tensorflow as tf
+    # reuse the default session if it is already for the default graph (e.g. models in ModelPool have their own graph
+    # and session) instead of registering another session
+    session = tf.get_default_session()
+    if session is not None and session.graph is tf.get_default_graph():
+        return None
+
     if limit_gpu_mem is True:
         gpu_memory_manage()
     elif isinstance(limit_gpu_mem, float) is True:
         gpu_memory_manage(ratio=limit_gpu_mem)
 
 
+# Configuration parsed once per process
+CONFIG = AstroNNConfig()
+
 # Constant from configuration file
 MAGIC_NUMBER = magic_num_reader()
 MULTIPROCESS_FLAG = multiprocessing_flag_reader()
@@ -1,6 +1,8 @@
-from astroNN.datasets.apogee_distances import load_apogee_distances
-from astroNN.datasets.apogee_rc import load_apogee_rc
-from astroNN.datasets.galaxy10 import load_data as load_galaxy10
-from astroNN.datasets.h5 import H5Compiler
-from astroNN.datasets.h5 import H5Loader
-from astroNN.datasets.xmatch import xmatch
+from astroNN.shared.lazy_import import lazy_import
+
+lazy_import(__name__, {'load_apogee_distances': 'astroNN.datasets.apogee_distances.load_apogee_distances',
+                       'load_apogee_rc': 'astroNN.datasets.apogee_rc.load_apogee_rc',
+                       'load_galaxy10': 'astroNN.datasets.galaxy10.load_data',
+                       'H5Compiler': 'astroNN.datasets.h5.H5Compiler',
+                       'H5Loader': 'astroNN.datasets.h5.H5Loader',
+                       'xmatch': 'astroNN.datasets.xmatch.xmatch'})
@@ -8,8 +8,8 @@ import urllib.request
 import h5py
 import numpy as np
 
-from astroNN.config import astroNN_CACHE_DIR
-from astroNN.shared.downloader_tools import TqdmUpTo
+from astroNN.config import CONFIG
+from astroNN.shared.downloader_tools import TqdmUpTo, cache_size_limit
 from astroNN.shared.downloader_tools import sha256_checksum
 
 Galaxy10Class = {0: "Disk, Face-on, No Spiral",
@@ -45,7 +45,7 @@ def load_data(flag=None):
 
     complete_url = _G10_ORIGIN + filename
 
-    datadir = os.path.join(astroNN_CACHE_DIR, 'datasets')
+    datadir = os.path.join(CONFIG.cache_dir, 'datasets')
     file_hash = '969A6B1CEFCC36E09FFFA86FEBD2F699A4AA19B837BA0427F01B0BC6DED458AF'  # SHA256
 
     # Notice python expect sha256 in lowercase
@@ -70,6 +70,8 @@ def load_data(flag=None):
             if checksum != file_hash.lower():
                 load_data(flag=1)
 
+    cache_size_limit(datadir, CONFIG.cache_max_size, keep=fullfilename)
+
     with h5py.File(fullfilename, 'r') as F:
         x = np.array(F['images'])
         y = np.array(F['ans'])
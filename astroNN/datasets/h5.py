@@ -8,20 +8,12 @@ from functools import reduce
 
 import h5py
 import numpy as np
-from astropy.io import fits
 
 import astroNN
-from astroNN.apogee import combined_spectra, visit_spectra, allstar
-from astroNN.apogee.apogee_shared import apogee_env, apogee_default_dr
+from astroNN.apogee.apogee_shared import apogee_default_dr
 from astroNN.apogee.chips import gap_delete, apogee_continuum, chips_pix_info
-from astroNN.datasets.xmatch import xmatch
-from astroNN.gaia import mag_to_fakemag
-from astroNN.gaia.downloader import tgas_load, anderson_2017_parallax
-from astroNN.gaia.gaia_shared import gaia_env
 
 currentdir = os.getcwd()
-_APOGEE_DATA = apogee_env()
-_GAIA_DATA = gaia_env()
 
 
 def h5name_check(h5name):
@@ -59,6 +51,9 @@ class H5Compiler(object):
 
     def load_allstar(self):
         self.apogee_dr = apogee_default_dr(dr=self.apogee_dr)
+        from astropy.io import fits
+        from astroNN.apogee.downloader import allstar
+
         allstarpath = allstar(dr=self.apogee_dr)
         hdulist = fits.open(allstarpath)
         print(f'Loading allStar DR{self.apogee_dr} catalog')
@@ -107,6 +102,13 @@ class H5Compiler(object):
                                 dr=self.apogee_dr, bitmask=bitmask, target_bit=[0, 1, 2, 3, 4, 5, 6, 7, 12])
 
     def compile(self):
+        # only needed to compile h5 file, import here so H5Loader does not need astropy
+        from astropy.io import fits
+        from astroNN.apogee.downloader import combined_spectra, visit_spectra
+        from astroNN.datasets.xmatch import xmatch
+        from astroNN.gaia.downloader import tgas_load, anderson_2017_parallax
+        from astroNN.gaia.gaia_shared import mag_to_fakemag
+
         h5name_check(self.filename)
 
         hdulist = self.load_allstar()
@@ -631,6 +633,41 @@ class H5Loader(object):
         else:
             return spectra, y
 
+    def load_chunks(self, chunk_size=4096):
+        """
+        NAME:
+            load_chunks
+        PURPOSE:
+            load the dataset chunk by chunk instead of loading everything into memory, each chunk has the same format
+            as the output from load()
+        INPUT:
+            chunk_size (int): number of spectra in each chunk
+        OUTPUT:
+            (generator): yield spectra and labels (and errors if load_err=True) chunk by chunk
+        """
+        allowed_index = self.load_allowed_index()
+        with h5py.File(self.h5path) as F:  # ensure the file will be cleaned up
+            for i in range(0, allowed_index.shape[0], chunk_size):
+                idx = allowed_index[i:i + chunk_size]
+                if idx[-1] - idx[0] + 1 == idx.shape[0]:
+                    # contiguous indices, read a slice
+                    idx = slice(idx[0], idx[-1] + 1)
+                else:
+                    # allowed index is sorted and unique so h5py can read only the selected rows
+                    idx = idx.tolist()
+                spectra = F['spectra'][idx]
+                y = np.column_stack([F[f'{tg}'][idx] for tg in self.target])
+                if self.target.shape[0] == 1:
+                    y = y[:, 0]
+                if self.load_err is True:
+                    spectra_err = F['spectra_err'][idx]
+                    y_err = np.column_stack([F[f'{tg}_err'][idx] for tg in self.target])
+                    if self.target.shape[0] == 1:
+                        y_err = y_err[:, 0]
+                    yield spectra, y, spectra_err, y_err
+                else:
+                    yield spectra, y
+
     def load_entry(self, name):
         """
         NAME:
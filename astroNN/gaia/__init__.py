@@ -1,6 +1,20 @@
-from astroNN.gaia.downloader import anderson_2017_parallax, gaiadr2_parallax
-from astroNN.gaia.downloader import tgas, gaia_source
-from astroNN.gaia.downloader import tgas_load
-from astroNN.gaia.gaia_shared import gaia_default_dr
-from astroNN.gaia.gaia_shared import mag_to_absmag, mag_to_fakemag, absmag_to_pc, fakemag_to_absmag, absmag_to_fakemag, \
-    fakemag_to_pc, fakemag_to_logsol, absmag_to_logsol, logsol_to_fakemag, logsol_to_absmag, extinction_correction
\ No newline at end of file
+from astroNN.shared.lazy_import import lazy_import
+
+# downloaders and magnitude conversion need astropy, only import them when they are used
+lazy_import(__name__, {'anderson_2017_parallax': 'astroNN.gaia.downloader.anderson_2017_parallax',
+                       'gaiadr2_parallax': 'astroNN.gaia.downloader.gaiadr2_parallax',
+                       'tgas': 'astroNN.gaia.downloader.tgas',
+                       'gaia_source': 'astroNN.gaia.downloader.gaia_source',
+                       'tgas_load': 'astroNN.gaia.downloader.tgas_load',
+                       'gaia_default_dr': 'astroNN.gaia.gaia_shared.gaia_default_dr',
+                       'mag_to_absmag': 'astroNN.gaia.gaia_shared.mag_to_absmag',
+                       'mag_to_fakemag': 'astroNN.gaia.gaia_shared.mag_to_fakemag',
+                       'absmag_to_pc': 'astroNN.gaia.gaia_shared.absmag_to_pc',
+                       'fakemag_to_absmag': 'astroNN.gaia.gaia_shared.fakemag_to_absmag',
+                       'absmag_to_fakemag': 'astroNN.gaia.gaia_shared.absmag_to_fakemag',
+                       'fakemag_to_pc': 'astroNN.gaia.gaia_shared.fakemag_to_pc',
+                       'fakemag_to_logsol': 'astroNN.gaia.gaia_shared.fakemag_to_logsol',
+                       'absmag_to_logsol': 'astroNN.gaia.gaia_shared.absmag_to_logsol',
+                       'logsol_to_fakemag': 'astroNN.gaia.gaia_shared.logsol_to_fakemag',
+                       'logsol_to_absmag': 'astroNN.gaia.gaia_shared.logsol_to_absmag',
+                       'extinction_correction': 'astroNN.gaia.gaia_shared.extinction_correction'})
@@ -22,9 +22,9 @@ def gaia_env():
     :rtype: str
     :History: 2017-Oct-26 - Written - Henry Leung (University of Toronto)
     """
-    from astroNN.config import ENVVAR_WARN_FLAG
+    from astroNN.config import CONFIG
     _GAIA = os.getenv('GAIA_TOOLS_DATA')
-    if _GAIA is None and ENVVAR_WARN_FLAG is True:
+    if _GAIA is None and CONFIG.envvar_warning is True:
         print("WARNING! Gaia environment variable GAIA_TOOLS_DATA not set")
     return _GAIA
 
@@ -1,10 +1,10 @@
 import json
-import os
 import time
 from abc import ABC
 
+import h5py
 import numpy as np
-from astroNN.config import MULTIPROCESS_FLAG
+from astroNN.config import CONFIG
 from astroNN.config import keras_import_manager
 from astroNN.datasets import H5Loader
 from astroNN.models.NeuralNetMaster import NeuralNetMaster
@@ -14,9 +14,8 @@ from astroNN.nn.losses import mean_absolute_error
 from astroNN.nn.metrics import categorical_accuracy, binary_accuracy
 from astroNN.nn.utilities import Normalizer
 from astroNN.nn.utilities.generator import threadsafe_generator, GeneratorMaster
-from astroNN.nn.numpy import sigmoid
+from astroNN.nn.numpy_engine import mc_postprocessing
 from astroNN.shared.nn_tools import gpu_availability
-from sklearn.model_selection import train_test_split
 from astroNN.shared.custom_warnings import deprecated
 
 keras = keras_import_manager()
@@ -37,8 +36,8 @@ class BayesianCNNDataGenerator(GeneratorMaster):
         2017-Dec-02 - Written - Henry Leung (University of Toronto)
     """
 
-    def __init__(self, batch_size, shuffle=True):
-        super().__init__(batch_size, shuffle)
+    def __init__(self, batch_size, shuffle=True, chunk_size=None, buffer_size=16):
+        super().__init__(batch_size, shuffle, chunk_size, buffer_size)
 
     def _data_generation(self, inputs, labels, input_err, labels_err, idx_list_temp):
         x = self.input_d_checking(inputs, idx_list_temp)
@@ -80,8 +79,8 @@ class BayesianCNNPredDataGenerator(GeneratorMaster):
         2017-Dec-02 - Written - Henry Leung (University of Toronto)
     """
 
-    def __init__(self, batch_size, shuffle=False):
-        super().__init__(batch_size, shuffle)
+    def __init__(self, batch_size, shuffle=False, chunk_size=None, buffer_size=16):
+        super().__init__(batch_size, shuffle, chunk_size, buffer_size)
 
     def _data_generation(self, inputs, input_err, idx_list_temp):
         # X : (n_samples, v_size, n_channels)
@@ -139,6 +138,10 @@ class BayesianCNNBase(NeuralNetMaster, ABC):
         self.dropout_rate = 0.2
         self.length_scale = 3  # prior length scale
         self.mc_num = 100  # increased to 100 due to high performance VI on GPU implemented on 14 April 2018 (Henry)
+        self.mc_tol = None  # tolerance of adaptive Monte Carlo inference, None to always do mc_num forward passes
+        self.mc_block_size = 10  # number of forward passes in each block of adaptive Monte Carlo inference
+        self.mc_num_effective = None  # number of forward passes done for each data point in the last inference
+        self.mc_memory_block = None  # number of forward passes run at once in the graph, None to run all at once
         self.val_size = 0.1
         self.disable_dropout = False
 
@@ -146,6 +149,20 @@ class BayesianCNNBase(NeuralNetMaster, ABC):
         self.labels_norm_mode = 2
 
         self.keras_model_predict = None
+        # cache of Monte Carlo inference models, see _mc_model()
+        self._mc_models = {}
+
+    def clear_inference_cache(self):
+        """
+        Clear cached inference models, called automatically when Keras models are replaced by compile()
+
+        :return: None
+        :rtype: NoneType
+        """
+        super().clear_inference_cache()
+        self._mc_models = {}
+
+        return None
 
     def pre_training_checklist_child(self, input_data, labels, input_err, labels_err):
         self.pre_training_checklist_master(input_data, labels)
@@ -174,22 +191,22 @@ class BayesianCNNBase(NeuralNetMaster, ABC):
         if self.keras_model is None:  # only compiler if there is no keras_model, e.g. fine-tuning does not required
             self.compile()
 
+        from sklearn.model_selection import train_test_split
         self.train_idx, self.val_idx = train_test_split(np.arange(self.num_train), test_size=self.val_size)
 
         self.inv_model_precision = (2 * self.num_train * self.l2) / (self.length_scale ** 2 * (1 - self.dropout_rate))
 
-        self.training_generator = BayesianCNNDataGenerator(self.batch_size).generate(norm_data[self.train_idx],
-                                                                                     norm_labels[self.train_idx],
-                                                                                     norm_input_err[self.train_idx],
-                                                                                     norm_labels_err[self.train_idx])
-        self.validation_generator = BayesianCNNDataGenerator(self.batch_size).generate(norm_data[self.val_idx],
-                                                                                       norm_labels[self.val_idx],
-                                                                                       norm_input_err[self.val_idx],
-                                                                                       norm_labels_err[self.val_idx])
+        self.training_generator = BayesianCNNDataGenerator(self.batch_size, **self._shuffle_config()).generate(
+            norm_data[self.train_idx], norm_labels[self.train_idx], norm_input_err[self.train_idx],
+            norm_labels_err[self.train_idx])
+        self.validation_generator = BayesianCNNDataGenerator(self.batch_size, **self._shuffle_config()).generate(
+            norm_data[self.val_idx], norm_labels[self.val_idx], norm_input_err[self.val_idx],
+            norm_labels_err[self.val_idx])
 
         return norm_data, norm_labels, norm_labels_err
 
-    def compile(self, optimizer=None, loss=None, metrics=None, loss_weights=None, sample_weight_mode=None):
+    def compile(self, optimizer=None, loss=None, metrics=None, loss_weights=None, sample_weight_mode=None,
+                inference_only=False):
         if optimizer is not None:
             self.optimizer = optimizer
         elif self.optimizer is None or self.optimizer == 'adam':
@@ -206,6 +223,11 @@ class BayesianCNNBase(NeuralNetMaster, ABC):
             raise RuntimeError('Only "regression", "classification" and "binary_classification" are supported')
 
         self.keras_model, self.keras_model_predict, output_loss, variance_loss = self.model()
+        self.clear_inference_cache()
+
+        # uncompiled Keras model can still predict
+        if inference_only is True:
+            return None
 
         if self.task == 'regression':
             if self.metrics is None:
@@ -278,9 +300,10 @@ class BayesianCNNBase(NeuralNetMaster, ABC):
                                                       validation_data=self.validation_generator,
                                                       validation_steps=self.val_num // self.batch_size,
                                                       epochs=self.max_epochs, verbose=self.verbose,
-                                                      workers=os.cpu_count(),
+                                                      workers=CONFIG.num_workers,
+                                                      max_queue_size=CONFIG.prefetch_depth,
                                                       callbacks=self.__callbacks,
-                                                      use_multiprocessing=MULTIPROCESS_FLAG)
+                                                      use_multiprocessing=CONFIG.multiprocessing_generator)
 
         print(f'Completed Training, {(time.time() - start_time):.{2}f}s in total')
 
@@ -308,7 +331,7 @@ class BayesianCNNBase(NeuralNetMaster, ABC):
                 'labels_std': self.labels_std.tolist(),
                 'valsize': self.val_size, 'targetname': self.targetname, 'dropout_rate': self.dropout_rate,
                 'l2': self.l2, 'input_norm_mode': self.input_norm_mode, 'labels_norm_mode': self.labels_norm_mode,
-                'batch_size': self.batch_size}
+                'batch_size': self.batch_size, 'inference_batch_size': self.inference_batch_size}
 
         with open(self.fullfilepath + '/astroNN_model_parameter.json', 'w') as f:
             json.dump(data, f, indent=4, sort_keys=True)
@@ -334,105 +357,231 @@ class BayesianCNNBase(NeuralNetMaster, ABC):
 
         self.pre_testing_checklist_master()
 
-        input_data = np.atleast_2d(input_data)
+        start_time = time.time()
+        print("Starting Dropout Variational Inference")
 
-        if self.input_normalizer is not None:
-            input_array = self.input_normalizer.normalize(input_data, calc=False)
+        result = self._mc_run(self._mc_model(), input_data, inputs_err)
+
+        print(f'Completed Dropout Variational Inference with {np.mean(self.mc_num_effective):.{1}f} forward passes '
+              f'on average, {(time.time() - start_time):.{2}f}s in total')
+
+        return self._mc_postprocessing(result)
+
+    def test_stream(self, input_data, output_h5, inputs_err=None, chunk_size=4096):
+        """
+        Streaming version of test() for catalog-scale inference with bounded memory, data are processed chunk by chunk
+        and the results are appended to a h5 file incrementally
+
+        | Datasets in output h5: prediction, uncertainty_total, uncertainty_model, uncertainty_predictive, mc_num
+
+        :param input_data: Data to be inferred with neural network, can be a ndarray, memmap, h5py dataset, H5Loader or
+                           an iterator of data chunks (or tuples of data chunk and its error)
+        :type input_data: Union[ndarray, h5py.Dataset, H5Loader, iterator]
+        :param output_h5: Path to the output h5 file, results will be appended if the file already exists
+        :type output_h5: str
+        :param inputs_err: Error for input_data, same shape with input_data. Not used for H5Loader or iterator
+        :type inputs_err: Union([NoneType, ndarray, h5py.Dataset])
+        :param chunk_size: Number of data in each chunk, not used for iterator
+        :type chunk_size: int
+        :return: Total number of data inferred
+        :rtype: int
+        """
+        self.pre_testing_checklist_master()
+
+        start_time = time.time()
+        print("Starting Streaming Dropout Variational Inference")
+
+        # only build Monte Carlo model once for all chunks
+        mc_model = self._mc_model()
+        total_num = 0
+
+        with h5py.File(output_h5, 'a') as h5f:
+            for data_chunk, err_chunk in self._stream_chunks(input_data, inputs_err, chunk_size):
+                predictions, uncertainty = self._mc_postprocessing(self._mc_run(mc_model, data_chunk, err_chunk))
+                for name, value in [('prediction', predictions), ('uncertainty_total', uncertainty['total']),
+                                    ('uncertainty_model', uncertainty['model']),
+                                    ('uncertainty_predictive', uncertainty['predictive']),
+                                    ('mc_num', self.mc_num_effective)]:
+                    if name not in h5f:
+                        h5f.create_dataset(name, data=value, maxshape=(None, *value.shape[1:]), chunks=True)
+                    else:
+                        h5f[name].resize(h5f[name].shape[0] + value.shape[0], axis=0)
+                        h5f[name][-value.shape[0]:] = value
+                h5f.flush()
+                total_num += predictions.shape[0]
+                print(f'Inferred {total_num} data, {(time.time() - start_time):.{2}f}s elapsed')
+
+        print(f'Completed Streaming Dropout Variational Inference, {(time.time() - start_time):.{2}f}s in total')
+
+        return total_num
+
+    @staticmethod
+    def _stream_chunks(input_data, inputs_err, chunk_size):
+        """
+        Yield chunk of data and error (None if not available) from different kind of data source
+        """
+        if isinstance(input_data, H5Loader):
+            for chunk in input_data.load_chunks(chunk_size=chunk_size):
+                yield chunk[0], chunk[2] if input_data.load_err is True else None
+        elif hasattr(input_data, 'shape') and hasattr(input_data, '__getitem__'):
+            # ndarray, memmap or h5py dataset, only slice a chunk into memory each time
+            for i in range(0, input_data.shape[0], chunk_size):
+                yield (np.asarray(input_data[i:i + chunk_size]),
+                       None if inputs_err is None else np.asarray(inputs_err[i:i + chunk_size]))
         else:
-            # Prevent shallow copy issue
-            input_array = np.array(input_data)
-            input_array -= self.input_mean
-            input_array /= self.input_std
+            for chunk in input_data:
+                if isinstance(chunk, (tuple, list)):
+                    yield np.asarray(chunk[0]), None if chunk[1] is None else np.asarray(chunk[1])
+                else:
+                    yield np.asarray(chunk), None
+
+    def _inference_model(self):
+        return self._mc_model()
+
+    def _mc_model(self, mc_num=None):
+        """
+        Keras model doing fast Monte Carlo dropout inference on raw data, only a block of forward passes is done for
+        each call if adaptive Monte Carlo inference is enabled by setting mc_tol
+
+        :param mc_num: Number of forward passes for each call, by default mc_num (or mc_block_size if mc_tol is set)
+        :type mc_num: Union[NoneType, int]
+        :return: Keras model
+        :rtype: keras.Model
+        """
+        if mc_num is None:
+            mc_num = self.mc_num if self.mc_tol is None else min(self.mc_block_size, self.mc_num)
+
+        # memoize to avoid adding new ops to the graph every call, weights are shared with keras_model_predict so
+        # training does not invalidate the cache
+        key = (mc_num, self.mc_memory_block, tuple(self.keras_model_predict.input_shape[1:]))
+        if key not in self._mc_models or self._mc_models[key][0] is not self.keras_model_predict or \
+                not self._same_normalization(self._mc_models[key][1]):
+            # normalization is added outside of Monte Carlo model so its deterministic trunk can be found
+            mc_model = FastMCInference(mc_num, block_size=self.mc_memory_block)(self.keras_model_predict)
+            # input normalization is done in the graph, output stays in numpy because MC statistics are not linear
+            self._mc_models[key] = (self.keras_model_predict, self._normalization_stats(),
+                                    self.serving_model(mc_model, denormalize=False))
+
+        return self._mc_models[key][2]
+
+    def _mc_run(self, mc_model, input_data, inputs_err=None):
+        """
+        Run Monte Carlo dropout inference with fixed number of forward passes, or adaptively if mc_tol is set.
+        Number of forward passes done for each data point is stored in mc_num_effective
+
+        | For adaptive inference, forward passes are drawn in blocks of mc_block_size and the running mean and variance
+        | are merged block by block. A data point stops once the changes of running mean and variance of all outputs
+        | (in normalized space) are smaller than mc_tol, or mc_num forward passes are reached
+
+        :param mc_model: Keras model from _mc_model()
+        :type mc_model: keras.Model
+        :param input_data: Data to be inferred with neural network
+        :type input_data: ndarray
+        :param inputs_err: Error for input_data, same shape with input_data.
+        :type inputs_err: Union([NoneType, ndarray])
+        :return: Raw mean and variance from the model
+        :rtype: ndarray
+        """
+        if self.mc_tol is None:
+            result = self._mc_inference(mc_model, input_data, inputs_err)
+            self.mc_num_effective = np.full(result.shape[0], self.mc_num)
+            return result
+
+        input_data = np.atleast_2d(input_data)
+        if inputs_err is not None:
+            inputs_err = np.atleast_2d(inputs_err)
+        block_size = min(self.mc_block_size, self.mc_num)
+
+        count = np.zeros(input_data.shape[0], dtype=int)
+        mean, m2 = None, None
+        active = np.arange(input_data.shape[0])
+        while active.shape[0] > 0:
+            # data points still running have done the same number of forward passes, the last block only draws the
+            # remaining forward passes so data points not converged reach exactly mc_num
+            num_draws = min(block_size, self.mc_num - count[active[0]])
+            block_model = mc_model if num_draws == block_size else self._mc_model(mc_num=num_draws)
+            block = self._mc_inference(block_model, input_data[active],
+                                       None if inputs_err is None else inputs_err[active])
+            block_mean, block_m2 = block[..., 0], block[..., 1] * num_draws
+            if mean is None:
+                mean, m2 = block_mean, block_m2
+                count[:] = num_draws
+                converged = np.zeros(active.shape[0], dtype=bool)
+            else:
+                # merge block statistics with running statistics (Chan et al. parallel variant of Welford's algorithm)
+                n_a = count[active][:, np.newaxis]
+                n = n_a + num_draws
+                delta = block_mean - mean[active]
+                new_mean = mean[active] + delta * num_draws / n
+                new_m2 = m2[active] + block_m2 + np.square(delta) * n_a * num_draws / n
+                mean_change = np.abs(new_mean - mean[active]).reshape(active.shape[0], -1).max(axis=1)
+                var_change = np.abs(new_m2 / n - m2[active] / n_a).reshape(active.shape[0], -1).max(axis=1)
+                converged = (mean_change <= self.mc_tol) & (var_change <= self.mc_tol)
+                mean[active], m2[active] = new_mean, new_m2
+                count[active] += num_draws
+            active = active[~converged & (count[active] < self.mc_num)]
+
+        self.mc_num_effective = count
+        return np.stack((mean, m2 / count.reshape(-1, *[1] * (m2.ndim - 1))), axis=-1)
+
+    def _mc_inference(self, mc_model, input_data, inputs_err=None):
+        """
+        Run Monte Carlo dropout inference model on data
+
+        :param mc_model: Keras model from _mc_model()
+        :type mc_model: keras.Model
+        :param input_data: Data to be inferred with neural network
+        :type input_data: ndarray
+        :param inputs_err: Error for input_data, same shape with input_data.
+        :type inputs_err: Union([NoneType, ndarray])
+        :return: Raw mean and variance from the model
+        :rtype: ndarray
+        """
+        input_data = np.atleast_2d(input_data)
 
         # if no error array then just zeros
         if inputs_err is None:
             inputs_err = np.zeros_like(input_data)
         else:
-            inputs_err = np.atleast_2d(inputs_err)
-            inputs_err /= self.input_std
+            inputs_err = np.atleast_2d(inputs_err) / self.input_std
 
         total_test_num = input_data.shape[0]  # Number of testing data
 
         # for number of training data smaller than batch_size
-        if total_test_num < self.batch_size:
-            batch_size = total_test_num
-        else:
-            batch_size = self.batch_size
+        batch_size = min(self._get_inference_batch_size(), total_test_num)
 
         # Due to the nature of how generator works, no overlapped prediction
         data_gen_shape = (total_test_num // batch_size) * batch_size
         remainder_shape = total_test_num - data_gen_shape  # Remainder from generator
 
-        start_time = time.time()
-        print("Starting Dropout Variational Inference")
-
         # Data Generator for prediction
-        prediction_generator = BayesianCNNPredDataGenerator(batch_size).generate(input_array[:data_gen_shape],
+        prediction_generator = BayesianCNNPredDataGenerator(batch_size).generate(input_data[:data_gen_shape],
                                                                                  inputs_err[:data_gen_shape])
 
-        new = FastMCInference(self.mc_num)(self.keras_model_predict)
-
-        result = np.asarray(new.predict_generator(prediction_generator, steps=data_gen_shape // batch_size))
+        result = np.asarray(mc_model.predict_generator(prediction_generator, steps=data_gen_shape // batch_size))
 
         if remainder_shape != 0:  # deal with remainder
-            remainder_generator = BayesianCNNPredDataGenerator(remainder_shape).generate(input_array[data_gen_shape:],
+            remainder_generator = BayesianCNNPredDataGenerator(remainder_shape).generate(input_data[data_gen_shape:],
                                                                                           inputs_err[data_gen_shape:])
-            remainder_result = np.asarray(new.predict_generator(remainder_generator, steps=1))
+            remainder_result = np.asarray(mc_model.predict_generator(remainder_generator, steps=1))
             result = np.concatenate((result, remainder_result))
 
         # in case only 1 test data point, in such case we need to add a dimension
         if result.ndim < 3 and batch_size == 1:
             result = np.expand_dims(result, axis=0)
 
-        half_first_dim = result.shape[1] // 2  # result.shape[1] is guarantee an even number, otherwise sth is wrong
-
-        predictions = result[:, :half_first_dim, 0]  # mean prediction
-        mc_dropout_uncertainty = result[:, :half_first_dim, 1] * (self.labels_std ** 2)  # model uncertainty
-        predictions_var = np.exp(result[:, half_first_dim:, 0]) * (self.labels_std ** 2)  # predictive uncertainty
-
-        print(f'Completed Dropout Variational Inference with {self.mc_num} forward passes, '
-              f'{(time.time() - start_time):.{2}f}s in total')
-
-        if self.labels_normalizer is not None:
-            predictions = self.labels_normalizer.denormalize(predictions)
-        else:
-            predictions *= self.labels_std
-            predictions += self.labels_mean
-
-        if self.task == 'regression':
-            # Predictive variance
-            pred_var = predictions_var + mc_dropout_uncertainty  # epistemic plus aleatoric uncertainty
-            pred_uncertainty = np.sqrt(pred_var)  # Convert back to std error
-
-            # final correction from variance to standard derivation
-            mc_dropout_uncertainty = np.sqrt(mc_dropout_uncertainty)
-            predictive_uncertainty = np.sqrt(predictions_var)
-
-        elif self.task == 'classification':
-            # we want entropy for classification uncertainty
-            predicted_class = np.argmax(predictions, axis=1)
-            mc_dropout_uncertainty_temp = np.array(mc_dropout_uncertainty)
-            mc_dropout_uncertainty = np.ones_like(predicted_class, dtype=float)
-            predictive_uncertainty = np.ones_like(predicted_class, dtype=float)
-            for i in range(predicted_class.shape[0]):
-                mc_dropout_uncertainty[i] = mc_dropout_uncertainty_temp[i, predicted_class[i]]
-                predictive_uncertainty[i] = np.array(predictions_var[i, predicted_class[i]])
-
-            pred_uncertainty = mc_dropout_uncertainty + predictive_uncertainty
-            # We only want the predicted class back
-            predictions = predicted_class
+        return result
 
-        elif self.task == 'binary_classification':
-            # we want entropy for classification uncertainty, so need prediction in logits space
-            mc_dropout_uncertainty = - np.sum(predictions * np.log(predictions), axis=0)
-            # need to activate before round to int so that the prediction is always 0 or 1
-            predictions = np.rint(sigmoid(predictions))
-            predictive_uncertainty = predictions_var
-            pred_uncertainty = mc_dropout_uncertainty + predictions_var
-        else:
-            raise AttributeError('Unknown Task')
+    def _mc_postprocessing(self, result):
+        """
+        Convert raw mean and variance from Monte Carlo dropout inference model to prediction and uncertainty
 
-        return predictions, {'total': pred_uncertainty, 'model': mc_dropout_uncertainty, 'predictive': predictive_uncertainty}
+        :param result: Raw mean and variance from _mc_inference()
+        :type result: ndarray
+        :return: prediction and prediction uncertainty
+        """
+        # shared with Tensorflow-free numpy engine
+        return mc_postprocessing(result, self.task, self.labels_normalizer, self.labels_mean, self.labels_std)
 
     @deprecated
     def test_old(self, input_data, inputs_err=None):
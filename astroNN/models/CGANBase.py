@@ -1,11 +1,9 @@
 import json
-import os
 from abc import ABC, abstractmethod
 
 import numpy as np
-from sklearn.model_selection import train_test_split
 
-from astroNN.config import MULTIPROCESS_FLAG
+from astroNN.config import CONFIG
 from astroNN.config import keras_import_manager
 from astroNN.datasets import H5Loader
 from astroNN.models.NeuralNetMaster import NeuralNetMaster
@@ -33,8 +31,8 @@ class CGANDataGenerator(GeneratorMaster):
         2017-Dec-02 - Written - Henry Leung (University of Toronto)
     """
 
-    def __init__(self, batch_size, shuffle=True):
-        super().__init__(batch_size, shuffle)
+    def __init__(self, batch_size, shuffle=True, chunk_size=None, buffer_size=16):
+        super().__init__(batch_size, shuffle, chunk_size, buffer_size)
 
     def _data_generation(self, inputs, recon_inputs, idx_list_temp):
         x = self.input_d_checking(inputs, idx_list_temp)
@@ -74,8 +72,8 @@ class CGANPredDataGenerator(GeneratorMaster):
         2017-Dec-02 - Written - Henry Leung (University of Toronto)
     """
 
-    def __init__(self, batch_size, shuffle=False):
-        super().__init__(batch_size, shuffle)
+    def __init__(self, batch_size, shuffle=False, chunk_size=None, buffer_size=16):
+        super().__init__(batch_size, shuffle, chunk_size, buffer_size)
 
     def _data_generation(self, inputs, idx_list_temp):
         # Generate data
@@ -166,9 +164,14 @@ class CGANBase(NeuralNetMaster, ABC):
         GAN = Model(gan_input, gan_V)
         return GAN
 
-    def compile(self, optimizer=None, loss=None, metrics=None, loss_weights=None, sample_weight_mode=None):
+    def compile(self, optimizer=None, loss=None, metrics=None, loss_weights=None, sample_weight_mode=None,
+                inference_only=False):
         self.keras_model = self.model()
 
+        # uncompiled Keras model can still predict
+        if inference_only is True:
+            return None
+
         if optimizer is not None:
             self.optimizer = optimizer
         elif self.optimizer is None or self.optimizer == 'adam':
@@ -204,12 +207,13 @@ class CGANBase(NeuralNetMaster, ABC):
         if self.keras_model is None:  # only compiler if there is no keras_model, e.g. fine-tuning does not required
             self.compile()
 
+        from sklearn.model_selection import train_test_split
         self.train_idx, self.val_idx = train_test_split(np.arange(self.num_train), test_size=self.val_size)
 
-        self.training_generator = CGANDataGenerator(self.batch_size).generate(norm_data[self.train_idx],
-                                                                              norm_labels[self.train_idx])
-        self.validation_generator = CGANDataGenerator(self.batch_size).generate(norm_data[self.val_idx],
-                                                                                norm_labels[self.val_idx])
+        self.training_generator = CGANDataGenerator(self.batch_size, **self._shuffle_config()).generate(
+            norm_data[self.train_idx], norm_labels[self.train_idx])
+        self.validation_generator = CGANDataGenerator(self.batch_size, **self._shuffle_config()).generate(
+            norm_data[self.val_idx], norm_labels[self.val_idx])
 
         return input_data, input_recon_target
 
@@ -227,9 +231,10 @@ class CGANBase(NeuralNetMaster, ABC):
                                        steps_per_epoch=self.num_train // self.batch_size,
                                        validation_data=self.validation_generator,
                                        validation_steps=self.val_num // self.batch_size,
-                                       epochs=self.max_epochs, verbose=self.verbose, workers=os.cpu_count(),
+                                       epochs=self.max_epochs, verbose=self.verbose, workers=CONFIG.num_workers,
+                                       max_queue_size=CONFIG.prefetch_depth,
                                        callbacks=[reduce_lr, self.virtual_cvslogger],
-                                       use_multiprocessing=MULTIPROCESS_FLAG)
+                                       use_multiprocessing=CONFIG.multiprocessing_generator)
 
         if self.autosave is True:
             # Call the post training checklist to save parameters
@@ -336,7 +341,8 @@ class CGANBase(NeuralNetMaster, ABC):
                 'labels_std': self.labels_std.tolist(),
                 'valsize': self.val_size, 'targetname': self.targetname, 'dropout_rate': self.dropout_rate,
                 'l2': self.l2, 'input_norm_mode': self.input_norm_mode, 'labels_norm_mode': self.labels_norm_mode,
-                'batch_size': self.batch_size, 'latent': self.latent_dim}
+                'batch_size': self.batch_size, 'inference_batch_size': self.inference_batch_size,
+                'latent': self.latent_dim}
 
         with open(self.fullfilepath + '/astroNN_model_parameter.json', 'w') as f:
             json.dump(data, f, indent=4, sort_keys=True)
@@ -1,12 +1,10 @@
 import json
-import os
 from abc import ABC
 
 import numpy as np
 import time
-from sklearn.model_selection import train_test_split
 
-from astroNN.config import MULTIPROCESS_FLAG
+from astroNN.config import CONFIG
 from astroNN.config import keras_import_manager
 from astroNN.models.NeuralNetMaster import NeuralNetMaster
 from astroNN.nn.callbacks import VirutalCSVLogger
@@ -34,8 +32,8 @@ class CNNDataGenerator(GeneratorMaster):
         2017-Dec-02 - Written - Henry Leung (University of Toronto)
     """
 
-    def __init__(self, batch_size, shuffle=True):
-        super().__init__(batch_size, shuffle)
+    def __init__(self, batch_size, shuffle=True, chunk_size=None, buffer_size=16):
+        super().__init__(batch_size, shuffle, chunk_size, buffer_size)
 
     def _data_generation(self, inputs, labels, idx_list_temp):
         x = self.input_d_checking(inputs, idx_list_temp)
@@ -75,8 +73,8 @@ class CNNPredDataGenerator(GeneratorMaster):
         2017-Dec-02 - Written - Henry Leung (University of Toronto)
     """
 
-    def __init__(self, batch_size, shuffle=False):
-        super().__init__(batch_size, shuffle)
+    def __init__(self, batch_size, shuffle=False, chunk_size=None, buffer_size=16):
+        super().__init__(batch_size, shuffle, chunk_size, buffer_size)
 
     def _data_generation(self, inputs, idx_list_temp):
         # Generate data
@@ -139,7 +137,8 @@ class CNNBase(NeuralNetMaster, ABC):
         self.input_norm_mode = 1
         self.labels_norm_mode = 2
 
-    def compile(self, optimizer=None, loss=None, metrics=None, loss_weights=None, sample_weight_mode=None):
+    def compile(self, optimizer=None, loss=None, metrics=None, loss_weights=None, sample_weight_mode=None,
+                inference_only=False):
         if optimizer is not None:
             self.optimizer = optimizer
         elif self.optimizer is None or self.optimizer == 'adam':
@@ -165,6 +164,11 @@ class CNNBase(NeuralNetMaster, ABC):
             raise RuntimeError('Only "regression", "classification" and "binary_classification" are supported')
 
         self.keras_model = self.model()
+        self.clear_inference_cache()
+
+        # uncompiled Keras model can still predict
+        if inference_only is True:
+            return None
 
         self.keras_model.compile(loss=loss_func, optimizer=self.optimizer, metrics=self.metrics, loss_weights=None)
 
@@ -189,12 +193,13 @@ class CNNBase(NeuralNetMaster, ABC):
         if self.keras_model is None:  # only compiler if there is no keras_model, e.g. fine-tuning does not required
             self.compile()
 
+        from sklearn.model_selection import train_test_split
         self.train_idx, self.val_idx = train_test_split(np.arange(self.num_train), test_size=self.val_size)
 
-        self.training_generator = CNNDataGenerator(self.batch_size).generate(norm_data[self.train_idx],
-                                                                             norm_labels[self.train_idx])
-        self.validation_generator = CNNDataGenerator(self.batch_size).generate(norm_data[self.val_idx],
-                                                                               norm_labels[self.val_idx])
+        self.training_generator = CNNDataGenerator(self.batch_size, **self._shuffle_config()).generate(
+            norm_data[self.train_idx], norm_labels[self.train_idx])
+        self.validation_generator = CNNDataGenerator(self.batch_size, **self._shuffle_config()).generate(
+            norm_data[self.val_idx], norm_labels[self.val_idx])
 
         return input_data, labels
 
@@ -226,9 +231,10 @@ class CNNBase(NeuralNetMaster, ABC):
                                                       validation_data=self.validation_generator,
                                                       validation_steps=self.num_train // self.batch_size,
                                                       epochs=self.max_epochs, verbose=self.verbose,
-                                                      workers=os.cpu_count(),
+                                                      workers=CONFIG.num_workers,
+                                                      max_queue_size=CONFIG.prefetch_depth,
                                                       callbacks=self.__callbacks,
-                                                      use_multiprocessing=MULTIPROCESS_FLAG)
+                                                      use_multiprocessing=CONFIG.multiprocessing_generator)
 
         print(f'Completed Training, {(time.time() - start_time):.{2}f}s in total')
 
@@ -255,53 +261,44 @@ class CNNBase(NeuralNetMaster, ABC):
                 'labels_std': self.labels_std.tolist(),
                 'valsize': self.val_size, 'targetname': self.targetname, 'dropout_rate': self.dropout_rate,
                 'l2': self.l2, 'input_norm_mode': self.input_norm_mode, 'labels_norm_mode': self.labels_norm_mode,
-                'batch_size': self.batch_size}
+                'batch_size': self.batch_size, 'inference_batch_size': self.inference_batch_size}
 
         with open(self.fullfilepath + '/astroNN_model_parameter.json', 'w') as f:
             json.dump(data, f, indent=4, sort_keys=True)
 
+    def _inference_model(self):
+        return self.serving_model(self.keras_model)
+
     def test(self, input_data):
         self.pre_testing_checklist_master()
 
         input_data = np.atleast_2d(input_data)
 
-        if self.input_normalizer is not None:
-            input_array = self.input_normalizer.normalize(input_data, calc=False)
-        else:
-            # Prevent shallow copy issue
-            input_array = np.array(input_data)
-            input_array -= self.input_mean
-            input_array /= self.input_std
+        # normalization and denormalization are done in the graph, so raw data can be fed directly
+        serving_model = self.serving_model(self.keras_model)
 
         total_test_num = input_data.shape[0]  # Number of testing data
 
         # for number of training data smaller than batch_size
-        if input_data.shape[0] < self.batch_size:
-            self.batch_size = input_data.shape[0]
+        batch_size = min(self._get_inference_batch_size(), input_data.shape[0])
 
         # Due to the nature of how generator works, no overlapped prediction
-        data_gen_shape = (total_test_num // self.batch_size) * self.batch_size
+        data_gen_shape = (total_test_num // batch_size) * batch_size
         remainder_shape = total_test_num - data_gen_shape  # Remainder from generator
 
         predictions = np.zeros((total_test_num, self.labels_shape))
 
         # Data Generator for prediction
-        prediction_generator = CNNPredDataGenerator(self.batch_size).generate(input_array[:data_gen_shape])
-        predictions[:data_gen_shape] = np.asarray(self.keras_model.predict_generator(
-            prediction_generator, steps=input_array.shape[0] // self.batch_size))
+        prediction_generator = CNNPredDataGenerator(batch_size).generate(input_data[:data_gen_shape])
+        predictions[:data_gen_shape] = np.asarray(serving_model.predict_generator(
+            prediction_generator, steps=input_data.shape[0] // batch_size))
 
         if remainder_shape != 0:
-            remainder_data = input_array[data_gen_shape:]
+            remainder_data = input_data[data_gen_shape:]
             # assume its caused by mono images, so need to expand dim by 1
-            if len(input_array[0].shape) != len(self.input_shape):
+            if len(input_data[0].shape) != len(self.input_shape):
                 remainder_data = np.expand_dims(remainder_data, axis=-1)
-            result = self.keras_model.predict(remainder_data)
+            result = serving_model.predict(remainder_data)
             predictions[data_gen_shape:] = result.reshape((remainder_shape, self.labels_shape))
 
-        if self.labels_normalizer is not None:
-            predictions = self.labels_normalizer.denormalize(predictions)
-        else:
-            predictions *= self.labels_std
-            predictions += self.labels_mean
-
         return predictions
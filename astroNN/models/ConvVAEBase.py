@@ -1,12 +1,10 @@
 import json
-import os
 from abc import ABC
 
 import numpy as np
-from sklearn.model_selection import train_test_split
 import time
 
-from astroNN.config import MULTIPROCESS_FLAG
+from astroNN.config import CONFIG
 from astroNN.config import keras_import_manager
 from astroNN.datasets import H5Loader
 from astroNN.models.NeuralNetMaster import NeuralNetMaster
@@ -33,8 +31,8 @@ class CVAEDataGenerator(GeneratorMaster):
         2017-Dec-02 - Written - Henry Leung (University of Toronto)
     """
 
-    def __init__(self, batch_size, shuffle=True):
-        super().__init__(batch_size, shuffle)
+    def __init__(self, batch_size, shuffle=True, chunk_size=None, buffer_size=16):
+        super().__init__(batch_size, shuffle, chunk_size, buffer_size)
 
     def _data_generation(self, inputs, recon_inputs, idx_list_temp):
         x = self.input_d_checking(inputs, idx_list_temp)
@@ -74,8 +72,8 @@ class CVAEPredDataGenerator(GeneratorMaster):
         2017-Dec-02 - Written - Henry Leung (University of Toronto)
     """
 
-    def __init__(self, batch_size, shuffle=False):
-        super().__init__(batch_size, shuffle)
+    def __init__(self, batch_size, shuffle=False, chunk_size=None, buffer_size=16):
+        super().__init__(batch_size, shuffle, chunk_size, buffer_size)
 
     def _data_generation(self, inputs, idx_list_temp):
         # Generate data
@@ -147,9 +145,14 @@ class ConvVAEBase(NeuralNetMaster, ABC):
         self.labels_mean = None
         self.labels_std = None
 
-    def compile(self, optimizer=None, loss=None, metrics=None, loss_weights=None, sample_weight_mode=None):
+    def compile(self, optimizer=None, loss=None, metrics=None, loss_weights=None, sample_weight_mode=None,
+                inference_only=False):
         self.keras_model, self.keras_encoder, self.keras_decoder = self.model()
 
+        # uncompiled Keras model can still predict
+        if inference_only is True:
+            return None
+
         if optimizer is not None:
             self.optimizer = optimizer
         elif self.optimizer is None or self.optimizer == 'adam':
@@ -189,12 +192,13 @@ class ConvVAEBase(NeuralNetMaster, ABC):
         if self.keras_model is None:  # only compiler if there is no keras_model, e.g. fine-tuning does not required
             self.compile()
 
+        from sklearn.model_selection import train_test_split
         self.train_idx, self.val_idx = train_test_split(np.arange(self.num_train), test_size=self.val_size)
 
-        self.training_generator = CVAEDataGenerator(self.batch_size).generate(norm_data[self.train_idx],
-                                                                              norm_labels[self.train_idx])
-        self.validation_generator = CVAEDataGenerator(self.batch_size).generate(norm_data[self.val_idx],
-                                                                                norm_labels[self.val_idx])
+        self.training_generator = CVAEDataGenerator(self.batch_size, **self._shuffle_config()).generate(
+            norm_data[self.train_idx], norm_labels[self.train_idx])
+        self.validation_generator = CVAEDataGenerator(self.batch_size, **self._shuffle_config()).generate(
+            norm_data[self.val_idx], norm_labels[self.val_idx])
 
         return input_data, input_recon_target
 
@@ -222,9 +226,10 @@ class ConvVAEBase(NeuralNetMaster, ABC):
                                        steps_per_epoch=self.num_train // self.batch_size,
                                        validation_data=self.validation_generator,
                                        validation_steps=self.val_num // self.batch_size,
-                                       epochs=self.max_epochs, verbose=self.verbose, workers=os.cpu_count(),
+                                       epochs=self.max_epochs, verbose=self.verbose, workers=CONFIG.num_workers,
+                                       max_queue_size=CONFIG.prefetch_depth,
                                        callbacks= self.__callbacks,
-                                       use_multiprocessing=MULTIPROCESS_FLAG)
+                                       use_multiprocessing=CONFIG.multiprocessing_generator)
 
         print(f'Completed Training, {(time.time() - start_time):.{2}f}s in total')
 
@@ -250,11 +255,16 @@ class ConvVAEBase(NeuralNetMaster, ABC):
                 'labels_std': self.labels_std.tolist(),
                 'valsize': self.val_size, 'targetname': self.targetname, 'dropout_rate': self.dropout_rate,
                 'l2': self.l2, 'input_norm_mode': self.input_norm_mode, 'labels_norm_mode': self.labels_norm_mode,
-                'batch_size': self.batch_size, 'latent': self.latent_dim}
+                'batch_size': self.batch_size, 'inference_batch_size': self.inference_batch_size,
+                'latent': self.latent_dim}
 
         with open(self.fullfilepath + '/astroNN_model_parameter.json', 'w') as f:
             json.dump(data, f, indent=4, sort_keys=True)
 
+    def _inference_model(self):
+        # keras_model has an extra noise input fed by a tensor which cannot be probed with synthetic inputs, so tune
+        # inference batch size with the encoder
+        return self.keras_encoder
 
     def test(self, input_data):
         self.pre_testing_checklist_master()
@@ -272,19 +282,18 @@ class ConvVAEBase(NeuralNetMaster, ABC):
         total_test_num = input_data.shape[0]  # Number of testing data
 
         # for number of training data smaller than batch_size
-        if input_data.shape[0] < self.batch_size:
-            self.batch_size = input_data.shape[0]
+        batch_size = min(self._get_inference_batch_size(), input_data.shape[0])
 
         # Due to the nature of how generator works, no overlapped prediction
-        data_gen_shape = (total_test_num // self.batch_size) * self.batch_size
+        data_gen_shape = (total_test_num // batch_size) * batch_size
         remainder_shape = total_test_num - data_gen_shape  # Remainder from generator
 
         predictions = np.zeros((total_test_num, self.labels_shape, 1))
 
         # Data Generator for prediction
-        prediction_generator = CVAEPredDataGenerator(self.batch_size).generate(input_array[:data_gen_shape])
+        prediction_generator = CVAEPredDataGenerator(batch_size).generate(input_array[:data_gen_shape])
         predictions[:data_gen_shape] = np.asarray(self.keras_model.predict_generator(
-            prediction_generator, steps=input_array.shape[0] // self.batch_size))
+            prediction_generator, steps=input_array.shape[0] // batch_size))
 
         if remainder_shape != 0:
             remainder_data = input_array[data_gen_shape:]
@@ -316,19 +325,18 @@ class ConvVAEBase(NeuralNetMaster, ABC):
         total_test_num = input_data.shape[0]  # Number of testing data
 
         # for number of training data smaller than batch_size
-        if input_data.shape[0] < self.batch_size:
-            self.batch_size = input_data.shape[0]
+        batch_size = min(self._get_inference_batch_size(), input_data.shape[0])
 
         # Due to the nature of how generator works, no overlapped prediction
-        data_gen_shape = (total_test_num // self.batch_size) * self.batch_size
+        data_gen_shape = (total_test_num // batch_size) * batch_size
         remainder_shape = total_test_num - data_gen_shape  # Remainder from generator
 
         encoding = np.zeros((total_test_num, self.latent_dim))
 
         # Data Generator for prediction
-        prediction_generator = CVAEPredDataGenerator(self.batch_size).generate(input_array[:data_gen_shape])
+        prediction_generator = CVAEPredDataGenerator(batch_size).generate(input_array[:data_gen_shape])
         encoding[:data_gen_shape] = np.asarray(self.keras_encoder.predict_generator(
-            prediction_generator, steps=input_array.shape[0] // self.batch_size))
+            prediction_generator, steps=input_array.shape[0] // batch_size))
 
         if remainder_shape != 0:
             remainder_data = input_array[data_gen_shape:]
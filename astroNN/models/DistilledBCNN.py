@@ -0,0 +1,128 @@
+# ---------------------------------------------------------#
+#   astroNN.models.DistilledBCNN: Contain distilled Bayesian CNN Model
+# ---------------------------------------------------------#
+import numpy as np
+
+from astroNN.config import keras_import_manager
+from astroNN.models.CNNBase import CNNBase
+
+keras = keras_import_manager()
+regularizers = keras.regularizers
+Conv1D, Conv2D, MaxPooling1D, MaxPooling2D = keras.layers.Conv1D, keras.layers.Conv2D, keras.layers.MaxPooling1D, \
+                                             keras.layers.MaxPooling2D
+Dense, Flatten, Activation, Input = keras.layers.Dense, keras.layers.Flatten, keras.layers.Activation, \
+                                    keras.layers.Input
+concatenate = keras.layers.concatenate
+Model = keras.models.Model
+
+
+class DistilledBCNN(CNNBase):
+    """
+    Compact deterministic student network distilled from a trained Bayesian neural net, the student reproduces the
+    Monte Carlo mean and variance of the teacher in a single forward pass
+
+    | The student has a mean head and a log-variance head for both model and predictive variance, so the output of
+    | test() has the same format as a Bayesian neural net
+    """
+
+    def __init__(self, lr=0.005):
+        super().__init__()
+
+        self.name = 'Distilled Bayesian Convolutional Neural Network'
+        self._implementation_version = '1.0'
+        self.initializer = 'he_normal'
+        self.activation = 'relu'
+        self.num_filters = [2, 4]
+        self.filter_len = 8
+        self.pool_length = 4
+        self.num_hidden = [128, 64]
+        self.max_epochs = 50
+        self.lr = lr
+        self.reduce_lr_epsilon = 0.00005
+
+        self.reduce_lr_min = 1e-8
+        self.reduce_lr_patience = 2
+        self.l2 = 1e-7
+
+        self.task = 'regression'
+
+    def model(self):
+        # labels_shape is 3 times of the number of teacher labels: mean, log model variance, log predictive variance
+        num_labels = self.labels_shape // 3
+
+        # spectra or images
+        if len(self.input_shape) == 2:
+            Conv, MaxPooling = Conv1D, MaxPooling1D
+        else:
+            Conv, MaxPooling = Conv2D, MaxPooling2D
+
+        input_tensor = Input(shape=self.input_shape, name='input')
+        cnn_layer_1 = Conv(kernel_initializer=self.initializer, padding="same", filters=self.num_filters[0],
+                           kernel_size=self.filter_len, kernel_regularizer=regularizers.l2(self.l2))(input_tensor)
+        activation_1 = Activation(activation=self.activation)(cnn_layer_1)
+        cnn_layer_2 = Conv(kernel_initializer=self.initializer, padding="same", filters=self.num_filters[1],
+                           kernel_size=self.filter_len, kernel_regularizer=regularizers.l2(self.l2))(activation_1)
+        activation_2 = Activation(activation=self.activation)(cnn_layer_2)
+        maxpool_1 = MaxPooling(pool_size=self.pool_length)(activation_2)
+        flattener = Flatten()(maxpool_1)
+        layer_3 = Dense(units=self.num_hidden[0], kernel_regularizer=regularizers.l2(self.l2),
+                        kernel_initializer=self.initializer)(flattener)
+        activation_3 = Activation(activation=self.activation)(layer_3)
+        layer_4 = Dense(units=self.num_hidden[1], kernel_regularizer=regularizers.l2(self.l2),
+                        kernel_initializer=self.initializer)(activation_3)
+        activation_4 = Activation(activation=self.activation)(layer_4)
+        mean_output = Dense(units=num_labels, activation='linear', name='mean_output')(activation_4)
+        log_variance_output = Dense(units=2 * num_labels, activation='linear',
+                                    name='log_variance_output')(activation_4)
+        output = Activation(activation=self._last_layer_activation,
+                            name='output')(concatenate([mean_output, log_variance_output]))
+
+        model = Model(inputs=input_tensor, outputs=output)
+
+        return model
+
+    def distill(self, teacher, input_data, inputs_err=None):
+        """
+        Generate Monte Carlo mean and variance targets with a trained Bayesian neural net and train the student on them
+
+        :param teacher: Trained astroNN Bayesian neural net
+        :type teacher: astroNN.models.BayesianCNNBase.BayesianCNNBase
+        :param input_data: Data to be distilled on
+        :type input_data: ndarray
+        :param inputs_err: Error for input_data (if any), same shape with input_data.
+        :type inputs_err: Union([NoneType, ndarray])
+        :return: None
+        :rtype: NoneType
+        """
+        if teacher.task != 'regression':
+            raise ValueError('Only Bayesian neural net for regression task can be distilled')
+
+        predictions, uncertainty = teacher.test(input_data, inputs_err)
+        # floor to prevent log of zero variance
+        model_log_var = 2 * np.log(np.maximum(uncertainty['model'], 1e-8))
+        predictive_log_var = 2 * np.log(np.maximum(uncertainty['predictive'], 1e-8))
+
+        self.targetname = teacher.targetname
+        self.input_norm_mode = teacher.input_norm_mode
+
+        self.train(input_data, np.column_stack([predictions, model_log_var, predictive_log_var]))
+
+        return None
+
+    def test(self, input_data):
+        """
+        Use the student to test in a single forward pass
+
+        :param input_data: Data to be inferred with neural network
+        :type input_data: ndarray
+        :return: prediction and prediction uncertainty
+        """
+        result = super().test(input_data)
+        num_labels = self.labels_shape // 3
+
+        predictions = result[:, :num_labels]
+        model_var = np.exp(result[:, num_labels:2 * num_labels])
+        predictive_var = np.exp(result[:, 2 * num_labels:])
+
+        return predictions, {'total': np.sqrt(model_var + predictive_var), 'model': np.sqrt(model_var),
+                             'predictive': np.sqrt(predictive_var)}
@@ -1,17 +1,19 @@
 ###############################################################################
 #   NeuralNetMaster.py: top-level class for a neural network
 ###############################################################################
+import json
 import os
 import sys
 import time
 from abc import ABC, abstractmethod
 
 import numpy as np
-import pylab as plt
 import tensorflow as tf
 
 import astroNN
 from astroNN.config import keras_import_manager, cpu_gpu_check
+from astroNN.nn.layers import NormalizeLayer, DenormalizeLayer, is_stochastic_layer
+from astroNN.nn.utilities.benchmark import inference_batch_size_benchmark
 from astroNN.shared.nn_tools import folder_runnum
 from astroNN.shared.custom_warnings import deprecated
 
@@ -35,6 +37,12 @@ class NeuralNetMaster(ABC):
     :ivar folder_name: Folder name to be saved
     :ivar fullfilepath: Full file path
     :ivar batch_size: Batch size for training, by default 64
+    :ivar inference_batch_size: Batch size for inference, by default None to use batch_size
+    :ivar shuffle: Shuffling of training data, True for fully random shuffling, 'chunk' for locality-aware shuffling
+                   of data on disk (e.g. h5 or memmap), False for no shuffling
+    :ivar shuffle_chunk_size: Number of contiguous data shuffled together as a block if shuffle='chunk', None to use
+                              batch_size
+    :ivar shuffle_buffer_size: Number of chunks mixed together in a shuffle buffer if shuffle='chunk'
     :ivar autosave: Boolean to flag whether autosave model or not
 
     :ivar task: Task
@@ -67,6 +75,10 @@ class NeuralNetMaster(ABC):
         self.folder_name = None
         self.fullfilepath = None
         self.batch_size = 64
+        self.inference_batch_size = None
+        self.shuffle = True
+        self.shuffle_chunk_size = None
+        self.shuffle_buffer_size = 16
         self.autosave = False
 
         # Hyperparameter
@@ -106,6 +118,11 @@ class NeuralNetMaster(ABC):
         self.input_shape = None
         self.labels_shape = None
 
+        # cache of models with normalization embedded, see serving_model()
+        self._serving_models = {}
+        # cache of jacobian graphs, see _jacobian_graph()
+        self._jacobian_graphs = {}
+
         self.num_train = None
         self.train_idx = None
         self.val_idx = None
@@ -236,7 +253,175 @@ class NeuralNetMaster(ABC):
             print('Skipped plot_model! graphviz and pydot_ng are required to plot the model architecture')
             pass
 
-    def jacobian(self, x=None, mean_output=False, batch_size=64, mc_num=1):
+    def _inference_model(self):
+        """
+        Keras model used for inference in test(), used by tune_inference_batch_size()
+
+        :return: Keras model
+        :rtype: keras.Model
+        """
+        return self.keras_model
+
+    def _shuffle_config(self):
+        """
+        Keyword arguments of shuffling for training data generators
+        """
+        return {'shuffle': self.shuffle, 'chunk_size': self.shuffle_chunk_size, 'buffer_size': self.shuffle_buffer_size}
+
+    def _get_inference_batch_size(self):
+        return self.batch_size if self.inference_batch_size is None else self.inference_batch_size
+
+    def tune_inference_batch_size(self, memory_budget=None, max_batch_size=4096, steps=3):
+        """
+        Find the throughput-optimal inference batch size under a memory budget by probing increasing batch sizes on
+        synthetic inputs. The result is used by test() and jacobian() and saved to the model folder (if any)
+
+        :param memory_budget: Memory budget in MB, None for no limit
+        :type memory_budget: Union[NoneType, float]
+        :param max_batch_size: Maximum batch size to be probed
+        :type max_batch_size: int
+        :param steps: Number of timed inference for each batch size
+        :type steps: int
+        :return: Inference batch size
+        :rtype: int
+        """
+        results = inference_batch_size_benchmark(self._inference_model(), memory_budget=memory_budget,
+                                                 max_batch_size=max_batch_size, steps=steps)
+        self.inference_batch_size = max(results, key=lambda r: r['data_per_sec'])['batch_size']
+        print(f'Selected inference batch size: {self.inference_batch_size}')
+
+        # persist the choice if the model is saved already
+        if self.fullfilepath is not None:
+            parameter_path = os.path.join(self.fullfilepath, 'astroNN_model_parameter.json')
+            if os.path.isfile(parameter_path):
+                with open(parameter_path) as f:
+                    parameter = json.load(f)
+                parameter['inference_batch_size'] = self.inference_batch_size
+                with open(parameter_path, 'w') as f:
+                    json.dump(parameter, f, indent=4, sort_keys=True)
+
+        return self.inference_batch_size
+
+    def clear_inference_cache(self):
+        """
+        Clear cached inference models, called automatically when Keras models are replaced by compile()
+
+        :return: None
+        :rtype: NoneType
+        """
+        self._serving_models = {}
+        self._jacobian_graphs = {}
+
+        return None
+
+    def serving_model(self, model=None, denormalize=True):
+        """
+        Get a Keras model with normalization embedded in the graph, so inference can be done on raw data in a single
+        graph call without normalizing in numpy
+
+        :param model: Keras model to be wrapped, by default keras_model
+        :type model: Union[NoneType, keras.Model]
+        :param denormalize: True to denormalize output in the graph too
+        :type denormalize: bool
+        :return: Keras model taking un-normalized input
+        :rtype: keras.Model
+        """
+        if model is None:
+            model = self.keras_model
+
+        key = (id(model), denormalize)
+        # rebuild if the underlying Keras model or normalization statistics have been replaced
+        if key not in self._serving_models or self._serving_models[key][0] is not model or \
+                not self._same_normalization(self._serving_models[key][1]):
+            new_input = keras.layers.Input(shape=model.input_shape[1:], name='input')
+            output = model(NormalizeLayer(self.input_mean, self.input_std, mode=self.input_norm_mode)(new_input))
+            if denormalize is True:
+                output = DenormalizeLayer(self.labels_mean, self.labels_std, mode=self.labels_norm_mode)(output)
+            self._serving_models[key] = (model, self._normalization_stats(),
+                                         keras.models.Model(inputs=new_input, outputs=output))
+
+        return self._serving_models[key][2]
+
+    def _normalization_stats(self):
+        """
+        Normalization statistics copied into inference graphs when they are built
+        """
+        return (self.input_mean, self.input_std, self.input_norm_mode, self.labels_mean, self.labels_std,
+                self.labels_norm_mode)
+
+    def _same_normalization(self, stats):
+        """
+        Whether normalization statistics used to build a cached graph are still the current ones, statistics can be
+        reassigned on a loaded model without compile()
+        """
+        return all(cached is current for cached, current in zip(stats, self._normalization_stats()))
+
+    def export_numpy(self, filename=None):
+        """
+        Export the prediction model with normalization to a compact .npz bundle, which can be run by
+        astroNN.nn.numpy_engine.NumpyModel with NumPy only without Tensorflow
+
+        :param filename: Path to the .npz file, None to save as astroNN_numpy_model.npz in the model folder
+        :type filename: Union[NoneType, str]
+        :return: Path to the .npz file
+        :rtype: str
+        """
+        from astroNN.nn.numpy_engine import SUPPORTED_LAYERS
+
+        if self._model_type not in ['CNN', 'BCNN']:
+            raise TypeError(f'Only convolutional neural net can be exported, but got {self._model_type}')
+
+        if filename is None:
+            if self.fullfilepath is None:
+                raise ValueError('Please save the model first or provide a filename')
+            filename = os.path.join(self.fullfilepath, 'astroNN_numpy_model.npz')
+
+        try:
+            model = self.keras_model_predict
+            model.get_layer("input")
+        except (AttributeError, ValueError):
+            model = self.keras_model
+
+        model_config = model.get_config()
+        if len(model_config['input_layers']) != 1 or len(model_config['output_layers']) != 1:
+            raise ValueError('Only model with single input and single output can be exported')
+
+        arrays, layers = {}, []
+        for layer_config in model_config['layers']:
+            layer = model.get_layer(layer_config['name'])
+            class_name = layer.__class__.__name__
+            if class_name not in SUPPORTED_LAYERS:
+                raise ValueError(f'Layer {class_name} is not supported by astroNN numpy engine, supported layers: '
+                                f'{SUPPORTED_LAYERS}')
+            config = dict(layer_config['config'])
+            if class_name == 'MCDropout':
+                if config.get('noise_shape') is not None:
+                    raise ValueError('MCDropout with noise_shape is not supported by astroNN numpy engine')
+                config['disable'] = layer.disable_layer
+            weights = layer.get_weights()
+            for i, weight in enumerate(weights):
+                arrays[f'{layer.name}/{i}'] = np.asarray(weight, dtype=np.float32)
+            inbound_nodes = layer_config['inbound_nodes']
+            layers.append({'name': layer.name, 'class_name': class_name, 'config': config,
+                           'inbound': [node[0] for node in inbound_nodes[0]] if len(inbound_nodes) > 0 else [],
+                           'num_weights': len(weights)})
+
+        bundle = {'name': self.name, 'id': self._model_identifier, 'model_type': self._model_type, 'task': self.task,
+                  'targetname': self.targetname, 'input_shape': list(self.input_shape),
+                  'labels_shape': self.labels_shape, 'input_norm_mode': self.input_norm_mode,
+                  'labels_norm_mode': self.labels_norm_mode, 'mc_num': getattr(self, 'mc_num', 1),
+                  'inference_batch_size': self._get_inference_batch_size(), 'layers': layers,
+                  'output_layer': model_config['output_layers'][0][0]}
+
+        np.savez(filename, config=np.array(json.dumps(bundle, default=lambda obj: obj.tolist())),
+                 input_mean=np.asarray(self.input_mean, dtype=np.float32),
+                 input_std=np.asarray(self.input_std, dtype=np.float32),
+                 labels_mean=np.asarray(self.labels_mean, dtype=np.float32),
+                 labels_std=np.asarray(self.labels_std, dtype=np.float32), **arrays)
+
+        return filename
+
+    def jacobian(self, x=None, mean_output=False, batch_size=None, mc_num=1, labels=None, pixel_mask=None):
         """
         Calculate jacobian of gradietn of output to input high performance calculation update on 15 April 2018
 
@@ -244,10 +429,15 @@ class NeuralNetMaster(ABC):
         :type x: ndarray
         :param mean_output: False to get all jacobian, True to get the mean
         :type mean_output: boolean
-        :param batch_size: Batch size used to calculate jacobian
-        :type batch_size: int
-        :param mc_num: Number of monte carlo integration
+        :param batch_size: Batch size used to calculate jacobian, None to use inference_batch_size (or batch_size if
+                           not tuned)
+        :type batch_size: Union[NoneType, int]
+        :param mc_num: Number of independent Monte Carlo dropout realizations to average, only used by stochastic model
         :type mc_num: int
+        :param labels: Indices or names (in targetname) of labels to calculate jacobian for, None for all labels
+        :type labels: Union[NoneType, list]
+        :param pixel_mask: Boolean mask or indices of spectra pixels to keep in jacobian, None for all pixels
+        :type pixel_mask: Union[NoneType, ndarray]
         :return: An array of Jacobian
         :rtype: ndarray
         :History:
@@ -257,78 +447,279 @@ class NeuralNetMaster(ABC):
         if x is None:
             raise ValueError('Please provide data to calculate the jacobian')
 
-        if mc_num < 1 or isinstance(mc_num, float):
-            raise ValueError('mc_num must be a positive integer')
+        start_time = time.time()
 
-        if batch_size < 1 or isinstance(batch_size, float):
-            raise ValueError('batch_size must be a positive integer')
+        jacobian = np.concatenate(list(self._jacobian_batches(np.array(x), batch_size, mc_num, labels=labels,
+                                                              pixel_mask=pixel_mask)), axis=0)
 
-        if self.input_normalizer is not None:
-            x_data = self.input_normalizer.normalize(x, calc=False)
+        if mean_output is True:
+            jacobian_master = np.mean(jacobian, axis=0)
         else:
-            # Prevent shallow copy issue
-            x_data = np.array(x)
-            x_data -= self.input_mean
-            x_data /= self.input_std
+            jacobian_master = np.array(jacobian)
+
+        print(f'Finished gradient calculation, {(time.time() - start_time):.{2}f} seconds elapsed')
+
+        return np.squeeze(jacobian_master)
+
+    def jacobian_stream(self, x, output, batch_size=None, mc_num=1, labels=None, pixel_mask=None):
+        """
+        Calculate jacobian batch by batch and write each batch to disk, so the full jacobian of a large sample is never
+        held in memory
+
+        :param x: Input Data, can be a ndarray, memmap or h5py dataset
+        :type x: Union[ndarray, h5py.Dataset]
+        :param output: Path to the output, a .npy file will be written as memmap, otherwise the jacobian will be
+                       written to the dataset "jacobian" of a h5 file chunked along the data point axis
+        :type output: str
+        :param batch_size: Batch size used to calculate jacobian, None to use inference_batch_size (or batch_size if
+                           not tuned)
+        :type batch_size: Union[NoneType, int]
+        :param mc_num: Number of independent Monte Carlo dropout realizations to average, only used by stochastic model
+        :type mc_num: int
+        :param labels: Indices or names (in targetname) of labels to calculate jacobian for, None for all labels
+        :type labels: Union[NoneType, list]
+        :param pixel_mask: Boolean mask or indices of spectra pixels to keep in jacobian, None for all pixels
+        :type pixel_mask: Union[NoneType, ndarray]
+        :return: Shape of the jacobian written
+        :rtype: tuple
+        :raises ValueError: If x has no data
+        """
+        import h5py
 
+        start_time = time.time()
+        total_num = x.shape[0]
+        if total_num == 0:
+            raise ValueError('x has no data to calculate jacobian for')
+
+        h5f, out = None, None
         try:
-            input_tens = self.keras_model_predict.get_layer("input").input
-            output_tens = self.keras_model_predict.get_layer("output").output
-            input_shape_expectation = self.keras_model_predict.get_layer("input").input_shape
-            output_shape_expectation = self.keras_model_predict.get_layer("output").output_shape
-        except AttributeError:
-            input_tens = self.keras_model.get_layer("input").input
-            output_tens = self.keras_model.get_layer("output").output
-            input_shape_expectation = self.keras_model.get_layer("input").input_shape
-            output_shape_expectation = self.keras_model.get_layer("output").output_shape
+            num_done = 0
+            for jacobian in self._jacobian_batches(x, batch_size, mc_num, labels=labels, pixel_mask=pixel_mask):
+                if out is None:
+                    shape = (total_num, *jacobian.shape[1:])
+                    if output.endswith('.npy'):
+                        out = np.lib.format.open_memmap(output, mode='w+', dtype=np.float32, shape=shape)
+                    else:
+                        h5f = h5py.File(output, 'w')
+                        out = h5f.create_dataset('jacobian', shape=shape, dtype=np.float32,
+                                                 chunks=(1, *jacobian.shape[1:]))
+                out[num_done:num_done + jacobian.shape[0]] = jacobian
+                num_done += jacobian.shape[0]
+            shape = out.shape
+        finally:
+            if h5f is not None:
+                h5f.close()
+            elif out is not None:
+                out.flush()
 
-        # just in case only 1 data point is provided and mess up the shape issue
-        if len(input_shape_expectation) == 3:
-            x_data = np.atleast_3d(x_data)
-        elif len(input_shape_expectation) == 4:
-            if len(x_data.shape) < 4:
-                x_data = x_data[:, :, :, np.newaxis]
-        else:
-            raise ValueError('Input data shape do not match neural network expectation')
+        print(f'Finished gradient calculation, {(time.time() - start_time):.{2}f} seconds elapsed')
+
+        return shape
 
-        total_num = x_data.shape[0]
-        # if batch_size > total_num, then we do all inputs at once
-        if total_num < batch_size:
-            batch_size = total_num
+    def jacobian_summary(self, x, batch_size=None, mc_num=1, labels=None, pixel_mask=None, percentiles=(16, 50, 84),
+                         reservoir_size=256, seed=None):
+        """
+        Calculate summary statistics of jacobian over a large sample without ever holding the full jacobian, mean and
+        standard derivation are exact while percentiles are estimated from a uniform random reservoir of jacobians
+
+        :param x: Input Data, can be a ndarray, memmap or h5py dataset
+        :type x: Union[ndarray, h5py.Dataset]
+        :param batch_size: Batch size used to calculate jacobian, None to use inference_batch_size (or batch_size if
+                           not tuned)
+        :type batch_size: Union[NoneType, int]
+        :param mc_num: Number of independent Monte Carlo dropout realizations to average, only used by stochastic model
+        :type mc_num: int
+        :param labels: Indices or names (in targetname) of labels to calculate jacobian for, None for all labels
+        :type labels: Union[NoneType, list]
+        :param pixel_mask: Boolean mask or indices of spectra pixels to keep in jacobian, None for all pixels
+        :type pixel_mask: Union[NoneType, ndarray]
+        :param percentiles: Percentiles to estimate, None to skip
+        :type percentiles: Union[NoneType, list, tuple]
+        :param reservoir_size: Number of jacobians kept in the reservoir, percentiles are exact if reservoir_size is not
+                               smaller than the number of data
+        :type reservoir_size: int
+        :param seed: Random seed of the reservoir sampling
+        :type seed: Union[NoneType, int]
+        :return: Dictionary of mean, std, percentiles (if any) and number of data
+        :rtype: dict
+        """
+        rng = np.random.RandomState(seed)
+        start_time = time.time()
 
-        grad_list = []
-        for j in range(self.labels_shape):
-            grad_list.append(tf.gradients(output_tens[:, j], input_tens))
+        count, mean, m2 = 0, None, None
+        reservoir = None
+        for jacobian in self._jacobian_batches(x, batch_size, mc_num, labels=labels, pixel_mask=pixel_mask):
+            jacobian = jacobian.astype(np.float64)
+            batch_count = jacobian.shape[0]
+            batch_mean = np.mean(jacobian, axis=0)
+            batch_m2 = np.sum(np.square(jacobian - batch_mean), axis=0)
+            if mean is None:
+                mean, m2 = batch_mean, batch_m2
+            else:
+                # merge with running statistics (Chan et al. parallel variant of Welford's algorithm)
+                delta = batch_mean - mean
+                mean = mean + delta * batch_count / (count + batch_count)
+                m2 = m2 + batch_m2 + np.square(delta) * count * batch_count / (count + batch_count)
+
+            if percentiles is not None:
+                if reservoir is None:
+                    reservoir = np.zeros((reservoir_size, *jacobian.shape[1:]), dtype=np.float32)
+                for i in range(batch_count):
+                    # reservoir sampling (Algorithm R)
+                    j = count + i if count + i < reservoir_size else rng.randint(0, count + i + 1)
+                    if j < reservoir_size:
+                        reservoir[j] = jacobian[i]
+            count += batch_count
+
+        summary = {'mean': np.squeeze(mean), 'std': np.squeeze(np.sqrt(m2 / count)), 'num': count}
+        if percentiles is not None:
+            summary['percentiles'] = np.percentile(reservoir[:min(count, reservoir_size)], percentiles, axis=0)
+            summary['percentiles'] = summary['percentiles'].reshape(len(percentiles), *summary['mean'].shape)
 
-        final_stack = tf.stack(tf.squeeze(grad_list))
+        print(f'Finished gradient calculation, {(time.time() - start_time):.{2}f} seconds elapsed')
 
-        # Looping variables for tensorflow setup
-        i = tf.constant(0)
-        mc_num_tf = tf.constant(mc_num)
-        #  To store final result
-        l = tf.TensorArray(dtype=tf.float32, infer_shape=False, size=1, dynamic_size=True)
+        return summary
 
-        def body(i, l):
-            l = l.write(i, final_stack)
-            return i + 1, l
+    def _jacobian_batches(self, x, batch_size, mc_num, labels=None, pixel_mask=None):
+        """
+        Yield jacobian batch by batch, only a batch of x is sliced into memory each time
+
+        :param x: Input Data, can be a ndarray, memmap or h5py dataset
+        :type x: Union[ndarray, h5py.Dataset]
+        :param batch_size: Batch size used to calculate jacobian, None to use inference_batch_size (or batch_size if
+                           not tuned)
+        :type batch_size: Union[NoneType, int]
+        :param mc_num: Number of independent Monte Carlo dropout realizations to average, only used by stochastic model
+        :type mc_num: int
+        :param labels: Indices or names (in targetname) of labels to calculate jacobian for, None for all labels
+        :type labels: Union[NoneType, list]
+        :param pixel_mask: Boolean mask or indices of spectra pixels to keep in jacobian, None for all pixels
+        :type pixel_mask: Union[NoneType, ndarray]
+        :return: Generator of jacobian of a batch
+        :rtype: generator
+        """
+        if mc_num < 1 or isinstance(mc_num, float):
+            raise ValueError('mc_num must be a positive integer')
 
-        tf_index, loop = tf.while_loop(lambda i, *_: tf.less(i, mc_num_tf), body, [i, l])
+        if batch_size is None:
+            batch_size = self._get_inference_batch_size()
 
-        loops = tf.cond(tf.greater(mc_num_tf, 1), lambda: tf.reduce_mean(loop.stack(), axis=0), lambda: loop.stack())
-        loops = tf.reshape(loops, shape=[tf.shape(input_tens)[0], *output_shape_expectation[1:], *input_shape_expectation[1:]])
-        start_time = time.time()
+        if batch_size < 1 or isinstance(batch_size, float):
+            raise ValueError('batch_size must be a positive integer')
 
-        jacobian = np.concatenate([get_session().run(loops, feed_dict={input_tens: x_data[i:i+batch_size]}) for i in
-                                   range(0, total_num, batch_size)], axis=0)
+        raw_input_tens, mc_num_tens, jacobian_tens, stochastic = self._jacobian_graph(
+            *self._jacobian_selection(labels, pixel_mask))
+        if stochastic is False:
+            mc_num = 1
+        input_shape_expectation = raw_input_tens.shape.as_list()
+        if len(input_shape_expectation) not in [3, 4]:
+            raise ValueError('Input data shape do not match neural network expectation')
 
-        if mean_output is True:
-            jacobian_master = np.mean(jacobian, axis=0)
-        else:
-            jacobian_master = np.array(jacobian)
+        # a single spectrum without data point axis
+        if len(input_shape_expectation) == 3 and len(x.shape) == 1:
+            x = np.asarray(x)[np.newaxis]
 
-        print(f'Finished gradient calculation, {(time.time() - start_time):.{2}f} seconds elapsed')
+        for i in range(0, x.shape[0], batch_size):
+            x_data = np.asarray(x[i:i + batch_size])
+            # just in case only 1 data point is provided and mess up the shape issue
+            if len(input_shape_expectation) == 3:
+                x_data = np.atleast_3d(x_data)
+            elif len(x_data.shape) < 4:
+                x_data = x_data[:, :, :, np.newaxis]
+            yield get_session().run(jacobian_tens, feed_dict={raw_input_tens: x_data, mc_num_tens: mc_num})
 
-        return np.squeeze(jacobian_master)
+    def _jacobian_selection(self, labels=None, pixel_mask=None):
+        """
+        Convert labels and pixel mask to tuples of indices which can be used as key of jacobian graph cache
+
+        :param labels: Indices or names (in targetname) of labels, None for all labels
+        :type labels: Union[NoneType, list]
+        :param pixel_mask: Boolean mask or indices of spectra pixels, None for all pixels
+        :type pixel_mask: Union[NoneType, ndarray]
+        :return: Tuple of label indices (or None) and tuple of pixel indices (or None)
+        :rtype: tuple
+        """
+        if labels is not None:
+            labels = tuple(self.targetname.index(label) if isinstance(label, str) else int(label) for label in labels)
+            if len(labels) == 0:
+                raise ValueError('Please select at least one label')
+
+        if pixel_mask is not None:
+            if len(self.input_shape) != 2:
+                raise ValueError('pixel_mask is only supported for spectra')
+            pixel_mask = np.asarray(pixel_mask)
+            if pixel_mask.dtype == bool:
+                if pixel_mask.shape[0] != self.input_shape[0]:
+                    raise ValueError(f'pixel_mask has {pixel_mask.shape[0]} pixels but neural network expects '
+                                     f'{self.input_shape[0]} pixels')
+                pixel_mask = np.nonzero(pixel_mask)[0]
+            pixel_mask = tuple(int(pixel) for pixel in pixel_mask)
+            if len(pixel_mask) == 0:
+                raise ValueError('Please select at least one pixel')
+
+        return labels, pixel_mask
+
+    def _jacobian_graph(self, labels=None, pixels=None):
+        """
+        Get the input placeholder, Monte Carlo number placeholder and output tensor of the jacobian graph, the graph is
+        built only once for each Keras model, labels and pixels so repeated calls of jacobian() do not keep adding ops
+        to the graph
+
+        :param labels: Tuple of indices of labels, None for all labels
+        :type labels: Union[NoneType, tuple]
+        :param pixels: Tuple of indices of spectra pixels, None for all pixels
+        :type pixels: Union[NoneType, tuple]
+
+        :return: Raw input placeholder, Monte Carlo number placeholder, jacobian tensor and whether the model is
+                 stochastic
+        :rtype: tuple
+        """
+        try:
+            model = self.keras_model_predict
+            model.get_layer("input")
+        except AttributeError:
+            model = self.keras_model
+
+        key = (id(model), tuple(model.get_layer("input").input_shape[1:]), labels, pixels)
+        if key in self._jacobian_graphs and self._jacobian_graphs[key][0] is model and \
+                self._same_normalization(self._jacobian_graphs[key][1]):
+            return self._jacobian_graphs[key][2]
+
+        input_tens = model.get_layer("input").input
+        output_tens = model.get_layer("output").output
+        input_shape_expectation = model.get_layer("input").input_shape
+        output_shape_expectation = model.get_layer("output").output_shape
+
+        # normalize raw input in the graph, jacobian is still taken with respect to the normalized input
+        raw_input_tens = keras.layers.Input(shape=input_shape_expectation[1:])
+        mc_num_tf = tf.placeholder_with_default(1, shape=())
+        # repeat the batch mc_num times so every copy gets its own dropout masks in a single graph call
+        repeated_input_tens = tf.tile(raw_input_tens, [mc_num_tf] + [1] * (len(input_shape_expectation) - 1))
+        norm_input_tens = NormalizeLayer(self.input_mean, self.input_std,
+                                         mode=self.input_norm_mode)(repeated_input_tens)
+        output_tens = keras.models.Model(inputs=input_tens, outputs=output_tens)(norm_input_tens)
+
+        # data points are independent so gradient of the sum over a batch is the gradient of each data point
+        # shape: (mc_num * batch, labels, *input_shape)
+        # only the selected labels need a backward pass
+        final_stack = tf.stack([tf.gradients(output_tens[:, j], norm_input_tens)[0] for j in
+                                (range(self.labels_shape) if labels is None else labels)], axis=1)
+        if pixels is not None:
+            final_stack = tf.gather(final_stack, list(pixels), axis=2)
+
+        # average over Monte Carlo realizations in the graph
+        batch_num = tf.shape(raw_input_tens)[0]
+        loops = tf.reduce_mean(tf.reshape(final_stack, tf.concat([[mc_num_tf, batch_num], tf.shape(final_stack)[1:]],
+                                                                 axis=0)), axis=0)
+        output_shape = output_shape_expectation[1:] if labels is None else [len(labels)]
+        input_shape = input_shape_expectation[1:] if pixels is None else [len(pixels), *input_shape_expectation[2:]]
+        loops = tf.reshape(loops, shape=[batch_num, *output_shape, *input_shape])
+
+        # Monte Carlo integration is meaningless for deterministic model
+        self._jacobian_graphs[key] = (model, self._normalization_stats(),
+                                      (raw_input_tens, mc_num_tf, loops, is_stochastic_layer(model)))
+
+        return self._jacobian_graphs[key][2]
 
     @deprecated
     def jacobian_old(self, x=None, mean_output=False):
@@ -416,6 +807,8 @@ class NeuralNetMaster(ABC):
         :return: A plot
         :History: 2018-May-12 - Written - Henry Leung (University of Toronto)
         """
+        import pylab as plt
+
         dense_list = []
         for counter, layer in enumerate(self.keras_model.layers):
             if isinstance(layer, keras.layers.Dense):
@@ -4,22 +4,16 @@ import os
 import h5py
 import numpy as np
 
-from astroNN.nn.losses import losses_lookup
-from astroNN.config import keras_import_manager, custom_model_path_reader
+from astroNN.config import custom_model_path_reader
 from astroNN.nn.utilities import Normalizer
-from astroNN.nn import nn_obj_lookup
-from astroNN.models.ApogeeBCNN import ApogeeBCNN
-from astroNN.models.ApogeeCNN import ApogeeCNN
-from astroNN.models.ApogeeCVAE import ApogeeCVAE
-from astroNN.models.Cifar10CNN import Cifar10CNN
-from astroNN.models.Galaxy10GAN import Galaxy10GAN
-from astroNN.models.GalaxyGAN2017 import GalaxyGAN2017
-from astroNN.models.MNIST_BCNN import MNIST_BCNN
-from astroNN.models.StarNet2017 import StarNet2017
+from astroNN.models.registry import register_model, registered_models, find_model, _REGISTRY
+from astroNN.shared.lazy_import import lazy_import
 
-keras = keras_import_manager()
-optimizers = keras.optimizers
-Sequential = keras.models.Sequential
+# models need Tensorflow and Keras, only import them when they are used
+lazy_import(__name__, {**{name: path for name, path in _REGISTRY.items() if name != 'Galaxy10CNN'},
+                       'ModelEnsemble': 'astroNN.models.ensemble.ModelEnsemble',
+                       'InferenceServer': 'astroNN.models.server.InferenceServer',
+                       'ModelPool': 'astroNN.models.pool.ModelPool'})
 
 
 def Galaxy10CNN():
@@ -36,6 +30,7 @@ def Galaxy10CNN():
         2018-Apr-02 - Update - Henry Leung (University of Toronto)
     """
     from astroNN.datasets.galaxy10 import galaxy10cls_lookup
+    from astroNN.models.Cifar10CNN import Cifar10CNN
     galaxy10_net = Cifar10CNN()
     galaxy10_net._model_identifier = 'Galaxy10CNN'
     targetname = []
@@ -47,7 +42,8 @@ def Galaxy10CNN():
 
 
 __all__ = ['ApogeeBCNN', 'ApogeeCNN', 'ApogeeCVAE', 'StarNet2017', 'GalaxyGAN2017', 'Cifar10CNN', 'MNIST_BCNN',
-           'Galaxy10GAN', 'Galaxy10CNN']
+           'Galaxy10GAN', 'Galaxy10CNN', 'DistilledBCNN', 'ModelEnsemble',
+           'InferenceServer', 'ModelPool', 'register_model', 'registered_models']
 
 
 def convert_custom_objects(obj):
@@ -76,7 +72,7 @@ def convert_custom_objects(obj):
     return obj
 
 
-def load_folder(folder=None):
+def load_folder(folder=None, inference_only=False, cache=False):
     """
     NAME:
         load_folder
@@ -84,10 +80,18 @@ def load_folder(folder=None):
         load astroNN model object from folder
     INPUT:
         folder (string): Name of folder, or can be None
+        inference_only (boolean): True to only build the graph for inference and load layer weights, optimizer and
+                                  training function are skipped for fast loading. The model cannot be trained
+        cache (boolean): True to get the model from the process-wide ModelPool, loading the same folder again returns
+                         the loaded model unless the folder is modified
     OUTPUT:
     HISTORY:
         2017-Dec-29 - Written - Henry Leung (University of Toronto)
     """
+    if cache is True:
+        from astroNN.models.pool import default_pool
+        return default_pool().load_folder(os.getcwd() if folder is None else folder, inference_only=inference_only)
+
     currentdir = os.getcwd()
 
     if folder is not None:
@@ -95,8 +99,6 @@ def load_folder(folder=None):
     else:
         fullfilepath = currentdir
 
-    astronn_model_obj = None
-
     if folder is not None and os.path.isfile(os.path.join(folder, 'astroNN_model_parameter.json')) is True:
         with open(os.path.join(folder, 'astroNN_model_parameter.json')) as f:
             parameter = json.load(f)
@@ -112,49 +114,10 @@ def load_folder(folder=None):
 
     identifier = parameter['id']
 
-    if identifier == 'ApogeeCNN':
-        astronn_model_obj = ApogeeCNN()
-    elif identifier == 'ApogeeBCNN':
-        astronn_model_obj = ApogeeBCNN()
-    elif identifier == 'ApogeeCVAE':
-        astronn_model_obj = ApogeeCVAE()
-    elif identifier == 'Cifar10CNN':
-        astronn_model_obj = Cifar10CNN()
-    elif identifier == 'MNIST_BCNN':
-        astronn_model_obj = MNIST_BCNN()
-    elif identifier == 'Galaxy10CNN':
-        astronn_model_obj = Galaxy10CNN()
-    elif identifier == 'StarNet2017':
-        astronn_model_obj = StarNet2017()
-    elif identifier == 'GalaxyGAN2017':
-        astronn_model_obj = GalaxyGAN2017()
-    elif identifier == 'Galaxy10GAN':
-        astronn_model_obj = Galaxy10GAN()
-    else:
-        unknown_model_message = f'Unknown model identifier -> {identifier}!'
-        # try to load custom model from CUSTOM_MODEL_PATH
-        CUSTOM_MODEL_PATH = custom_model_path_reader()
-        # try the current folder and see if there is any .py on top of CUSTOM_MODEL_PATH
-        list_py_files = [os.path.join(fullfilepath, f) for f in os.listdir(fullfilepath) if f.endswith(".py")]
-        if CUSTOM_MODEL_PATH is None and list_py_files is None:
-            print("\n")
-            raise TypeError(unknown_model_message)
-        else:
-            import sys
-            from importlib import import_module
-            for path_list in (path_list for path_list in [CUSTOM_MODEL_PATH, list_py_files] if path_list is not None):
-                for path in path_list:
-                    head, tail = os.path.split(path)
-                    sys.path.insert(0, head)
-                    try:
-                        model = getattr(import_module(tail.strip('.py')), str(identifier))
-                        astronn_model_obj = model()
-                    except AttributeError:
-                        pass
-
-        if astronn_model_obj is None:
-            print("\n")
-            raise TypeError(unknown_model_message)
+    # python files in the model folder and CUSTOM_MODEL_PATH are only searched if the model is not registered
+    search_paths = [os.path.join(fullfilepath, f) for f in sorted(os.listdir(fullfilepath)) if f.endswith(".py")]
+    search_paths += custom_model_path_reader() or []
+    astronn_model_obj = find_model(identifier, search_paths=search_paths)()
 
     astronn_model_obj.currentdir = currentdir
     astronn_model_obj.fullfilepath = fullfilepath
@@ -222,6 +185,25 @@ def load_folder(folder=None):
         astronn_model_obj.l2 = parameter['l2']
     except KeyError:
         pass
+    try:
+        astronn_model_obj.inference_batch_size = parameter['inference_batch_size']
+    except KeyError:
+        pass
+    if inference_only is True:
+        # only layer weights are needed for inference
+        astronn_model_obj.compile(inference_only=True)
+        astronn_model_obj.keras_model.load_weights(os.path.join(astronn_model_obj.fullfilepath, 'model_weights.h5'))
+        print("========================================================")
+        print(f"Loaded astroNN model for inference only, model type: {astronn_model_obj.name} -> {identifier}")
+        print("========================================================")
+        return astronn_model_obj
+
+    from astroNN.config import keras_import_manager
+    from astroNN.nn.losses import losses_lookup
+    keras = keras_import_manager()
+    optimizers = keras.optimizers
+    Sequential = keras.models.Sequential
+
     with h5py.File(os.path.join(astronn_model_obj.fullfilepath, 'model_weights.h5'), mode='r') as f:
         training_config = f.attrs.get('training_config')
         training_config = json.loads(training_config.decode('utf-8'))
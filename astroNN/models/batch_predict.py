@@ -0,0 +1,111 @@
+###############################################################################
+#   batch_predict.py: resumable batch inference over compiled h5 files
+###############################################################################
+import argparse
+import os
+import time
+
+import h5py
+import numpy as np
+
+from astroNN.config import MAGIC_NUMBER
+
+
+def batch_predict(model, input_h5, output_h5, chunk_size=4096, use_err=True):
+    """
+    Run inference of an astroNN model over every spectrum in a h5 file compiled by H5Compiler chunk by chunk, results
+    are written to output h5 aligned to the row of input h5 together with its ``index`` dataset. Progress is
+    checkpointed after every chunk so a killed job resumes at the last completed chunk when called again
+
+    | Datasets in output h5: index, prediction and uncertainty_total, uncertainty_model, uncertainty_predictive
+    | for Bayesian neural net. Rows not inferred yet are filled with magic number
+
+    :param model: astroNN model or folder name of astroNN model
+    :type model: Union[str, astroNN.models.NeuralNetMaster.NeuralNetMaster]
+    :param input_h5: Path to the h5 file compiled by H5Compiler
+    :type input_h5: str
+    :param output_h5: Path to the output h5 file
+    :type output_h5: str
+    :param chunk_size: Number of spectra in each chunk, must be the same when resuming
+    :type chunk_size: int
+    :param use_err: Whether to use spectra_err for Bayesian neural net
+    :type use_err: bool
+    :return: Number of spectra inferred in this call
+    :rtype: int
+    """
+    if isinstance(model, str):
+        from astroNN.models import load_folder
+        model = load_folder(model, inference_only=True)
+
+    start_time = time.time()
+    num_inferred = 0
+
+    with h5py.File(input_h5, 'r') as F, h5py.File(output_h5, 'a') as h5f:
+        num_data = F['spectra'].shape[0]
+        if 'num_completed' in h5f.attrs:
+            if h5f.attrs['num_data'] != num_data or h5f.attrs['chunk_size'] != chunk_size:
+                raise ValueError(f'{output_h5} was created with {h5f.attrs["num_data"]} spectra and chunk_size='
+                                 f'{h5f.attrs["chunk_size"]}, cannot resume with {num_data} spectra and '
+                                 f'chunk_size={chunk_size}')
+            print(f'Resuming from {h5f.attrs["num_completed"]} of {num_data} spectra')
+        else:
+            h5f.attrs['num_data'] = num_data
+            h5f.attrs['chunk_size'] = chunk_size
+            h5f.attrs['num_completed'] = 0
+            h5f.attrs['input_h5'] = os.path.abspath(input_h5)
+            if 'index' in F:
+                h5f.create_dataset('index', data=F['index'][()])
+
+        with_err = use_err and hasattr(model, 'mc_num') and 'spectra_err' in F
+
+        for start in range(int(h5f.attrs['num_completed']), num_data, chunk_size):
+            end = min(start + chunk_size, num_data)
+            x = np.asarray(F['spectra'][start:end])
+            result = model.test(x, np.asarray(F['spectra_err'][start:end])) if with_err else model.test(x)
+
+            if isinstance(result, tuple):
+                predictions, uncertainty = result
+                outputs = [('prediction', predictions)] + [(f'uncertainty_{name}', uncertainty[name]) for name in
+                                                           ['total', 'model', 'predictive']]
+            else:
+                outputs = [('prediction', np.asarray(result).reshape(end - start, -1))]
+
+            for name, value in outputs:
+                if name not in h5f:
+                    h5f.create_dataset(name, shape=(num_data, *value.shape[1:]), dtype=np.float32,
+                                       fillvalue=MAGIC_NUMBER, chunks=True)
+                h5f[name][start:end] = value
+            # data must be written before the checkpoint so a killed job only redoes the last chunk
+            h5f.flush()
+            h5f.attrs['num_completed'] = end
+            h5f.flush()
+
+            num_inferred += end - start
+            print(f'Inferred {end} of {num_data} spectra, {(time.time() - start_time):.{2}f}s elapsed')
+
+        if hasattr(model, 'targetname'):
+            h5f.attrs['targetname'] = np.array(model.targetname, dtype='S')
+
+    return num_inferred
+
+
+def main(args=None):
+    """
+    Entry point of astronn-predict command line tool, run ``astronn-predict -h`` for usage
+    """
+    parser = argparse.ArgumentParser(description='Resumable batch inference of astroNN model over a h5 file compiled '
+                                                 'by H5Compiler, run again with the same arguments to resume')
+    parser.add_argument('model_folder', help='astroNN model folder')
+    parser.add_argument('input_h5', help='h5 file compiled by H5Compiler')
+    parser.add_argument('output_h5', help='output h5 file')
+    parser.add_argument('--chunk-size', type=int, default=4096, help='number of spectra in each chunk')
+    parser.add_argument('--no-err', action='store_true', help='do not use spectra_err for Bayesian neural net')
+    parser.add_argument('--mc-num', type=int, default=None, help='number of Monte Carlo forward passes')
+    args = parser.parse_args(args)
+
+    from astroNN.models import load_folder
+    model = load_folder(args.model_folder, inference_only=True)
+    if args.mc_num is not None:
+        model.mc_num = args.mc_num
+
+    batch_predict(model, args.input_h5, args.output_h5, chunk_size=args.chunk_size, use_err=not args.no_err)
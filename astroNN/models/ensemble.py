@@ -0,0 +1,173 @@
+###############################################################################
+#   ensemble.py: parallel inference of an ensemble of astroNN models
+###############################################################################
+import multiprocessing
+import os
+import tempfile
+import traceback
+
+import numpy as np
+
+
+def _prediction_moments(result, num_data):
+    """
+    Convert result of astroNN test() to prediction, model variance and predictive variance
+    """
+    if isinstance(result, tuple):
+        predictions, uncertainty = result
+        return predictions, np.square(uncertainty['model']), np.square(uncertainty['predictive'])
+    else:
+        # deterministic neural net has no uncertainty
+        predictions = np.asarray(result).reshape(num_data, -1)
+        return predictions, np.zeros_like(predictions), np.zeros_like(predictions)
+
+
+def _ensemble_worker(index, folder, task_queue, result_queue):
+    """
+    Load a model folder once and keep it warm to run test() on chunks of shared input until receiving None, results
+    are tagged with the worker index as the same folder can be in an ensemble more than once
+    """
+    try:
+        from astroNN.models import load_folder
+        model = load_folder(folder, inference_only=True)
+        result_queue.put((index, 'ready', None))
+    except Exception:
+        result_queue.put((index, 'error', traceback.format_exc()))
+        return
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        chunk_id, x_path, err_path, start, end = task
+        try:
+            x = np.array(np.load(x_path, mmap_mode='r')[start:end])
+            if err_path is not None and hasattr(model, 'mc_num'):
+                result = model.test(x, np.array(np.load(err_path, mmap_mode='r')[start:end]))
+            else:
+                result = model.test(x)
+            result_queue.put((index, chunk_id, _prediction_moments(result, end - start)))
+        except Exception:
+            result_queue.put((index, 'error', traceback.format_exc()))
+
+
+class ModelEnsemble(object):
+    """
+    Run inference of multiple astroNN model folders concurrently, one process per model so that each model has its
+    own Tensorflow graph and session. Models are loaded once and kept warm until close() is called
+
+    | The results are combined with law of total variance, the total variance is the sum of the average model variance,
+    | the average predictive variance and the variance of predictions between models (ensemble)
+
+    :param folders: List of astroNN model folders
+    :type folders: list
+    """
+    def __init__(self, folders):
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self._processes = []
+        self._task_queues = []
+        self._result_queue = None
+
+    def start(self):
+        """
+        Start a process for each model and wait until every model is loaded
+
+        :return: None
+        :rtype: NoneType
+        """
+        # fork is not safe with Tensorflow
+        ctx = multiprocessing.get_context('spawn')
+        self._result_queue = ctx.Queue()
+        for index, folder in enumerate(self.folders):
+            task_queue = ctx.Queue()
+            process = ctx.Process(target=_ensemble_worker, args=(index, folder, task_queue, self._result_queue),
+                                  daemon=True)
+            process.start()
+            self._task_queues.append(task_queue)
+            self._processes.append(process)
+
+        for _ in self.folders:
+            index, status, message = self._result_queue.get()
+            if status == 'error':
+                self.close()
+                raise RuntimeError(f'Failed to load {self.folders[index]}:\n{message}')
+
+        return None
+
+    def close(self):
+        """
+        Stop all model processes
+
+        :return: None
+        :rtype: NoneType
+        """
+        for task_queue in self._task_queues:
+            task_queue.put(None)
+        for process in self._processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        self._processes, self._task_queues = [], []
+
+        return None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def test(self, input_data, inputs_err=None, chunk_size=4096):
+        """
+        Run inference of every model on the same data and combine the results
+
+        :param input_data: Data to be inferred with neural network
+        :type input_data: ndarray
+        :param inputs_err: Error for input_data, same shape with input_data. Only used by Bayesian neural net
+        :type inputs_err: Union([NoneType, ndarray])
+        :param chunk_size: Number of data in each chunk sent to models
+        :type chunk_size: int
+        :return: prediction and prediction uncertainty (total, model, predictive and ensemble)
+        """
+        if len(self._processes) == 0:
+            self.start()
+
+        input_data = np.atleast_2d(input_data)
+        num_data = input_data.shape[0]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # write raw input once to disk, every model memory-maps the same file instead of receiving a copy
+            x_path = os.path.join(tmp_dir, 'x.npy')
+            np.save(x_path, input_data)
+            err_path = None
+            if inputs_err is not None:
+                err_path = os.path.join(tmp_dir, 'x_err.npy')
+                np.save(err_path, np.atleast_2d(inputs_err))
+
+            chunks = [(i, min(i + chunk_size, num_data)) for i in range(0, num_data, chunk_size)]
+            for task_queue in self._task_queues:
+                for chunk_id, (start, end) in enumerate(chunks):
+                    task_queue.put((chunk_id, x_path, err_path, start, end))
+
+            results = [[None] * len(chunks) for _ in self.folders]
+            for _ in range(len(self.folders) * len(chunks)):
+                index, chunk_id, moments = self._result_queue.get()
+                if chunk_id == 'error':
+                    self.close()
+                    raise RuntimeError(f'Inference failed for {self.folders[index]}:\n{moments}')
+                results[index][chunk_id] = moments
+
+        # shape: (number of models, number of data, number of labels)
+        predictions, model_var, predictive_var = [np.stack([np.concatenate([r[i] for r in model_results])
+                                                            for model_results in results]) for i in range(3)]
+
+        # law of total variance
+        ensemble_var = np.var(predictions, axis=0)
+        model_var = np.mean(model_var, axis=0)
+        predictive_var = np.mean(predictive_var, axis=0)
+        total_var = ensemble_var + model_var + predictive_var
+
+        return np.mean(predictions, axis=0), {'total': np.sqrt(total_var), 'model': np.sqrt(model_var),
+                                              'predictive': np.sqrt(predictive_var),
+                                              'ensemble': np.sqrt(ensemble_var)}
@@ -0,0 +1,202 @@
+###############################################################################
+#   pool.py: LRU pool of loaded astroNN models
+###############################################################################
+import functools
+import os
+import threading
+from collections import OrderedDict
+
+from astroNN.config import CONFIG
+
+
+class PooledModel(object):
+    """
+    An astroNN model loaded by ModelPool in its own Tensorflow graph and session. Attributes are forwarded to the model
+    and methods are called with the graph and session of the model, so it can be used like the model itself
+
+    :ivar model: The astroNN model
+    :ivar graph: Tensorflow graph of the model
+    :ivar session: Tensorflow session of the model
+    """
+    def __init__(self, model, graph, session):
+        self.__dict__.update(model=model, graph=graph, session=session)
+
+    def as_default(self):
+        """
+        Context manager to use the graph and session of the model, e.g. to use keras_model directly
+
+        :return: Context manager
+        """
+        if self.model is None:
+            raise RuntimeError('This model has been evicted from ModelPool, please load it again')
+        return _ModelContext(self.graph, self.session)
+
+    def __getattr__(self, name):
+        if self.model is None:
+            raise RuntimeError('This model has been evicted from ModelPool, please load it again')
+        attr = getattr(self.model, name)
+        if not callable(attr):
+            return attr
+
+        @functools.wraps(attr)
+        def call(*args, **kwargs):
+            with self.as_default():
+                return attr(*args, **kwargs)
+
+        return call
+
+    def __setattr__(self, name, value):
+        if self.model is None:
+            raise RuntimeError('This model has been evicted from ModelPool, please load it again')
+        setattr(self.model, name, value)
+
+    def _close(self):
+        self.session.close()
+        self.__dict__.update(model=None, graph=None, session=None)
+
+
+class _ModelContext(object):
+    def __init__(self, graph, session):
+        self._graph_context = graph.as_default()
+        self._session_context = session.as_default()
+
+    def __enter__(self):
+        self._graph_context.__enter__()
+        self._session_context.__enter__()
+        return self
+
+    def __exit__(self, *args):
+        self._session_context.__exit__(*args)
+        self._graph_context.__exit__(*args)
+
+
+class ModelPool(object):
+    """
+    Least recently used (LRU) pool of loaded astroNN models, so loading the same folder again returns the loaded model
+    without parsing parameters, building the graph and loading weights again. Every model has its own Tensorflow graph
+    and session which are closed when the model is evicted to free memory
+
+    | A folder is loaded again if its model_weights.h5 or astroNN_model_parameter.json has been modified
+
+    :param max_models: Maximum number of models kept loaded, by default model_pool_size in astroNN configuration
+    :type max_models: Union[NoneType, int]
+    """
+    def __init__(self, max_models=None):
+        self.max_models = CONFIG.model_pool_size if max_models is None else max_models
+        self._models = OrderedDict()
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(folder, inference_only):
+        fullfilepath = os.path.abspath(folder)
+        # file modification time and size to detect a folder being overwritten by a new model
+        stats = [(stat.st_mtime_ns, stat.st_size) for stat in
+                 (os.stat(os.path.join(fullfilepath, filename)) for filename in
+                  ['model_weights.h5', 'astroNN_model_parameter.json'])]
+        return fullfilepath, tuple(stats), inference_only
+
+    def load_folder(self, folder, inference_only=True):
+        """
+        Load astroNN model folder or get it from the pool if it is already loaded
+
+        :param folder: Name of folder
+        :type folder: str
+        :param inference_only: True to only build the graph for inference, see astroNN.models.load_folder
+        :type inference_only: bool
+        :return: Loaded model
+        :rtype: PooledModel
+        """
+        key = self._key(folder, inference_only)
+        with self._lock:
+            if key in self._models:
+                self.hits += 1
+                self._models.move_to_end(key)
+                return self._models[key]
+            self.misses += 1
+
+            import tensorflow as tf
+            from astroNN.config import cpu_gpu_reader
+            from astroNN.models import load_folder
+            from astroNN.shared.nn_tools import session_config
+
+            fallback_cpu, limit_gpu_mem = cpu_gpu_reader()
+            if limit_gpu_mem is True:
+                config = session_config()
+            elif isinstance(limit_gpu_mem, float):
+                config = session_config(ratio=limit_gpu_mem)
+            else:
+                config = None
+            graph = tf.Graph()
+            session = tf.Session(graph=graph, config=config)
+            try:
+                with _ModelContext(graph, session):
+                    model = load_folder(folder, inference_only=inference_only)
+            except Exception:
+                session.close()
+                raise
+
+            # folder of the same path but with different files is outdated
+            for outdated_key in [k for k in self._models if k[0] == key[0] and k[1] != key[1]]:
+                self._evict(outdated_key)
+            self._models[key] = PooledModel(model, graph, session)
+            while len(self._models) > max(self.max_models, 1):
+                self._evict(next(iter(self._models)))
+
+            return self._models[key]
+
+    def _evict(self, key):
+        pooled_model = self._models.pop(key)
+        graph = pooled_model.graph
+        pooled_model._close()
+
+        # Keras keeps per-graph states which would keep the graph alive
+        from astroNN.config import keras_import_manager
+        backend = keras_import_manager().backend
+        for name in ['_GRAPH_LEARNING_PHASES', '_GRAPH_UID_DICTS']:
+            getattr(backend, name, {}).pop(graph, None)
+
+    def evict(self, folder=None):
+        """
+        Evict models of a folder (or all models) from the pool, their Tensorflow sessions are closed to free memory
+
+        :param folder: Name of folder, None to evict all models
+        :type folder: Union[NoneType, str]
+        :return: Number of models evicted
+        :rtype: int
+        """
+        with self._lock:
+            keys = [key for key in self._models if folder is None or key[0] == os.path.abspath(folder)]
+            for key in keys:
+                self._evict(key)
+
+        return len(keys)
+
+    def __len__(self):
+        return len(self._models)
+
+    def __contains__(self, folder):
+        return any(key[0] == os.path.abspath(folder) for key in self._models)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.evict()
+
+
+_DEFAULT_POOL = None
+
+
+def default_pool():
+    """
+    Get the process-wide model pool used by load_folder(..., cache=True)
+
+    :return: Model pool
+    :rtype: ModelPool
+    """
+    global _DEFAULT_POOL
+    if _DEFAULT_POOL is None:
+        _DEFAULT_POOL = ModelPool()
+    return _DEFAULT_POOL
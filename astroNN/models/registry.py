@@ -0,0 +1,214 @@
+###############################################################################
+#   registry.py: registry of astroNN models used by load_folder
+###############################################################################
+import ast
+import hashlib
+import importlib
+import importlib.util
+import json
+import os
+import sys
+
+from astroNN.config import CONFIG
+
+# entry point group for packages to provide astroNN models, e.g. in setup.py
+# entry_points={'astroNN.models': ['MyModel = my_package.my_models:MyModel']}
+ENTRY_POINT_GROUP = 'astroNN.models'
+
+# identifier -> model class (or a function returning model), built-in models are full path to be imported when needed
+_REGISTRY = {'ApogeeBCNN': 'astroNN.models.ApogeeBCNN.ApogeeBCNN',
+             'ApogeeCNN': 'astroNN.models.ApogeeCNN.ApogeeCNN',
+             'ApogeeCVAE': 'astroNN.models.ApogeeCVAE.ApogeeCVAE',
+             'Cifar10CNN': 'astroNN.models.Cifar10CNN.Cifar10CNN',
+             'DistilledBCNN': 'astroNN.models.DistilledBCNN.DistilledBCNN',
+             'Galaxy10CNN': 'astroNN.models.Galaxy10CNN',
+             'Galaxy10GAN': 'astroNN.models.Galaxy10GAN.Galaxy10GAN',
+             'GalaxyGAN2017': 'astroNN.models.GalaxyGAN2017.GalaxyGAN2017',
+             'MNIST_BCNN': 'astroNN.models.MNIST_BCNN.MNIST_BCNN',
+             'StarNet2017': 'astroNN.models.StarNet2017.StarNet2017'}
+
+_ENTRY_POINTS = None
+# bump when _top_level_names changes so cached names found by older versions are discarded
+_DISCOVERY_VERSION = 2
+
+
+def register_model(model=None, identifier=None):
+    """
+    Register a model class so load_folder can load folders of it without searching custom model paths, can be used as
+    a decorator with or without identifier
+
+    | @register_model
+    | class MyModel(CNNBase):
+    |     ...
+
+    :param model: Model class (or a function returning model), or identifier when used as @register_model('MyModel')
+    :type model: Union[NoneType, str, type, callable]
+    :param identifier: Identifier saved in astroNN_model_parameter.json, by default the class name
+    :type identifier: Union[NoneType, str]
+    :return: The model itself (or a decorator if model is None)
+    """
+    if isinstance(model, str):
+        # used as @register_model('identifier')
+        model, identifier = None, model
+    if model is None:
+        return lambda model: register_model(model, identifier=identifier)
+    _REGISTRY[model.__name__ if identifier is None else identifier] = model
+    return model
+
+
+def registered_models():
+    """
+    Get identifiers of all registered models, including models provided by installed packages with entry points
+
+    :return: Sorted list of identifiers
+    :rtype: list
+    """
+    return sorted(set(_REGISTRY) | set(_entry_points()))
+
+
+def _resolve(path):
+    module_name, attr_name = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), attr_name)
+
+
+def _entry_points():
+    """
+    Entry points of astroNN models from installed packages, scanned once per process
+    """
+    global _ENTRY_POINTS
+    if _ENTRY_POINTS is None:
+        try:
+            from importlib.metadata import entry_points
+            eps = entry_points()
+            eps = eps.select(group=ENTRY_POINT_GROUP) if hasattr(eps, 'select') else eps.get(ENTRY_POINT_GROUP, [])
+        except ImportError:  # Python < 3.8
+            from pkg_resources import iter_entry_points
+            eps = iter_entry_points(ENTRY_POINT_GROUP)
+        _ENTRY_POINTS = {ep.name: ep for ep in eps}
+    return _ENTRY_POINTS
+
+
+def _discovery_cache_path():
+    return os.path.join(CONFIG.cache_dir, 'custom_models_cache.json')
+
+
+def _top_level_names(path):
+    """
+    Names of classes, functions, variables and imported names defined at top level of a python file, found without
+    importing it. '*' is included if the file has a star import so any identifier might be defined in it
+    """
+    with open(path, 'rb') as f:
+        tree = ast.parse(f.read(), filename=path)
+    names = []
+    for node in tree.body:
+        if isinstance(node, (ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            names.append(node.name)
+        elif isinstance(node, ast.Assign):
+            names.extend(target.id for target in node.targets if isinstance(target, ast.Name))
+        elif isinstance(node, ast.AnnAssign) and isinstance(node.target, ast.Name):
+            names.append(node.target.id)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            # import a.b binds a, from a import b as c binds c
+            names.extend(alias.name if alias.name == '*' else alias.asname or alias.name.split('.')[0]
+                         for alias in node.names)
+    return names
+
+
+def _discover(paths):
+    """
+    Top level names defined in every python file, cached in astroNN cache folder and keyed on file modification time
+    """
+    cache_path = _discovery_cache_path()
+    try:
+        with open(cache_path) as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        cache = {}
+
+    discovered, updated = {}, False
+    for path in paths:
+        path = os.path.abspath(path)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entry = cache.get(path)
+        if entry is None or entry.get('version') != _DISCOVERY_VERSION or entry['mtime'] != stat.st_mtime or \
+                entry['size'] != stat.st_size:
+            try:
+                names = _top_level_names(path)
+            except (SyntaxError, UnicodeDecodeError, ValueError):
+                names = []
+            entry = cache[path] = {'version': _DISCOVERY_VERSION, 'mtime': stat.st_mtime, 'size': stat.st_size,
+                                   'names': names}
+            updated = True
+        discovered[path] = entry['names']
+
+    if updated:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            # write to a temporary file first so concurrent processes never read a partially written cache
+            with open(f'{cache_path}.{os.getpid()}', 'w') as f:
+                json.dump(cache, f)
+            os.replace(f'{cache_path}.{os.getpid()}', cache_path)
+        except OSError:
+            pass
+
+    return discovered
+
+
+def _import_file(path):
+    """
+    Import a python file as a module with a name unique to its path, so a custom model file named like another module
+    (e.g. utils.py) does not replace it in sys.modules. The folder is added to sys.path so the file can import other
+    files next to it
+    """
+    head, tail = os.path.split(path)
+    module_name = f'astroNN_custom_{hashlib.md5(path.encode("utf-8")).hexdigest()}_{os.path.splitext(tail)[0]}'
+    module = sys.modules.get(module_name)
+    if module is not None:
+        return module
+    if head not in sys.path:
+        sys.path.insert(0, head)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    try:
+        spec.loader.exec_module(module)
+    except Exception:
+        sys.modules.pop(module_name, None)
+        raise
+    return module
+
+
+def find_model(identifier, search_paths=None):
+    """
+    Find model class by identifier. Registered models are looked up first, then models provided by installed packages
+    with entry points, then python files in search_paths. Only the python file defining the identifier is imported
+    and the model found is registered for later calls
+
+    :param identifier: Identifier saved in astroNN_model_parameter.json
+    :type identifier: str
+    :param search_paths: Paths to python files of custom models
+    :type search_paths: Union[NoneType, list]
+    :return: Model class (or a function returning model)
+    :raises TypeError: If the identifier cannot be found
+    """
+    if identifier in _REGISTRY:
+        model = _REGISTRY[identifier]
+        if isinstance(model, str):
+            model = _REGISTRY[identifier] = _resolve(model)
+        return model
+
+    entry_point = _entry_points().get(identifier)
+    if entry_point is not None:
+        return register_model(entry_point.load(), identifier=identifier)
+
+    if search_paths:
+        for path, names in _discover(search_paths).items():
+            if identifier in names or '*' in names:
+                model = getattr(_import_file(path), identifier, None)
+                if model is not None:
+                    return register_model(model, identifier=identifier)
+
+    raise TypeError(f'Unknown model identifier -> {identifier}!')
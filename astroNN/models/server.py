@@ -0,0 +1,339 @@
+###############################################################################
+#   server.py: local micro-batching inference server for astroNN models
+###############################################################################
+import json
+import queue
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import numpy as np
+
+# upper edges of latency histogram bins in seconds, the last count is for latency above the last edge
+_LATENCY_BINS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1., 2., 5.)
+# upper edges of batch-fill histogram bins as fraction of max_batch_size
+_FILL_BINS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.)
+
+
+class _Request(object):
+    def __init__(self, x, x_err):
+        self.x = x
+        self.x_err = x_err
+        self.arrival = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher(object):
+    """
+    Coalesce concurrent inference requests into micro-batches, a batch is sent to the predictor once it is full or the
+    oldest request in it has waited for max_latency
+
+    :param predict: Predictor takes a batch of data (and error if any), returns an array or a tuple of an array and a
+                    dictionary of arrays like astroNN test()
+    :type predict: callable
+    :param max_batch_size: Maximum number of data in a micro-batch
+    :type max_batch_size: int
+    :param max_latency: Maximum time (in seconds) to wait for filling a micro-batch
+    :type max_latency: float
+    """
+    def __init__(self, predict, max_batch_size=256, max_latency=0.01):
+        self.predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_latency = max_latency
+
+        self._queue = queue.Queue()
+        self._pending = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.reset_stats()
+
+    def reset_stats(self):
+        """
+        Reset latency and batch-fill statistics
+
+        :return: None
+        :rtype: NoneType
+        """
+        with self._stats_lock:
+            self._latency_counts = np.zeros(len(_LATENCY_BINS) + 1, dtype=int)
+            self._fill_counts = np.zeros(len(_FILL_BINS), dtype=int)
+            self._latency_sum = 0.
+            self._num_requests = 0
+            self._num_batches = 0
+
+        return None
+
+    def start(self):
+        """
+        Start the batching thread
+
+        :return: None
+        :rtype: NoneType
+        """
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+        self._thread.start()
+
+        return None
+
+    def stop(self):
+        """
+        Stop the batching thread after finishing requests already collected
+
+        :return: None
+        :rtype: NoneType
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        return None
+
+    def submit(self, x, x_err=None):
+        """
+        Submit a request and block until its result is ready
+
+        :param x: Data, first axis is the data point axis
+        :type x: ndarray
+        :param x_err: Error of data (if any)
+        :type x_err: Union[NoneType, ndarray]
+        :return: Result of the predictor for x only
+        """
+        request = _Request(np.asarray(x), None if x_err is None else np.asarray(x_err))
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _collect(self):
+        """
+        Collect a micro-batch of requests, return empty list if nothing arrives
+        """
+        if self._pending is not None:
+            first, self._pending = self._pending, None
+        else:
+            try:
+                first = self._queue.get(timeout=0.1)
+            except queue.Empty:
+                return []
+        batch, num_data = [first], first.x.shape[0]
+        deadline = first.arrival + self.max_latency
+        while num_data < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if num_data + request.x.shape[0] > self.max_batch_size:
+                # does not fit, leave it for the next micro-batch
+                self._pending = request
+                break
+            batch.append(request)
+            num_data += request.x.shape[0]
+        return batch
+
+    def _run_batch(self, batch):
+        sizes = [request.x.shape[0] for request in batch]
+        x = np.concatenate([request.x for request in batch])
+        if all(request.x_err is None for request in batch):
+            result = self.predict(x)
+        else:
+            x_err = np.concatenate([np.zeros_like(request.x) if request.x_err is None else request.x_err
+                                    for request in batch])
+            result = self.predict(x, x_err)
+
+        # split result back to each request
+        splits = np.cumsum(sizes)[:-1]
+        if isinstance(result, tuple):
+            predictions, uncertainty = result
+            split_uncertainty = {key: np.split(np.asarray(value), splits) for key, value in uncertainty.items()}
+            results = [(prediction, {key: value[i] for key, value in split_uncertainty.items()})
+                       for i, prediction in enumerate(np.split(np.asarray(predictions), splits))]
+        else:
+            results = np.split(np.asarray(result), splits)
+
+        finish = time.perf_counter()
+        with self._stats_lock:
+            self._num_batches += 1
+            self._fill_counts[np.searchsorted(_FILL_BINS, min(sum(sizes) / self.max_batch_size, 1.))] += 1
+            for request in batch:
+                latency = finish - request.arrival
+                self._latency_counts[np.searchsorted(_LATENCY_BINS, latency)] += 1
+                self._latency_sum += latency
+                self._num_requests += 1
+
+        for request, request_result in zip(batch, results):
+            request.result = request_result
+            request.done.set()
+
+    def _loop(self):
+        while not (self._stop.is_set() and self._queue.empty() and self._pending is None):
+            batch = self._collect()
+            if len(batch) == 0:
+                continue
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                for request in batch:
+                    request.error = e
+                    request.done.set()
+
+    def stats(self):
+        """
+        Get per-request latency and batch-fill histograms
+
+        :return: Dictionary of statistics
+        :rtype: dict
+        """
+        with self._stats_lock:
+            return {'num_requests': self._num_requests, 'num_batches': self._num_batches,
+                    'mean_latency': self._latency_sum / max(self._num_requests, 1),
+                    'latency_bins': list(_LATENCY_BINS),
+                    'latency_counts': self._latency_counts.tolist(),
+                    'batch_fill_bins': list(_FILL_BINS),
+                    'batch_fill_counts': self._fill_counts.tolist()}
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _InferenceHandler(BaseHTTPRequestHandler):
+    def _reply(self, code, content):
+        body = json.dumps(content).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._reply(200, self.server.batcher.stats())
+        elif self.path == '/health':
+            self._reply(200, {'status': 'ok'})
+        else:
+            self._reply(404, {'error': f'Unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path != '/predict':
+            self._reply(404, {'error': f'Unknown path {self.path}'})
+            return
+        try:
+            content = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+            x = np.atleast_2d(np.asarray(content['x'], dtype=np.float32))
+            x_err = content.get('x_err')
+            if x_err is not None:
+                x_err = np.atleast_2d(np.asarray(x_err, dtype=np.float32))
+        except (ValueError, KeyError, TypeError) as e:
+            self._reply(400, {'error': f'Bad request: {e}'})
+            return
+        try:
+            result = self.server.batcher.submit(x, x_err)
+        except Exception as e:
+            self._reply(500, {'error': str(e)})
+            return
+        if isinstance(result, tuple):
+            self._reply(200, {'prediction': np.asarray(result[0]).tolist(),
+                              'uncertainty': {key: np.asarray(value).tolist() for key, value in result[1].items()}})
+        else:
+            self._reply(200, {'prediction': np.asarray(result).tolist()})
+
+    def log_message(self, *args):
+        # silence per-request logging
+        pass
+
+
+class InferenceServer(object):
+    """
+    Local HTTP inference server keeping an astroNN model warm, concurrent requests are coalesced into micro-batches
+
+    | POST /predict with JSON {"x": [...], "x_err": [...] (optional)} to get prediction (and uncertainty)
+    | GET /stats to get per-request latency and batch-fill histograms
+    | GET /health to check if the server is up
+
+    :param model: astroNN model folder name, astroNN model or any predictor callable
+    :type model: Union[str, astroNN.models.NeuralNetMaster.NeuralNetMaster, callable]
+    :param host: Host to bind, local only by default
+    :type host: str
+    :param port: Port to bind, 0 to pick a free port
+    :type port: int
+    :param max_batch_size: Maximum number of data in a micro-batch
+    :type max_batch_size: int
+    :param max_latency: Maximum time (in seconds) to wait for filling a micro-batch
+    :type max_latency: float
+    """
+    def __init__(self, model, host='127.0.0.1', port=0, max_batch_size=256, max_latency=0.01):
+        if isinstance(model, str):
+            from astroNN.models import load_folder
+            model = load_folder(model, inference_only=True)
+        self.batcher = MicroBatcher(self._predictor(model), max_batch_size=max_batch_size, max_latency=max_latency)
+        self._httpd = _ThreadingHTTPServer((host, port), _InferenceHandler)
+        self._httpd.batcher = self.batcher
+        self.host, self.port = self._httpd.server_address[:2]
+        self._thread = None
+
+    @staticmethod
+    def _predictor(model):
+        """
+        Wrap astroNN model test() so it can be called from the batching thread
+        """
+        if not hasattr(model, 'keras_model'):
+            return model
+
+        from astroNN.config import keras_import_manager
+        keras = keras_import_manager()
+        # Tensorflow default graph and session are thread local, the batching thread needs to use the graph and the
+        # session of the model, otherwise Keras creates a new session with newly initialized weights
+        session = keras.backend.get_session()
+
+        def predict(x, x_err=None):
+            with session.graph.as_default(), session.as_default():
+                return model.test(x) if x_err is None else model.test(x, x_err)
+
+        return predict
+
+    def start(self):
+        """
+        Start serving in background threads
+
+        :return: None
+        :rtype: NoneType
+        """
+        self.batcher.start()
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        print(f'astroNN inference server running on http://{self.host}:{self.port}')
+
+        return None
+
+    def stop(self):
+        """
+        Stop serving
+
+        :return: None
+        :rtype: NoneType
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.batcher.stop()
+
+        return None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *args):
+        self.stop()
@@ -1,8 +1,9 @@
 import math
 
+import numpy as np
 import tensorflow as tf
 
-from astroNN.config import keras_import_manager
+from astroNN.config import keras_import_manager, MAGIC_NUMBER
 
 keras = keras_import_manager()
 epsilon = keras.backend.epsilon
@@ -385,19 +386,202 @@ class ErrorProp(Layer):
         return input_shape
 
 
+class NormalizeLayer(Layer):
+    """
+    | Normalize input inside the graph with known mean and standard derivation, so inference can be done on raw data.
+    | Equivalent to astroNN Normalizer.normalize(data, calc=False), data equal to magic number will not be touched
+
+    :param mean: Mean used to normalize data
+    :type mean: Union[float, ndarray]
+    :param std: Standard derivation used to normalize data
+    :type std: Union[float, ndarray]
+    :param mode: Normalization mode used in Normalizer, sigmoid will be applied for mode '3s'
+    :type mode: Union[NoneType, int, str]
+    :return: A layer
+    :rtype: object
+    """
+    def __init__(self, mean, std, mode=None, **kwargs):
+        super().__init__(**kwargs)
+        self.mean = np.asarray(mean, dtype=np.float32)
+        self.std = np.asarray(std, dtype=np.float32)
+        self.mode = str(mode)
+        self.supports_masking = True
+
+    @staticmethod
+    def _broadcastable(stat, input_shape):
+        """
+        Mean and std are calculated on data without the trailing channel axis for mono-channel data,
+        so reshape them to the shape of a single data point
+        """
+        if stat.size == 1:
+            return tf.constant(stat.reshape(()))
+        return tf.constant(stat.reshape([-1 if dim is None else dim for dim in input_shape[1:]]))
+
+    def _transform(self, inputs, mean, std):
+        normalized = (inputs - mean) / std
+        if self.mode == '3s':
+            normalized = tf.nn.sigmoid(normalized)
+        return normalized
+
+    def call(self, inputs, training=None):
+        """
+        :Note: Equivalent to __call__()
+        :param inputs: Tensor to be applied
+        :type inputs: tf.Tensor
+        :return: Tensor after applying the layer
+        :rtype: tf.Tensor
+        """
+        input_shape = inputs.get_shape().as_list()
+        mean = self._broadcastable(self.mean, input_shape)
+        std = self._broadcastable(self.std, input_shape)
+        transformed = self._transform(inputs, mean, std)
+        # magic number pass through untouched
+        return tf.where(tf.equal(inputs, MAGIC_NUMBER), inputs, transformed)
+
+    def get_config(self):
+        """
+        :return: Dictionary of configuration
+        :rtype: dict
+        """
+        config = {'mean': self.mean.tolist(), 'std': self.std.tolist(), 'mode': self.mode}
+        base_config = super().get_config()
+        return {**dict(base_config.items()), **config}
+
+    def compute_output_shape(self, input_shape):
+        return input_shape
+
+
+class DenormalizeLayer(NormalizeLayer):
+    """
+    | Denormalize output inside the graph with known mean and standard derivation.
+    | Equivalent to astroNN Normalizer.denormalize(data), data equal to magic number will not be touched
+
+    :param mean: Mean used to normalize data
+    :type mean: Union[float, ndarray]
+    :param std: Standard derivation used to normalize data
+    :type std: Union[float, ndarray]
+    :param mode: Normalization mode used in Normalizer, inverse sigmoid will be applied for mode '3s'
+    :type mode: Union[NoneType, int, str]
+    :return: A layer
+    :rtype: object
+    """
+    def _transform(self, inputs, mean, std):
+        if self.mode == '3s':
+            inputs = tf.log(inputs / (1. - inputs))
+        return inputs * std + mean
+
+
+def _inbound_nodes(layer):
+    # attribute is private since Keras 2.1.3
+    return layer._inbound_nodes if hasattr(layer, '_inbound_nodes') else layer.inbound_nodes
+
+
+def is_stochastic_layer(layer):
+    """
+    Check if a layer is stochastic in inference, i.e. astroNN Monte Carlo layers or a model containing them
+
+    :param layer: Keras layer
+    :type layer: keras.layers.Layer
+    :return: True if the layer is stochastic
+    :rtype: bool
+    """
+    if isinstance(layer, (MCDropout, MCGaussianDropout, MCConcreteDropout, MCBatchNorm, ErrorProp)):
+        return True
+    elif isinstance(layer, keras.Model):
+        return any(is_stochastic_layer(sub_layer) for sub_layer in layer.layers)
+    else:
+        return False
+
+
+def split_deterministic_trunk(model):
+    """
+    Split a single input, single output Keras model into a deterministic trunk (every layer before the first stochastic
+    layers) and a stochastic suffix model, so the trunk only needs to be evaluated once in Monte Carlo inference
+
+    :param model: Keras model
+    :type model: keras.Model
+    :return: Trunk model and suffix model, or None if the model cannot be split usefully
+    :rtype: Union[NoneType, tuple]
+    """
+    if len(model.inputs) != 1 or len(model.outputs) != 1:
+        return None
+
+    stochastic = {}
+
+    def is_stochastic(tensor):
+        layer, node_index, _ = tensor._keras_history
+        if (id(layer), node_index) not in stochastic:
+            node = _inbound_nodes(layer)[node_index]
+            if not node.inbound_layers:  # input layer
+                stochastic[(id(layer), node_index)] = False
+            else:
+                # need to visit all inputs to check every branch
+                inputs_stochastic = [is_stochastic(x) for x in node.input_tensors]
+                stochastic[(id(layer), node_index)] = is_stochastic_layer(layer) or any(inputs_stochastic)
+        return stochastic[(id(layer), node_index)]
+
+    if not is_stochastic(model.outputs[0]):
+        return None
+
+    # deterministic tensors directly consumed by stochastic part of the graph
+    cut = []
+    visited = set()
+
+    def find_cut(tensor):
+        layer, node_index, _ = tensor._keras_history
+        if (id(layer), node_index) in visited:
+            return
+        visited.add((id(layer), node_index))
+        for x in _inbound_nodes(layer)[node_index].input_tensors:
+            if not is_stochastic(x):
+                if not any(x is c for c in cut):
+                    cut.append(x)
+            else:
+                find_cut(x)
+
+    find_cut(model.outputs[0])
+    # only support a single cut tensor which is not the input itself, otherwise there is nothing to save
+    if len(cut) != 1 or cut[0] is model.inputs[0]:
+        return None
+
+    # replay the stochastic part of the graph on a new input, layers (and so weights) are shared with the model
+    suffix_input = keras.layers.Input(shape=tuple(cut[0].get_shape().as_list()[1:]))
+    replayed = {}
+
+    def replay(tensor):
+        if tensor is cut[0]:
+            return suffix_input
+        layer, node_index, tensor_index = tensor._keras_history
+        if (id(layer), node_index) not in replayed:
+            node = _inbound_nodes(layer)[node_index]
+            inputs = [replay(x) for x in node.input_tensors]
+            outputs = layer(inputs[0] if len(inputs) == 1 else inputs, **(node.arguments or {}))
+            replayed[(id(layer), node_index)] = outputs if isinstance(outputs, list) else [outputs]
+        return replayed[(id(layer), node_index)][tensor_index]
+
+    suffix_model = keras.models.Model(inputs=suffix_input, outputs=replay(model.outputs[0]))
+    trunk_model = keras.models.Model(inputs=model.inputs, outputs=cut[0])
+
+    return trunk_model, suffix_model
+
+
 class FastMCInference():
     """
     To create a model for fast MC Dropout Inference on GPU
 
     :param n: Number of Monte Carlo integration
     :type n: int
+    :param block_size: Number of Monte Carlo integration done at once, None to do all n at once. Peak memory scales with
+                       block_size instead of n when provided
+    :type block_size: Union[NoneType, int]
     :return: A layer
     :rtype: object
     :History: 2018-Apr-13 - Written - Henry Leung (University of Toronto)
     """
-    def __init__(self, n):
+    def __init__(self, n, block_size=None):
         super().__init__()
         self.n = n
+        self.block_size = block_size
 
     def __call__(self, model):
         """
@@ -411,8 +595,20 @@ class FastMCInference():
         else:
             raise TypeError(f'FastMCInference expects keras Model, you gave {type(model)}')
         new_input = keras.layers.Input(shape=(self.model.input_shape[1:]), name='input')
-        mc_model = keras.models.Model(inputs=self.model.inputs, outputs=self.model.outputs)
-        mc = FastMCInferenceMeanVar()(keras.layers.TimeDistributed(mc_model)(FastMCRepeat(self.n)(new_input)))
+
+        # deterministic layers before the first stochastic layer only need to be evaluated once
+        split = split_deterministic_trunk(self.model)
+        if split is not None:
+            trunk_model, mc_model = split
+            mc_input = trunk_model(new_input)
+        else:
+            mc_model = keras.models.Model(inputs=self.model.inputs, outputs=self.model.outputs)
+            mc_input = new_input
+
+        if self.block_size is None or self.block_size >= self.n:
+            mc = FastMCInferenceMeanVar()(keras.layers.TimeDistributed(mc_model)(FastMCRepeat(self.n)(mc_input)))
+        else:
+            mc = FastMCBlockMeanVar(mc_model, self.n, self.block_size)(mc_input)
         new_mc_model = keras.models.Model(inputs=new_input, outputs=mc)
 
         return new_mc_model
@@ -422,10 +618,88 @@ class FastMCInference():
         :return: Dictionary of configuration
         :rtype: dict
         """
-        config = {'n': self.n}
+        config = {'n': self.n, 'block_size': self.block_size}
         return config
 
 
+class FastMCBlockMeanVar(Wrapper):
+    """
+    Memory-bounded Monte Carlo integration of a Keras model, the n forward passes are done in blocks of block_size in a
+    tf.while_loop and the mean and variance are accumulated block by block (Chan et al. parallel variant of Welford's
+    algorithm). The output is the same as FastMCInferenceMeanVar
+
+    :param layer: Keras model to be integrated
+    :type layer: keras.Model
+    :param n: Number of Monte Carlo integration
+    :type n: int
+    :param block_size: Number of Monte Carlo integration done at once
+    :type block_size: int
+    :return: A layer
+    :rtype: object
+    """
+    def __init__(self, layer, n, block_size, **kwargs):
+        super().__init__(layer, **kwargs)
+        if block_size < 1 or n < 1:
+            raise ValueError('n and block_size must be positive integer')
+        self.n = n
+        self.block_size = block_size
+
+    def compute_output_shape(self, input_shape):
+        output_shape = self.layer.compute_output_shape(input_shape)
+        return tuple(output_shape) + (2,)
+
+    def _block_moments(self, inputs, block_size):
+        """
+        Run block_size forward passes at once by tiling inputs along the batch axis, and return their mean and variance
+        """
+        batch_size = tf.shape(inputs)[0]
+        tiled = tf.tile(inputs, tf.concat([[block_size], tf.ones_like(tf.shape(inputs))[1:]], axis=0))
+        outputs = self.layer.call(tiled)
+        outputs = tf.reshape(outputs, tf.concat([[block_size, batch_size], tf.shape(outputs)[1:]], axis=0))
+        return tf.nn.moments(outputs, axes=[0])
+
+    def call(self, inputs, training=None):
+        """
+        :Note: Equivalent to __call__()
+        :param inputs: Tensor to be applied
+        :type inputs: tf.Tensor
+        :return: Tensor after applying the layer
+        :rtype: tf.Tensor
+        """
+        def merge(count, mean, m2, block_size, block_mean, block_var):
+            new_count = count + block_size
+            delta = block_mean - mean
+            mean = mean + delta * block_size / new_count
+            m2 = m2 + block_var * block_size + tf.square(delta) * count * block_size / new_count
+            return new_count, mean, m2
+
+        def body(i, count, mean, m2):
+            block_mean, block_var = self._block_moments(inputs, self.block_size)
+            return (i + 1, *merge(count, mean, m2, float(self.block_size), block_mean, block_var))
+
+        # first block outside the loop to set up running statistics with the right shape
+        mean, var = self._block_moments(inputs, self.block_size)
+        count, m2 = tf.constant(float(self.block_size)), var * self.block_size
+        _, count, mean, m2 = tf.while_loop(lambda i, *_: tf.less(i, self.n // self.block_size), body,
+                                           [tf.constant(1), count, mean, m2])
+
+        remainder = self.n % self.block_size
+        if remainder != 0:
+            block_mean, block_var = self._block_moments(inputs, remainder)
+            count, mean, m2 = merge(count, mean, m2, float(remainder), block_mean, block_var)
+
+        return tf.stack((mean, m2 / count), axis=-1)
+
+    def get_config(self):
+        """
+        :return: Dictionary of configuration
+        :rtype: dict
+        """
+        config = {'n': self.n, 'block_size': self.block_size}
+        base_config = super().get_config()
+        return {**dict(base_config.items()), **config}
+
+
 class FastMCInferenceMeanVar(Layer):
     """
     Take mean and variance of the results of a TimeDistributed layer, assuming axis=1 is the timestamp axis
@@ -1,7 +1,6 @@
 # ---------------------------------------------------------------#
 #   astroNN.nn.numpy: tools written with numpy instead of tf
 # ---------------------------------------------------------------#
-import astropy.units as u
 import numpy as np
 from astroNN.config import MAGIC_NUMBER
 
@@ -82,6 +81,8 @@ def relu(x):
 
 
 def mape_core(x, y, axis=None, mode=None):
+    import astropy.units as u
+
     if isinstance(x, list):
         x = np.array(x)
     if isinstance(y, list):
@@ -146,6 +147,8 @@ def median_absolute_percentage_error(x, y, axis=None):
 
 
 def mae_core(x, y, axis=None, mode=None):
+    import astropy.units as u
+
     if isinstance(x, list):
         x = np.array(x)
     if isinstance(y, list):
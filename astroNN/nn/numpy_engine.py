@@ -0,0 +1,297 @@
+# ---------------------------------------------------------------#
+#   astroNN.nn.numpy_engine: Tensorflow-free inference engine
+# ---------------------------------------------------------------#
+import json
+
+import numpy as np
+
+from astroNN.nn.numpy import sigmoid, relu
+from astroNN.nn.utilities.normalizer import Normalizer
+
+# Keras layers which can be exported by NeuralNetMaster.export_numpy()
+SUPPORTED_LAYERS = ['InputLayer', 'Conv1D', 'Conv2D', 'Dense', 'MaxPooling1D', 'MaxPooling2D', 'Flatten', 'Activation',
+                    'Dropout', 'MCDropout', 'Concatenate']
+
+
+def _softmax(x):
+    e = np.exp(x - np.max(x, axis=-1, keepdims=True))
+    return e / np.sum(e, axis=-1, keepdims=True)
+
+
+_ACTIVATIONS = {'linear': lambda x: x,
+                'relu': relu,
+                'sigmoid': sigmoid,
+                'tanh': np.tanh,
+                'softmax': _softmax,
+                'elu': lambda x: np.where(x > 0, x, np.expm1(np.minimum(x, 0))),
+                'softplus': lambda x: np.logaddexp(0, x),
+                'softsign': lambda x: x / (1 + np.abs(x))}
+
+
+def _activation(x, name):
+    try:
+        return _ACTIVATIONS[name](x)
+    except KeyError:
+        raise ValueError(f'Activation {name} is not supported by astroNN numpy engine')
+
+
+def _pad_same(x, window, strides, value=0.):
+    """
+    Pad spatial axes the same way as Tensorflow "same" padding
+    """
+    pads = [(0, 0)]
+    for axis, (k, s) in enumerate(zip(window, strides)):
+        n = x.shape[axis + 1]
+        total = max((-(-n // s) - 1) * s + k - n, 0)
+        pads.append((total // 2, total - total // 2))
+    pads.append((0, 0))
+    return np.pad(x, pads, mode='constant', constant_values=value)
+
+
+def _windows(x, window, strides):
+    """
+    Yield offset and strided view of x for every position inside the sliding window
+    """
+    out_shape = [(x.shape[axis + 1] - k) // s + 1 for axis, (k, s) in enumerate(zip(window, strides))]
+    for offset in np.ndindex(*window):
+        yield offset, x[(slice(None), *[slice(o, o + (n - 1) * s + 1, s)
+                                        for o, n, s in zip(offset, out_shape, strides)])]
+
+
+def conv(x, kernel, bias=None, strides=None, padding='valid'):
+    """
+    NumPy implementation of channels last 1D/2D convolution as Keras Conv1D/Conv2D
+
+    :param x: Data of shape (batch, *spatial, channels)
+    :type x: ndarray
+    :param kernel: Kernel of shape (*window, channels, filters)
+    :type kernel: ndarray
+    :param bias: Bias of shape (filters,)
+    :type bias: Union[NoneType, ndarray]
+    :param strides: Strides of each spatial axis
+    :type strides: Union[NoneType, tuple]
+    :param padding: "valid" or "same"
+    :type padding: str
+    :return: Convoluted data
+    :rtype: ndarray
+    """
+    window = kernel.shape[:-2]
+    strides = (1,) * len(window) if strides is None else tuple(strides)
+    if padding == 'same':
+        x = _pad_same(x, window, strides)
+    out = None
+    # sum of matrix multiplications over window positions instead of building the whole im2col matrix
+    for offset, x_window in _windows(x, window, strides):
+        result = x_window @ kernel[offset]
+        out = result if out is None else out + result
+    if bias is not None:
+        out += bias
+    return out
+
+
+def max_pool(x, pool_size, strides=None, padding='valid'):
+    """
+    NumPy implementation of channels last 1D/2D max pooling as Keras MaxPooling1D/MaxPooling2D
+
+    :param x: Data of shape (batch, *spatial, channels)
+    :type x: ndarray
+    :param pool_size: Pool size of each spatial axis
+    :type pool_size: tuple
+    :param strides: Strides of each spatial axis, None to be the same as pool_size
+    :type strides: Union[NoneType, tuple]
+    :param padding: "valid" or "same"
+    :type padding: str
+    :return: Pooled data
+    :rtype: ndarray
+    """
+    pool_size = tuple(pool_size)
+    strides = pool_size if strides is None else tuple(strides)
+    if padding == 'same':
+        x = _pad_same(x, pool_size, strides, value=-np.inf)
+    out = None
+    for offset, x_window in _windows(x, pool_size, strides):
+        out = x_window if out is None else np.maximum(out, x_window)
+    return out
+
+
+def mc_postprocessing(result, task, labels_normalizer, labels_mean, labels_std):
+    """
+    Convert raw mean and variance from Monte Carlo dropout inference to prediction and uncertainty
+
+    :param result: Raw mean and variance of shape (batch, 2 * labels, 2)
+    :type result: ndarray
+    :param task: Task of neural network
+    :type task: str
+    :param labels_normalizer: Labels normalizer, or None to use labels_mean and labels_std
+    :type labels_normalizer: Union[NoneType, astroNN.nn.utilities.normalizer.Normalizer]
+    :param labels_mean: Mean of labels
+    :type labels_mean: ndarray
+    :param labels_std: Standard derivation of labels
+    :type labels_std: ndarray
+    :return: prediction and prediction uncertainty
+    """
+    half_first_dim = result.shape[1] // 2  # result.shape[1] is guarantee an even number, otherwise sth is wrong
+
+    predictions = result[:, :half_first_dim, 0]  # mean prediction
+    mc_dropout_uncertainty = result[:, :half_first_dim, 1] * (labels_std ** 2)  # model uncertainty
+    predictions_var = np.exp(result[:, half_first_dim:, 0]) * (labels_std ** 2)  # predictive uncertainty
+
+    if labels_normalizer is not None:
+        predictions = labels_normalizer.denormalize(predictions)
+    else:
+        predictions *= labels_std
+        predictions += labels_mean
+
+    if task == 'regression':
+        # Predictive variance
+        pred_var = predictions_var + mc_dropout_uncertainty  # epistemic plus aleatoric uncertainty
+        pred_uncertainty = np.sqrt(pred_var)  # Convert back to std error
+
+        # final correction from variance to standard derivation
+        mc_dropout_uncertainty = np.sqrt(mc_dropout_uncertainty)
+        predictive_uncertainty = np.sqrt(predictions_var)
+
+    elif task == 'classification':
+        # we want entropy for classification uncertainty
+        predicted_class = np.argmax(predictions, axis=1)
+        mc_dropout_uncertainty_temp = np.array(mc_dropout_uncertainty)
+        mc_dropout_uncertainty = np.ones_like(predicted_class, dtype=float)
+        predictive_uncertainty = np.ones_like(predicted_class, dtype=float)
+        for i in range(predicted_class.shape[0]):
+            mc_dropout_uncertainty[i] = mc_dropout_uncertainty_temp[i, predicted_class[i]]
+            predictive_uncertainty[i] = np.array(predictions_var[i, predicted_class[i]])
+
+        pred_uncertainty = mc_dropout_uncertainty + predictive_uncertainty
+        # We only want the predicted class back
+        predictions = predicted_class
+
+    elif task == 'binary_classification':
+        # we want entropy for classification uncertainty, so need prediction in logits space
+        mc_dropout_uncertainty = - np.sum(predictions * np.log(predictions), axis=0)
+        # need to activate before round to int so that the prediction is always 0 or 1
+        predictions = np.rint(sigmoid(predictions))
+        predictive_uncertainty = predictions_var
+        pred_uncertainty = mc_dropout_uncertainty + predictions_var
+    else:
+        raise AttributeError('Unknown Task')
+
+    return predictions, {'total': pred_uncertainty, 'model': mc_dropout_uncertainty, 'predictive': predictive_uncertainty}
+
+
+class NumpyModel(object):
+    """
+    Tensorflow-free inference engine running models exported by NeuralNetMaster.export_numpy() with NumPy only, so a
+    process only doing inference does not need to import Tensorflow and build Keras graph
+
+    | test() has the same output as test() of the original astroNN model, Monte Carlo dropout of Bayesian neural net is
+    | vectorized by repeating the batch mc_num times with independent dropout masks
+
+    :param filename: Path to the exported .npz file
+    :type filename: str
+    :param seed: Random seed for Monte Carlo dropout
+    :type seed: Union[NoneType, int]
+    """
+    def __init__(self, filename, seed=None):
+        with np.load(filename, allow_pickle=False) as f:
+            config = json.loads(str(f['config']))
+            self.weights = {name: f[name] for name in f.files if name != 'config'}
+
+        self.name = config['name']
+        self.model_type = config['model_type']
+        self.task = config['task']
+        self.targetname = config['targetname']
+        self.input_shape = tuple(config['input_shape'])
+        self.labels_shape = config['labels_shape']
+        self.mc_num = config['mc_num']
+        self.inference_batch_size = config['inference_batch_size']
+        self.layers = config['layers']
+        self.output_layer = config['output_layer']
+
+        self.input_normalizer = Normalizer(mode=config['input_norm_mode'])
+        self.input_normalizer.mean_labels = self.weights.pop('input_mean')
+        self.input_normalizer.std_labels = self.weights.pop('input_std')
+        self.labels_normalizer = Normalizer(mode=config['labels_norm_mode'])
+        self.labels_normalizer.mean_labels = self.weights.pop('labels_mean')
+        self.labels_normalizer.std_labels = self.weights.pop('labels_std')
+
+        self._rng = np.random.RandomState(seed)
+
+    def _forward(self, x):
+        """
+        Run the exported graph on normalized data
+        """
+        tensors = {}
+        for layer in self.layers:
+            name, class_name, config = layer['name'], layer['class_name'], layer['config']
+            weights = [self.weights[f'{name}/{i}'] for i in range(layer['num_weights'])]
+            inputs = [tensors[inbound] for inbound in layer['inbound']]
+
+            if class_name == 'InputLayer':
+                out = x
+            elif class_name in ['Conv1D', 'Conv2D']:
+                if any(rate != 1 for rate in np.atleast_1d(config['dilation_rate'])):
+                    raise ValueError('Dilated convolution is not supported by astroNN numpy engine')
+                out = conv(inputs[0], weights[0], weights[1] if config['use_bias'] else None, config['strides'],
+                           config['padding'])
+                out = _activation(out, config['activation'])
+            elif class_name == 'Dense':
+                out = inputs[0] @ weights[0]
+                if config['use_bias']:
+                    out += weights[1]
+                out = _activation(out, config['activation'])
+            elif class_name == 'MaxPooling1D':
+                out = max_pool(inputs[0], np.atleast_1d(config['pool_size']),
+                               None if config['strides'] is None else np.atleast_1d(config['strides']),
+                               config['padding'])
+            elif class_name == 'MaxPooling2D':
+                out = max_pool(inputs[0], config['pool_size'], config['strides'], config['padding'])
+            elif class_name == 'Flatten':
+                out = inputs[0].reshape(inputs[0].shape[0], -1)
+            elif class_name == 'Activation':
+                out = _activation(inputs[0], config['activation'])
+            elif class_name == 'Dropout':
+                # Keras dropout is off in inference
+                out = inputs[0]
+            elif class_name == 'MCDropout':
+                if config['disable'] is True:
+                    out = inputs[0]
+                else:
+                    retain_prob = 1. - config['rate']
+                    out = inputs[0] * (self._rng.uniform(size=inputs[0].shape) < retain_prob) / retain_prob
+            elif class_name == 'Concatenate':
+                out = np.concatenate(inputs, axis=config['axis'])
+            else:
+                raise ValueError(f'Layer {class_name} is not supported by astroNN numpy engine')
+            tensors[name] = out.astype(np.float32, copy=False)
+
+        return tensors[self.output_layer]
+
+    def test(self, input_data):
+        """
+        Use the exported model to test
+
+        :param input_data: Data to be inferred with neural network
+        :type input_data: ndarray
+        :return: prediction (and prediction uncertainty for Bayesian neural net)
+        """
+        input_data = np.atleast_2d(input_data)
+        norm_data = self.input_normalizer.normalize(input_data, calc=False)
+        norm_data = norm_data.reshape(norm_data.shape[0], *self.input_shape).astype(np.float32)
+
+        results = []
+        for i in range(0, norm_data.shape[0], self.inference_batch_size):
+            batch = norm_data[i:i + self.inference_batch_size]
+            if self.model_type == 'BCNN':
+                # repeat the batch to draw independent dropout masks in a single pass
+                out = self._forward(np.concatenate([batch] * self.mc_num))
+                out = out.reshape(self.mc_num, batch.shape[0], *out.shape[1:])
+                results.append(np.stack((np.mean(out, axis=0), np.var(out, axis=0)), axis=-1))
+            else:
+                results.append(self._forward(batch))
+        result = np.concatenate(results)
+
+        if self.model_type == 'BCNN':
+            return mc_postprocessing(result, self.task, self.labels_normalizer, self.labels_normalizer.mean_labels,
+                                     self.labels_normalizer.std_labels)
+        else:
+            return self.labels_normalizer.denormalize(result)
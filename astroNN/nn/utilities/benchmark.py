@@ -0,0 +1,360 @@
+###############################################################################
+#   benchmark.py: throughput benchmark for astroNN data generators, inference and imports
+###############################################################################
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import h5py
+import numpy as np
+
+# Synthetic data shapes mimicking astroNN typical use cases, (input shape, labels shape)
+_DATA_SHAPES = {'apogee': ((7514,), (25,)),
+                'galaxy10': ((69, 69, 3), (10,))}
+
+# heavy dependencies reported by import_time_benchmark
+_HEAVY_MODULES = ('tensorflow', 'keras', 'matplotlib', 'seaborn', 'sklearn', 'astropy', 'astroquery', 'pandas')
+
+
+class InstrumentedLock(object):
+    """
+    A drop-in replacement of threading.Lock for ThreadSafeIter which records lock contention
+
+    :ivar acquisitions: Number of times the lock was acquired
+    :ivar contended: Number of times the lock was already held by another thread when trying to acquire
+    :ivar wait_time: Total time (in seconds) spent waiting for the lock
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.acquisitions = 0
+        self.contended = 0
+        self.wait_time = 0.
+
+    def __enter__(self):
+        if not self._lock.acquire(blocking=False):
+            start_time = time.perf_counter()
+            self._lock.acquire()
+            self.wait_time += time.perf_counter() - start_time
+            self.contended += 1
+        self.acquisitions += 1
+        return self
+
+    def __exit__(self, *args):
+        self._lock.release()
+
+
+def _batch_nbytes(batch):
+    """
+    Total bytes of all arrays yielded by a generator in a single batch
+    """
+    if isinstance(batch, np.ndarray):
+        return batch.nbytes
+    elif isinstance(batch, dict):
+        return sum(_batch_nbytes(value) for value in batch.values())
+    elif isinstance(batch, (tuple, list)):
+        return sum(_batch_nbytes(value) for value in batch)
+    else:
+        return 0
+
+
+def _synthetic_storage(data_shape, num_data, backend, tmp_dir):
+    """
+    Create synthetic input and labels on the requested storage backend
+
+    :return: inputs, labels and a list of opened handles need to be closed
+    """
+    input_shape, labels_shape = _DATA_SHAPES[data_shape]
+    x = np.random.normal(0., 1., (num_data, *input_shape)).astype(np.float32)
+    y = np.random.normal(0., 1., (num_data, *labels_shape)).astype(np.float32)
+
+    if backend == 'ram':
+        return x, y, []
+    elif backend == 'memmap':
+        x_mm = np.memmap(os.path.join(tmp_dir, f'{data_shape}_x.dat'), dtype=np.float32, mode='w+', shape=x.shape)
+        y_mm = np.memmap(os.path.join(tmp_dir, f'{data_shape}_y.dat'), dtype=np.float32, mode='w+', shape=y.shape)
+        x_mm[:], y_mm[:] = x, y
+        x_mm.flush()
+        y_mm.flush()
+        return x_mm, y_mm, []
+    elif backend == 'h5':
+        h5f = h5py.File(os.path.join(tmp_dir, f'{data_shape}.h5'), 'w')
+        # chunk along the data point axis just like a h5 compiled with astroNN
+        h5f.create_dataset('x', data=x, chunks=(min(64, num_data), *input_shape))
+        h5f.create_dataset('y', data=y)
+        return h5f['x'], h5f['y'], [h5f]
+    else:
+        raise ValueError(f"Unknown storage backend -> {backend}, only 'ram', 'memmap' or 'h5' are supported")
+
+
+def _make_generator(generator, batch_size, shuffle, x, y):
+    """
+    Create astroNN data generator by short name with inputs and labels
+    """
+    if generator == 'CNN':
+        from astroNN.models.CNNBase import CNNDataGenerator
+        return CNNDataGenerator(batch_size, shuffle=shuffle).generate(x, y)
+    elif generator == 'BCNN':
+        from astroNN.models.BayesianCNNBase import BayesianCNNDataGenerator
+        return BayesianCNNDataGenerator(batch_size, shuffle=shuffle).generate(x, y, x, y)
+    elif generator == 'CVAE':
+        from astroNN.models.ConvVAEBase import CVAEDataGenerator
+        return CVAEDataGenerator(batch_size, shuffle=shuffle).generate(x, x)
+    elif generator == 'CGAN':
+        from astroNN.models.CGANBase import CGANDataGenerator
+        return CGANDataGenerator(batch_size, shuffle=shuffle).generate(x, x)
+    else:
+        raise ValueError(f"Unknown generator -> {generator}, only 'CNN', 'BCNN', 'CVAE' or 'CGAN' are supported")
+
+
+def _drive_generator(gen, steps, workers):
+    """
+    Pull ``steps`` batches from a thread-safe generator with ``workers`` threads like Keras's fit_generator does
+
+    :return: elapsed time in seconds, total bytes yielded
+    """
+    remaining = [steps]
+    nbytes = [0]
+    counter_lock = threading.Lock()
+
+    def worker():
+        while True:
+            with counter_lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            batch_bytes = _batch_nbytes(next(gen))
+            with counter_lock:
+                nbytes[0] += batch_bytes
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start_time, nbytes[0]
+
+
+def _allocation_probe(gen, probe_steps=5):
+    """
+    Measure memory allocation of the generator with tracemalloc outside the timed region
+
+    :return: Average number of memory blocks retained by a batch, peak traced memory in MB
+    """
+    tracemalloc.start()
+    try:
+        blocks = 0
+        for _ in range(probe_steps):
+            before = tracemalloc.take_snapshot()
+            batch = next(gen)
+            after = tracemalloc.take_snapshot()
+            blocks += sum(stat.count_diff for stat in after.compare_to(before, 'lineno') if stat.count_diff > 0)
+            del batch
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return blocks / probe_steps, peak / 1024 ** 2
+
+
+def generator_benchmark(generators=('CNN', 'BCNN', 'CVAE', 'CGAN'), data_shapes=('apogee', 'galaxy10'),
+                        batch_sizes=(32, 64, 128), workers=(1, 4), backends=('ram', 'memmap', 'h5'), num_data=1024,
+                        steps=20, shuffle=True, verbose=True):
+    """
+    Drive astroNN data generators standalone on synthetic data to find out whether a training is input-bound
+
+    | Synthetic APOGEE-shaped data are (num_data, 7514) spectra with 25 labels
+    | Synthetic Galaxy10-shaped data are (num_data, 69, 69, 3) images with 10 labels
+
+    :param generators: Generators to be benchmarked, any of 'CNN', 'BCNN', 'CVAE' or 'CGAN'
+    :type generators: Union[tuple, list]
+    :param data_shapes: Synthetic data to be used, any of 'apogee' or 'galaxy10'
+    :type data_shapes: Union[tuple, list]
+    :param batch_sizes: Batch sizes to be benchmarked
+    :type batch_sizes: Union[tuple, list]
+    :param workers: Number of threads pulling from the generator to be benchmarked
+    :type workers: Union[tuple, list]
+    :param backends: Storage backends to be benchmarked, any of 'ram', 'memmap' or 'h5'
+    :type backends: Union[tuple, list]
+    :param num_data: Number of synthetic data points
+    :type num_data: int
+    :param steps: Number of batches to pull for each configuration
+    :type steps: int
+    :param shuffle: Shuffle strategy of the generator, 'chunk' is always used for h5 if shuffle=True because h5py
+                    only supports increasing indices
+    :type shuffle: Union[bool, str]
+    :param verbose: Whether to print the result table
+    :type verbose: bool
+    :return: List of dictionary of results, one for each configuration
+    :rtype: list
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for data_shape in data_shapes:
+            for backend in backends:
+                x, y, handles = _synthetic_storage(data_shape, num_data, backend, tmp_dir)
+                try:
+                    for generator in generators:
+                        for batch_size in batch_sizes:
+                            gen_shuffle = 'chunk' if backend == 'h5' and shuffle is True else shuffle
+                            for num_workers in workers:
+                                gen = _make_generator(generator, batch_size, gen_shuffle, x, y)
+                                lock = gen.lock = InstrumentedLock()
+                                elapsed, nbytes = _drive_generator(gen, steps, num_workers)
+                                allocs, peak = _allocation_probe(gen)
+                                results.append({'generator': generator, 'data': data_shape, 'backend': backend,
+                                                'batch_size': batch_size, 'workers': num_workers,
+                                                'shuffle': gen_shuffle, 'batches_per_sec': steps / elapsed,
+                                                'MB_per_sec': nbytes / 1024 ** 2 / elapsed,
+                                                'allocs_per_batch': allocs, 'peak_memory_MB': peak,
+                                                'lock_contended': lock.contended / max(lock.acquisitions, 1),
+                                                'lock_wait_sec': lock.wait_time})
+                finally:
+                    for handle in handles:
+                        handle.close()
+
+    if verbose is True:
+        print(f"{'generator':>9} {'data':>8} {'backend':>7} {'batch':>5} {'workers':>7} {'batch/s':>9} "
+              f"{'MB/s':>9} {'allocs':>7} {'peak MB':>8} {'contended':>9} {'wait(s)':>8}")
+        for r in results:
+            print(f"{r['generator']:>9} {r['data']:>8} {r['backend']:>7} {r['batch_size']:>5} {r['workers']:>7} "
+                  f"{r['batches_per_sec']:>9.2f} {r['MB_per_sec']:>9.2f} {r['allocs_per_batch']:>7.1f} "
+                  f"{r['peak_memory_MB']:>8.2f} {r['lock_contended']:>9.2%} {r['lock_wait_sec']:>8.3f}")
+
+    return results
+
+
+def _output_elements(layer):
+    """
+    Number of elements of the output(s) of a layer for a single data point
+    """
+    try:
+        output_shape = layer.output_shape
+    except AttributeError:  # layer has multiple inbound nodes
+        output_shape = layer.get_output_shape_at(0)
+    if not isinstance(output_shape, list):
+        output_shape = [output_shape]
+    return sum(int(np.prod([dim for dim in shape[1:] if dim is not None])) for shape in output_shape)
+
+
+def _activation_elements(model, multiplier=1):
+    """
+    Analytic upper bound of number of activation elements of a Keras model for a single data point, Monte Carlo
+    inference models are taken into account by counting the inner model as many times as it is repeated
+    """
+    from astroNN.config import keras_import_manager
+    from astroNN.nn.layers import FastMCBlockMeanVar
+    keras = keras_import_manager()
+
+    elements = 0
+    for layer in model.layers:
+        if isinstance(layer, keras.Model):
+            elements += _activation_elements(layer, multiplier)
+        elif isinstance(layer, keras.layers.TimeDistributed) and isinstance(layer.layer, keras.Model):
+            elements += _activation_elements(layer.layer, multiplier * layer.output_shape[1])
+        elif isinstance(layer, FastMCBlockMeanVar):
+            elements += _activation_elements(layer.layer, multiplier * layer.block_size)
+        else:
+            elements += multiplier * _output_elements(layer)
+    return elements
+
+
+def inference_batch_size_benchmark(model, memory_budget=None, min_batch_size=16, max_batch_size=4096, steps=3,
+                                   verbose=True):
+    """
+    Probe increasing batch sizes (power of 2) of a Keras model on synthetic inputs to find the throughput-optimal
+    inference batch size. Probing stops once the analytic memory estimate exceeds the memory budget or running out of
+    memory
+
+    :param model: Keras model used for inference
+    :type model: keras.Model
+    :param memory_budget: Memory budget in MB, None for no limit
+    :type memory_budget: Union[NoneType, float]
+    :param min_batch_size: Minimum batch size to be probed
+    :type min_batch_size: int
+    :param max_batch_size: Maximum batch size to be probed
+    :type max_batch_size: int
+    :param steps: Number of timed inference for each batch size
+    :type steps: int
+    :param verbose: Whether to print the result table
+    :type verbose: bool
+    :return: List of dictionary of results, one for each batch size probed
+    :rtype: list
+    """
+    import tensorflow as tf
+
+    weights_bytes = model.count_params() * 4  # float32
+    input_shape = model.input_shape[1:]
+    bytes_per_data = (int(np.prod(input_shape)) + _activation_elements(model)) * 4
+
+    results = []
+    batch_size = min_batch_size
+    while batch_size <= max_batch_size:
+        estimated_MB = (weights_bytes + batch_size * bytes_per_data) / 1024 ** 2
+        if memory_budget is not None and estimated_MB > memory_budget:
+            break
+        x = np.random.normal(0., 1., (batch_size, *input_shape)).astype(np.float32)
+        try:
+            model.predict(x, batch_size=batch_size)  # warm up
+            start_time = time.perf_counter()
+            for _ in range(steps):
+                model.predict(x, batch_size=batch_size)
+            elapsed = time.perf_counter() - start_time
+        except (tf.errors.ResourceExhaustedError, MemoryError):
+            break
+        results.append({'batch_size': batch_size, 'data_per_sec': batch_size * steps / elapsed,
+                        'estimated_memory_MB': estimated_MB})
+        batch_size *= 2
+
+    if len(results) == 0:
+        raise MemoryError(f'Batch size of {min_batch_size} already exceeds memory budget of {memory_budget}MB')
+
+    if verbose is True:
+        print(f"{'batch':>6} {'data/s':>10} {'memory MB':>10}")
+        for r in results:
+            print(f"{r['batch_size']:>6} {r['data_per_sec']:>10.2f} {r['estimated_memory_MB']:>10.2f}")
+
+    return results
+
+
+def import_time_benchmark(modules=('astroNN', 'astroNN.apogee', 'astroNN.apogee.chips', 'astroNN.gaia',
+                                   'astroNN.datasets', 'astroNN.models', 'astroNN.models.batch_predict'),
+                          repeat=3, verbose=True):
+    """
+    Measure the time to import astroNN modules and which heavy dependencies are loaded by the import, every import is
+    done in a fresh Python interpreter so nothing is cached by previous imports
+
+    :param modules: Modules to be benchmarked
+    :type modules: Union[tuple, list]
+    :param repeat: Number of fresh interpreters for each module, the fastest import time is reported
+    :type repeat: int
+    :param verbose: Whether to print the result table
+    :type verbose: bool
+    :return: List of dictionary of results, one for each module
+    :rtype: list
+    """
+    code = ('import json, sys, time; start_time = time.perf_counter(); import {module}; '
+            'print(json.dumps([time.perf_counter() - start_time, [m for m in {heavy} if m in sys.modules]]))')
+
+    results = []
+    for module in modules:
+        import_times = []
+        for i in range(repeat):
+            output = subprocess.run([sys.executable, '-c', code.format(module=module, heavy=_HEAVY_MODULES)],
+                                    stdout=subprocess.PIPE, check=True, universal_newlines=True).stdout
+            # only the last line is the result, importing some modules prints warnings
+            import_time, heavy_modules = json.loads(output.strip().splitlines()[-1])
+            import_times.append(import_time)
+        results.append({'module': module, 'import_sec': min(import_times), 'heavy_modules': heavy_modules})
+
+    if verbose is True:
+        print(f"{'module':>30} {'import(s)':>9}  heavy dependencies")
+        for r in results:
+            print(f"{r['module']:>30} {r['import_sec']:>9.3f}  {', '.join(r['heavy_modules'])}")
+
+    return results
@@ -34,24 +34,81 @@ def threadsafe_generator(f):
 
 
 class GeneratorMaster(ABC):
-    """Top-level class for a generator"""
+    """
+    Top-level class for a generator
+
+    :param batch_size: Batch size
+    :type batch_size: int
+    :param shuffle: False for no shuffling, True for fully random shuffling, 'chunk' for locality-aware shuffling
+    :type shuffle: Union[bool, str]
+    :param chunk_size: Number of contiguous indices shuffled together as a block if shuffle='chunk', default to
+                       batch_size
+    :type chunk_size: Union[NoneType, int]
+    :param buffer_size: Number of chunks mixed together in a shuffle buffer if shuffle='chunk'
+    :type buffer_size: int
+    :History:
+        | 2017-Dec-02 - Written - Henry Leung (University of Toronto)
+    """
 
-    def __init__(self, batch_size, shuffle=False):
+    def __init__(self, batch_size, shuffle=False, chunk_size=None, buffer_size=16):
+        if shuffle not in [True, False, 'chunk']:
+            raise ValueError(f"Unknown shuffle strategy -> {shuffle}, only True, False or 'chunk' are supported")
         self.batch_size = batch_size
         self.shuffle = shuffle
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
 
     def _get_exploration_order(self, idx_list):
         """
-        :param idx_list:
-        :return:
+        :param idx_list: List of indices to explore
+        :type idx_list: Union[range, ndarray]
+        :return: Indices in exploration order
+        :rtype: ndarray
         """
         # shuffle (if applicable) and find exploration order
         indexes = np.copy(idx_list)
         if self.shuffle is True:
             np.random.shuffle(indexes)
+        elif self.shuffle == 'chunk':
+            indexes = self._chunk_shuffle(indexes)
+        elif self.shuffle is not False:
+            raise ValueError(f"Unknown shuffle strategy -> {self.shuffle}, only True, False or 'chunk' are supported")
 
         return indexes
 
+    def _chunk_shuffle(self, indexes):
+        """
+        Locality-aware shuffling, designed for data on disk (e.g. h5 or memmap) where random single-row read is slow
+
+        | 1. Split indices into contiguous chunks and shuffle the order of chunks
+        | 2. Shuffle indices within a buffer of ``buffer_size`` consecutive chunks
+        | 3. Sort indices within every batch so each batch reads near-sequentially from storage
+
+        :param indexes: Indices in original order
+        :type indexes: ndarray
+        :return: Indices in exploration order
+        :rtype: ndarray
+        """
+        chunk_size = self.batch_size if self.chunk_size is None else self.chunk_size
+        if chunk_size < 1 or self.buffer_size < 1:
+            raise ValueError('chunk_size and buffer_size must be positive integers')
+
+        # shuffle at chunk granularity
+        chunks = [indexes[i:i + chunk_size] for i in range(0, len(indexes), chunk_size)]
+        chunk_order = np.random.permutation(len(chunks))
+
+        # shuffle within a bounded buffer of chunks
+        buffer_len = chunk_size * self.buffer_size
+        shuffled = np.concatenate([chunks[i] for i in chunk_order]) if len(chunks) > 0 else indexes
+        for i in range(0, len(shuffled), buffer_len):
+            np.random.shuffle(shuffled[i:i + buffer_len])
+
+        # sort indices inside each batch so gathering a batch is near-sequential I/O
+        for i in range(0, len(shuffled), self.batch_size):
+            shuffled[i:i + self.batch_size] = np.sort(shuffled[i:i + self.batch_size])
+
+        return shuffled
+
     def sparsify(self, y):
         """Returns labels in binary NumPy array"""
         # n_classes =  # Enter number of classes
@@ -34,12 +34,36 @@ class Normalizer(object):
         self._custom_norm_func = None
         self._custom_denorm_func = None
 
-    def mode_checker(self, data):
+        # running statistics for streaming mode, see partial_fit() and finalize()
+        self._running_count = None
+        self._running_mean = None
+        self._running_m2 = None
 
-        if data.ndim == 1:
-            data_array = np.expand_dims(data, 1)
-        else:
+    def mode_checker(self, data, out=None):
+        """
+        Set up normalization flags according to the mode and prepare a floating point array to work on
+
+        :param data: Data
+        :type data: ndarray
+        :param out: Optional array to work on in-place instead of making a copy of data, can be data itself
+        :type out: Union[NoneType, ndarray]
+        :return: Array to work on
+        :rtype: ndarray
+        """
+        if out is None:
             data_array = np.array(data)
+            # integer data cannot be normalized in-place
+            if not np.issubdtype(data_array.dtype, np.floating):
+                data_array = data_array.astype(np.float64)
+        else:
+            if not np.issubdtype(out.dtype, np.floating):
+                raise TypeError(f'out must be a floating point array, but got {out.dtype}')
+            if out is not data:
+                np.copyto(out, data)
+            data_array = out
+
+        if data_array.ndim == 1:
+            data_array = np.expand_dims(data_array, 1)
 
         self.normalization_mode = str(self.normalization_mode)  # just to prevent unnecessary type issue
         if self.normalization_mode == '0':
@@ -84,32 +108,62 @@ class Normalizer(object):
 
         return data_array
 
-    def normalize(self, data, calc=True):
-        data_array = self.mode_checker(data)
+    def _mode_message(self):
+        print(f'====Message from {self.__class__.__name__}====')
+        print(f'You selected mode: {self.normalization_mode}')
+        print(f'Featurewise Center: {self.featurewise_center}')
+        print(f'Datawise Center: {self.datasetwise_center}')
+        print(f'Featurewise std Center: {self.featurewise_stdalization}')
+        print(f'Datawise std Center: {self.datasetwise_stdalization}')
+        print('====Message ends====')
+
+    def normalize(self, data, calc=True, out=None):
+        """
+        Normalize data, data equal to magic number will not be touched
 
-        magic_mask = [(data_array == MAGIC_NUMBER)]
+        :param data: Data to be normalized
+        :type data: ndarray
+        :param calc: True to calculate mean and standard derivation from data, False to use the existing ones
+        :type calc: bool
+        :param out: Optional array to write the result, can be data itself to normalize in-place without any copy
+        :type out: Union[NoneType, ndarray]
+        :return: Normalized data
+        :rtype: ndarray
+        """
+        data_array = self.mode_checker(data, out=out)
+
+        magic_mask = (data_array == MAGIC_NUMBER)
+        has_magic = magic_mask.any()
 
         if calc is True:
-            print(f'====Message from {self.__class__.__name__}====')
-            print(f'You selected mode: {self.normalization_mode}')
-            print(f'Featurewise Center: {self.featurewise_center}')
-            print(f'Datawise Center: {self.datasetwise_center}')
-            print(f'Featurewise std Center: {self.featurewise_stdalization}')
-            print(f'Datawise std Center: {self.datasetwise_stdalization}')
-            print('====Message ends====')
+            self._mode_message()
+
+            # zero-fill magic number so statistics are calculated with plain reductions instead of masked array
+            if has_magic:
+                np.copyto(data_array, 0., where=magic_mask)
+                featurewise_count = magic_mask.shape[0] - np.count_nonzero(magic_mask, axis=0)
+            else:
+                featurewise_count = np.full(data_array.shape[1:], data_array.shape[0])
+            datasetwise_count = np.sum(featurewise_count)
+            # feature with magic number only
+            empty_feature = (featurewise_count == 0)
+            featurewise_count = np.maximum(featurewise_count, 1)
 
             if self.featurewise_center is True:
-                self.mean_labels = np.ma.array(data_array, mask=magic_mask).mean(axis=0)
+                self.mean_labels = data_array.sum(axis=0, dtype=np.float64) / featurewise_count
                 data_array -= self.mean_labels
             elif self.datasetwise_center is True:
-                self.mean_labels = np.ma.array(data_array, mask=magic_mask).mean()
+                self.mean_labels = data_array.sum(dtype=np.float64) / datasetwise_count
                 data_array -= self.mean_labels
 
-            if self.featurewise_stdalization is True:
-                self.std_labels = np.ma.array(data_array, mask=magic_mask).std(axis=0)
-                data_array /= self.std_labels
-            elif self.datasetwise_stdalization is True:
-                self.std_labels = np.ma.array(data_array, mask=magic_mask).std()
+            if self.featurewise_stdalization is True or self.datasetwise_stdalization is True:
+                if has_magic:
+                    np.copyto(data_array, 0., where=magic_mask)
+                sum_sq = np.einsum('i...,i...->...', data_array, data_array, dtype=np.float64)
+                if self.featurewise_stdalization is True:
+                    self.std_labels = np.where(empty_feature, 1., np.sqrt(sum_sq / featurewise_count))
+                else:
+                    self.std_labels = np.sqrt(np.sum(sum_sq) / datasetwise_count)
                 data_array /= self.std_labels
 
             if self.normalization_mode == '255':
@@ -120,23 +174,99 @@ class Normalizer(object):
             data_array /= self.std_labels
 
         if self._custom_norm_func is not None:
-            data_array = self._custom_norm_func(data_array)
+            np.copyto(data_array, self._custom_norm_func(data_array))
 
-        np.place(data_array, magic_mask, MAGIC_NUMBER)
+        if has_magic:
+            np.copyto(data_array, MAGIC_NUMBER, where=magic_mask)
 
         return data_array
 
-    def denormalize(self, data):
-        data_array = self.mode_checker(data)
+    def denormalize(self, data, out=None):
+        """
+        Denormalize data, data equal to magic number will not be touched
+
+        :param data: Data to be denormalized
+        :type data: ndarray
+        :param out: Optional array to write the result, can be data itself to denormalize in-place without any copy
+        :type out: Union[NoneType, ndarray]
+        :return: Denormalized data
+        :rtype: ndarray
+        """
+        data_array = self.mode_checker(data, out=out)
 
-        magic_mask = [data_array == MAGIC_NUMBER]
+        magic_mask = (data_array == MAGIC_NUMBER)
+        has_magic = magic_mask.any()
 
         if self._custom_denorm_func is not None:
-            data_array = self._custom_denorm_func(data_array)
+            np.copyto(data_array, self._custom_denorm_func(data_array))
 
         data_array *= self.std_labels
         data_array += self.mean_labels
 
-        np.place(data_array, magic_mask, MAGIC_NUMBER)
+        if has_magic:
+            np.copyto(data_array, MAGIC_NUMBER, where=magic_mask)
 
         return data_array
+
+    def partial_fit(self, data):
+        """
+        Accumulate statistics from a chunk of data in a single streaming pass, magic number is ignored.
+        Call finalize() after all chunks are seen, then normalize(data, calc=False) can be used
+
+        :param data: A chunk of data, first axis is the data point axis
+        :type data: ndarray
+        :return: None
+        :rtype: NoneType
+        """
+        data_array = self.mode_checker(data)
+        valid = (data_array != MAGIC_NUMBER)
+
+        # statistics of this chunk
+        count = np.sum(valid, axis=0)
+        safe_count = np.maximum(count, 1)
+        mean = np.sum(np.where(valid, data_array, 0.), axis=0) / safe_count
+        m2 = np.sum(np.where(valid, np.square(data_array - mean), 0.), axis=0)
+
+        if self._running_count is None:
+            self._running_count, self._running_mean, self._running_m2 = count, mean, m2
+        else:
+            # merge with running statistics (Chan et al. parallel variant of Welford's algorithm)
+            total_count = self._running_count + count
+            safe_total = np.maximum(total_count, 1)
+            delta = mean - self._running_mean
+            self._running_mean = self._running_mean + delta * count / safe_total
+            self._running_m2 = self._running_m2 + m2 + np.square(delta) * self._running_count * count / safe_total
+            self._running_count = total_count
+
+        return None
+
+    def finalize(self):
+        """
+        Compute mean and standard derivation from statistics accumulated by partial_fit()
+
+        :return: None
+        :rtype: NoneType
+        """
+        if self._running_count is None:
+            raise ValueError('No data has been seen, please call partial_fit() at least once before finalize()')
+
+        self._mode_message()
+
+        count, mean, m2 = self._running_count, self._running_mean, self._running_m2
+        seen = count > 0
+
+        if self.featurewise_center is True:
+            self.mean_labels = np.where(seen, mean, 0.)
+        elif self.datasetwise_center is True:
+            self.mean_labels = np.sum(count * mean) / np.sum(count)
+
+        if self.featurewise_stdalization is True:
+            self.std_labels = np.where(seen, np.sqrt(m2 / np.maximum(count, 1)), 1.)
+        elif self.datasetwise_stdalization is True:
+            # total sum of squares = within features + between features
+            dataset_mean = np.sum(count * mean) / np.sum(count)
+            self.std_labels = np.sqrt((np.sum(m2) + np.sum(count * np.square(mean - dataset_mean))) / np.sum(count))
+
+        self._running_count, self._running_mean, self._running_m2 = None, None, None
+
+        return None
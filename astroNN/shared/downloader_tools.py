@@ -3,6 +3,7 @@
 # ---------------------------------------------------------#
 
 import hashlib
+import os
 
 from tqdm import tqdm
 
@@ -93,3 +94,41 @@ def md5_checksum(filename, block_size=global_block_size):
         for block in iter(lambda: f.read(block_size), b''):
             md5.update(block)
     return md5.hexdigest()
+
+
+def cache_size_limit(folder, max_size=None, keep=None):
+    """
+    NAME:
+        cache_size_limit
+    PURPOSE:
+        Delete least recently used files in a cache folder until the total size is within the limit
+    INPUT:
+        folder (path): cache folder
+        max_size (float): maximum total size in MB, None for no limit
+        keep (path): file which will never be deleted, e.g. the file just downloaded
+    OUTPUT:
+        deleted files (list)
+    """
+    deleted = []
+    if max_size is None or not os.path.isdir(folder):
+        return deleted
+
+    files = []
+    for root, dirs, filenames in os.walk(folder):
+        for filename in filenames:
+            path = os.path.join(root, filename)
+            stat = os.stat(path)
+            # access time is not updated on some file system, use modification time if it is later
+            files.append((max(stat.st_atime, stat.st_mtime), stat.st_size, path))
+
+    total_size = sum(size for last_used, size, path in files)
+    for last_used, size, path in sorted(files):
+        if total_size <= max_size * 1024 ** 2:
+            break
+        if keep is not None and os.path.abspath(path) == os.path.abspath(keep):
+            continue
+        os.remove(path)
+        deleted.append(path)
+        total_size -= size
+
+    return deleted
@@ -0,0 +1,53 @@
+# ---------------------------------------------------------#
+#   astroNN.shared.lazy_import: lazy import of package attributes
+# ---------------------------------------------------------#
+import importlib
+import sys
+import types
+
+
+class _LazyModule(types.ModuleType):
+    """
+    Package module type importing attributes from their submodules on first access
+    """
+    def __getattr__(self, name):
+        try:
+            path = self._lazy_attributes[name]
+        except KeyError:
+            raise AttributeError(f"module '{self.__name__}' has no attribute '{name}'") from None
+        module_name, attr_name = path.rsplit('.', 1)
+        value = getattr(importlib.import_module(module_name), attr_name)
+        # cache it so the submodule is only looked up once
+        self.__dict__[name] = value
+        return value
+
+    def __setattr__(self, name, value):
+        # importing a submodule sets it as an attribute of the package, do not let it shadow a lazy attribute with the
+        # same name (e.g. astroNN.models.ApogeeCNN module and astroNN.models.ApogeeCNN class)
+        if name in self._lazy_attributes and isinstance(value, types.ModuleType) and \
+                value.__name__ == f'{self.__name__}.{name}':
+            return None
+        super().__setattr__(name, value)
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self._lazy_attributes))
+
+
+def lazy_import(package_name, attributes):
+    """
+    Make attributes of a package imported from their submodules on first access instead of when the package is
+    imported, so heavy dependencies like Tensorflow are only loaded when they are needed
+
+    :param package_name: Name of the package, i.e. __name__ in the package __init__
+    :type package_name: str
+    :param attributes: Dictionary of attribute name to full path of the object, e.g.
+                       {'ApogeeCNN': 'astroNN.models.ApogeeCNN.ApogeeCNN'}
+    :type attributes: dict
+    :return: None
+    :rtype: NoneType
+    """
+    module = sys.modules[package_name]
+    module._lazy_attributes = dict(attributes)
+    module.__class__ = _LazyModule
+
+    return None
@@ -4,9 +4,6 @@
 import datetime
 import os
 
-import tensorflow as tf
-from tensorflow.python.platform.test import is_built_with_cuda
-
 
 def cpu_fallback(flag=0):
     """
@@ -30,16 +27,20 @@ def cpu_fallback(flag=0):
         raise ValueError('Unknown flag, it can only either be 0 or 1!')
 
 
-def gpu_memory_manage(ratio=None, log_device_placement=False):
+def session_config(ratio=None, log_device_placement=False):
     """
-    To manage GPU memory usage, prevent Tensorflow preoccupied all the video RAM
+    Tensorflow session config with astroNN GPU memory management
 
-    :param ratio: Optional, ratio of GPU memory pre-allocating to astroNN
+    :param ratio: Optional, ratio of GPU memory pre-allocating to astroNN, None to dynamically allocate memory
     :type ratio: Union[NoneType, float]
     :param log_device_placement: whether or not log the device placement
     :type log_device_placement: bool
-    :History: 2017-Nov-25 - Written - Henry Leung (University of Toronto)
+    :return: Tensorflow session config
+    :rtype: tf.ConfigProto
     """
+    # import here so astroNN.config can be imported without Tensorflow
+    import tensorflow as tf
+
     config = tf.ConfigProto()
     if ratio is None:
         config.gpu_options.allow_growth = True
@@ -50,8 +51,24 @@ def gpu_memory_manage(ratio=None, log_device_placement=False):
         config.gpu_options.per_process_gpu_memory_fraction = ratio
     config.log_device_placement = log_device_placement
 
+    return config
+
+
+def gpu_memory_manage(ratio=None, log_device_placement=False):
+    """
+    To manage GPU memory usage, prevent Tensorflow preoccupied all the video RAM
+
+    :param ratio: Optional, ratio of GPU memory pre-allocating to astroNN
+    :type ratio: Union[NoneType, float]
+    :param log_device_placement: whether or not log the device placement
+    :type log_device_placement: bool
+    :History: 2017-Nov-25 - Written - Henry Leung (University of Toronto)
+    """
+    import tensorflow as tf
+
     # Set global _SESSION for tensorflow to use with astroNN cpu, GPU setting
-    tf.Session(config=config).__enter__()  # to register it as tensorflow default session
+    # to register it as tensorflow default session
+    tf.Session(config=session_config(ratio, log_device_placement)).__enter__()
 
     return None
 
@@ -64,6 +81,8 @@ def gpu_availability():
     :rtype: bool
     :History: 2018-Apr-25 - Written - Henry Leung (University of Toronto)
     """
+    from tensorflow.python.platform.test import is_built_with_cuda
+
     # assume if using tensorflow-gpu, then Nvidia GPU is available
     return is_built_with_cuda()
 
@@ -25,6 +25,8 @@ setup(
         "keras": ["keras>=2.1.5"],
         "tensorflow": ["tensorflow>=1.6.0"],
         "tensorflow-gpu": ["tensorflow-gpu>=1.6.0"]},
+    entry_points={
+        'console_scripts': ['astronn-predict=astroNN.models.batch_predict:main']},
     url='https://github.com/henrysky/astroNN',
     project_urls={
         "Bug Tracker": "https://github.com/henrysky/astroNN/issues",
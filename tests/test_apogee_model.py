@@ -1,10 +1,20 @@
+import json
+import os
 import unittest
+import urllib.request
 
+import h5py
 import numpy as np
 
-from astroNN.models import ApogeeCNN, ApogeeBCNN, StarNet2017, ApogeeCVAE
+from astroNN.models import ApogeeCNN, ApogeeBCNN, StarNet2017, ApogeeCVAE, DistilledBCNN, ModelEnsemble, ModelPool
 from astroNN.models import load_folder
+from astroNN.models.batch_predict import batch_predict
+from astroNN.models.server import InferenceServer
+from astroNN.config import keras_import_manager
 from astroNN.nn.callbacks import ErrorOnNaN
+from astroNN.nn.numpy_engine import NumpyModel
+
+get_session = keras_import_manager().backend.get_session
 
 # Data preparation, keep the data size large (>800 data points to prevent issues)
 random_xdata = np.random.normal(0, 1, (1000, 7514))
@@ -21,19 +31,110 @@ class ApogeeModelTestCase(unittest.TestCase):
         neuralnet.train(random_xdata, random_ydata)
         prediction = neuralnet.test(random_xdata)
         jacobian = neuralnet.jacobian(random_xdata[:10])
+        # jacobian graph should be built once and reused
+        num_ops = len(get_session().graph.get_operations())
+        np.testing.assert_array_almost_equal(neuralnet.jacobian(random_xdata[:10]), jacobian)
+        self.assertEqual(len(get_session().graph.get_operations()), num_ops)
+        # jacobian restricted to some labels and pixels should be a subset of the full jacobian
+        pixel_mask = np.zeros(random_xdata.shape[1], dtype=bool)
+        pixel_mask[1000:1100] = True
+        jacobian_subset = neuralnet.jacobian(random_xdata[:10], labels=[0, 3], pixel_mask=pixel_mask)
+        np.testing.assert_array_almost_equal(jacobian_subset, jacobian[:, [0, 3]][:, :, pixel_mask])
+        self.assertRaises(ValueError, neuralnet.jacobian, random_xdata[:10], pixel_mask=pixel_mask[:100])
+        # streaming jacobian to disk should give the same jacobian
+        neuralnet.jacobian_stream(random_xdata[:10], 'apogee_cnn_jacobian.h5', batch_size=4)
+        with h5py.File('apogee_cnn_jacobian.h5', 'r') as F:
+            np.testing.assert_array_almost_equal(np.squeeze(F['jacobian'][()]), jacobian)
+        neuralnet.jacobian_stream(random_xdata[:10], 'apogee_cnn_jacobian.npy', batch_size=4)
+        np.testing.assert_array_almost_equal(np.squeeze(np.load('apogee_cnn_jacobian.npy')), jacobian)
+        self.assertRaises(ValueError, neuralnet.jacobian_stream, random_xdata[:0], 'apogee_cnn_jacobian_empty.npy')
+        # percentiles are exact if reservoir is large enough
+        summary = neuralnet.jacobian_summary(random_xdata[:10], batch_size=4, reservoir_size=10)
+        np.testing.assert_array_almost_equal(summary['mean'], np.mean(jacobian, axis=0))
+        np.testing.assert_array_almost_equal(summary['std'], np.std(jacobian, axis=0))
+        np.testing.assert_array_almost_equal(summary['percentiles'], np.percentile(jacobian, (16, 50, 84), axis=0))
 
         np.testing.assert_array_equal(prediction.shape, random_ydata.shape)
         np.testing.assert_array_equal(jacobian.shape, [random_xdata[:10].shape[0], random_ydata.shape[1],
                                                        random_xdata.shape[1]])
         neuralnet.save(name='apogee_cnn')
+        # tuned inference batch size should be persisted in the folder
+        inference_batch_size = neuralnet.tune_inference_batch_size(max_batch_size=64, steps=1)
+        self.assertIn(inference_batch_size, [16, 32, 64])
 
         neuralnet_loaded = load_folder("apogee_cnn")
+        self.assertEqual(neuralnet_loaded.inference_batch_size, inference_batch_size)
         neuralnet_loaded.max_epochs = 1
         neuralnet_loaded.callbacks = ErrorOnNaN()
         prediction_loaded = neuralnet_loaded.test(random_xdata)
 
         # Apogee_CNN is deterministic
         np.testing.assert_array_equal(prediction, prediction_loaded)
+        # reassigned normalization statistics should be used without compile()
+        labels_mean = neuralnet_loaded.labels_mean
+        neuralnet_loaded.labels_mean = labels_mean + 1.
+        np.testing.assert_array_almost_equal(neuralnet_loaded.test(random_xdata[:10]), prediction[:10] + 1., decimal=4)
+        neuralnet_loaded.labels_mean = labels_mean
+        # inference only model should give the same prediction
+        np.testing.assert_array_almost_equal(load_folder("apogee_cnn", inference_only=True).test(random_xdata),
+                                             prediction)
+
+        # pooled model should be loaded once and reloaded when its folder is modified
+        with ModelPool(max_models=1) as pool:
+            pooled_model = pool.load_folder("apogee_cnn")
+            self.assertIs(pool.load_folder("apogee_cnn"), pooled_model)
+            self.assertEqual((pool.hits, pool.misses), (1, 1))
+            np.testing.assert_array_almost_equal(pooled_model.test(random_xdata[:100]), prediction[:100])
+            # the least recently used model should be evicted
+            pool.load_folder("apogee_cnn", inference_only=False)
+            self.assertEqual(len(pool), 1)
+            with self.assertRaises(RuntimeError):
+                pooled_model.test(random_xdata[:100])
+            os.utime(os.path.join("apogee_cnn", "model_weights.h5"), ns=(0, 0))
+            pool.load_folder("apogee_cnn", inference_only=False)
+            self.assertEqual(pool.misses, 3)
+        self.assertEqual(len(pool), 0)
+
+        # numpy engine should reproduce the prediction without Tensorflow
+        numpy_model = NumpyModel(neuralnet_loaded.export_numpy())
+        np.testing.assert_array_almost_equal(numpy_model.test(random_xdata[:100]), prediction[:100], decimal=3)
+
+        # ensemble should average over every member, including the same folder used twice
+        neuralnet_loaded.train(random_xdata, random_ydata)
+        neuralnet_loaded.save(name='apogee_cnn_2')
+        members_pred = np.stack([prediction[:100], neuralnet_loaded.test(random_xdata[:100]), prediction[:100]])
+        with ModelEnsemble(['apogee_cnn', 'apogee_cnn_2', 'apogee_cnn']) as ensemble:
+            ensemble_pred, ensemble_pred_err = ensemble.test(random_xdata[:100], chunk_size=64)
+        np.testing.assert_array_almost_equal(ensemble_pred, np.mean(members_pred, axis=0), decimal=4)
+        np.testing.assert_array_almost_equal(ensemble_pred_err['ensemble'], np.std(members_pred, axis=0), decimal=4)
+        self.assertTrue(np.all(ensemble_pred_err['ensemble'] > 0))
+
+        # inference server should serve the loaded weights from its batching thread
+        with InferenceServer("apogee_cnn", max_batch_size=16) as server:
+            request = urllib.request.Request(f'http://{server.host}:{server.port}/predict',
+                                             data=json.dumps({'x': random_xdata[:10].tolist()}).encode('utf-8'))
+            with urllib.request.urlopen(request) as response:
+                served_pred = json.loads(response.read().decode('utf-8'))['prediction']
+        np.testing.assert_array_almost_equal(served_pred, prediction[:10], decimal=4)
+
+        # batch inference over compiled h5 should resume at the last completed chunk
+        with h5py.File('apogee_cnn_input.h5', 'w') as F:
+            F.create_dataset('spectra', data=random_xdata[:100])
+            F.create_dataset('index', data=np.arange(100))
+        self.assertEqual(batch_predict('apogee_cnn', 'apogee_cnn_input.h5', 'apogee_cnn_output.h5', chunk_size=32), 100)
+        with h5py.File('apogee_cnn_output.h5', 'r+') as F:
+            np.testing.assert_array_almost_equal(F['prediction'][()], prediction[:100], decimal=4)
+            np.testing.assert_array_equal(F['index'][()], np.arange(100))
+            # pretend the job was killed after the second chunk
+            F.attrs['num_completed'] = 64
+            F['prediction'][64:] = 0.
+        self.assertEqual(batch_predict(neuralnet_loaded, 'apogee_cnn_input.h5', 'apogee_cnn_output.h5',
+                                       chunk_size=32), 36)
+        with h5py.File('apogee_cnn_output.h5', 'r') as F:
+            np.testing.assert_array_almost_equal(F['prediction'][()], prediction[:100], decimal=4)
+        # resuming with different chunk size should raise error
+        self.assertRaises(ValueError, batch_predict, neuralnet_loaded, 'apogee_cnn_input.h5', 'apogee_cnn_output.h5',
+                          chunk_size=16)
 
         # Fine tuning test
         neuralnet_loaded.train(random_xdata, random_ydata)
@@ -56,8 +157,15 @@ class ApogeeModelTestCase(unittest.TestCase):
         # prevent memory issue on Tavis CI
         bneuralnet.mc_num = 3
         prediction, prediction_err = bneuralnet.test(random_xdata)
+        # Monte Carlo inference model should be reused across test() calls
+        self.assertIs(bneuralnet._mc_model(), bneuralnet._mc_model())
         bneuralnet.plot_dense_stats()
         jacobian = bneuralnet.jacobian(random_xdata[:10], mean_output=True)
+        # every Monte Carlo realization should draw its own dropout masks
+        jacobian_mc = bneuralnet.jacobian(random_xdata[:10], mc_num=4)
+        np.testing.assert_array_equal(jacobian_mc.shape, [10, random_ydata.shape[1], random_xdata.shape[1]])
+        self.assertRaises(AssertionError, np.testing.assert_array_equal, jacobian_mc,
+                          bneuralnet.jacobian(random_xdata[:10], mc_num=4))
 
         np.testing.assert_array_equal(prediction.shape, random_ydata.shape)
         bneuralnet.save(name='apogee_bcnn')
@@ -72,6 +180,68 @@ class ApogeeModelTestCase(unittest.TestCase):
         pred, pred_err = bneuralnet_loaded.test(random_xdata)
         bneuralnet_loaded.aspcap_residue_plot(pred, pred, pred_err['total'])
         bneuralnet_loaded.jacobian_aspcap(jacobian)
+        bneuralnet_inference = load_folder("apogee_bcnn", inference_only=True)
+        bneuralnet_inference.mc_num = 3
+        pred_inference, pred_err_inference = bneuralnet_inference.test(random_xdata)
+        np.testing.assert_array_equal(pred_inference.shape, random_ydata.shape)
+        np.testing.assert_array_equal(pred_err_inference['total'].shape, random_ydata.shape)
+
+        # numpy engine should run Monte Carlo dropout without Tensorflow
+        numpy_model = NumpyModel(bneuralnet_loaded.export_numpy('apogee_bcnn.npz'))
+        numpy_pred, numpy_pred_err = numpy_model.test(random_xdata[:50])
+        np.testing.assert_array_equal(numpy_pred.shape, [50, random_ydata.shape[1]])
+        np.testing.assert_array_equal(numpy_pred_err['total'].shape, [50, random_ydata.shape[1]])
+        # with dropout disabled on both sides, numpy engine should reproduce the Tensorflow prediction
+        bneuralnet_inference.disable_dropout = True
+        bneuralnet_inference.mc_num = 1
+        bneuralnet_inference.compile(inference_only=True)
+        bneuralnet_inference.keras_model.load_weights(os.path.join("apogee_bcnn", "model_weights.h5"))
+        deterministic_pred, deterministic_pred_err = bneuralnet_inference.test(random_xdata[:50])
+        for layer in numpy_model.layers:
+            if layer['class_name'] == 'MCDropout':
+                layer['config']['disable'] = True
+        numpy_pred, numpy_pred_err = numpy_model.test(random_xdata[:50])
+        np.testing.assert_array_almost_equal(numpy_pred, deterministic_pred, decimal=3)
+        np.testing.assert_array_almost_equal(numpy_pred_err['predictive'], deterministic_pred_err['predictive'],
+                                             decimal=3)
+
+        # streaming inference should write results of every data point to h5
+        streamed_num = bneuralnet_loaded.test_stream(random_xdata, 'apogee_bcnn_stream.h5', chunk_size=300)
+        self.assertEqual(streamed_num, random_xdata.shape[0])
+        with h5py.File('apogee_bcnn_stream.h5', 'r') as F:
+            np.testing.assert_array_equal(F['prediction'].shape, random_ydata.shape)
+            np.testing.assert_array_equal(F['uncertainty_total'].shape, random_ydata.shape)
+
+        # adaptive Monte Carlo inference should stop between a block and mc_num forward passes
+        bneuralnet_loaded.mc_num = 6
+        bneuralnet_loaded.mc_block_size = 2
+        bneuralnet_loaded.mc_tol = 1e-2
+        pred, pred_err = bneuralnet_loaded.test(random_xdata)
+        np.testing.assert_array_equal(pred.shape, random_ydata.shape)
+        self.assertTrue(np.all(bneuralnet_loaded.mc_num_effective >= 2))
+        self.assertTrue(np.all(bneuralnet_loaded.mc_num_effective <= 6))
+        # data points never converged should reach mc_num even if it is not a multiple of the block size
+        bneuralnet_loaded.mc_num = 25
+        bneuralnet_loaded.mc_block_size = 10
+        bneuralnet_loaded.mc_tol = 0.
+        bneuralnet_loaded.test(random_xdata[:100])
+        np.testing.assert_array_equal(bneuralnet_loaded.mc_num_effective, np.full(100, 25))
+        bneuralnet_loaded.mc_tol = None
+        bneuralnet_loaded.mc_num = 3
+
+        # distill the Bayesian neural net into a deterministic student
+        student = DistilledBCNN()
+        student.max_epochs = 1
+        student.callbacks = ErrorOnNaN()
+        student.distill(bneuralnet_loaded, random_xdata)
+        student_pred, student_pred_err = student.test(random_xdata)
+        np.testing.assert_array_equal(student_pred.shape, random_ydata.shape)
+        np.testing.assert_array_equal(student_pred_err['total'].shape, random_ydata.shape)
+        student.save(name='apogee_bcnn_student')
+        student_loaded = load_folder('apogee_bcnn_student')
+        student_pred_loaded, _ = student_loaded.test(random_xdata)
+        # student is deterministic
+        np.testing.assert_array_almost_equal(student_pred, student_pred_loaded)
 
         # Fine-tuning test
         bneuralnet_loaded.max_epochs = 1
@@ -95,6 +265,8 @@ class ApogeeModelTestCase(unittest.TestCase):
 
         np.testing.assert_array_equal(prediction.shape, np.expand_dims(random_xdata, axis=-1).shape)
         np.testing.assert_array_equal(encoding.shape, [random_xdata.shape[0], cvae_net.latent_dim])
+        inference_batch_size = cvae_net.tune_inference_batch_size(max_batch_size=32, steps=1)
+        self.assertIn(inference_batch_size, [16, 32])
         cvae_net.save(name='apogee_cvae')
 
         # just to make sure it can load it back without error
@@ -132,6 +304,14 @@ class ApogeeModelTestCase(unittest.TestCase):
         starnet2017.callbacks = ErrorOnNaN()
         starnet2017_loaded.train(random_xdata, random_ydata)
 
+        # locality-aware chunk shuffling should be usable for training
+        starnet2017_loaded.shuffle = 'chunk'
+        starnet2017_loaded.shuffle_chunk_size = 16
+        starnet2017_loaded.shuffle_buffer_size = 4
+        starnet2017_loaded.train(random_xdata, random_ydata)
+        starnet2017_loaded.shuffle = 'random'
+        self.assertRaises(ValueError, starnet2017_loaded.train, random_xdata, random_ydata)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -4,7 +4,7 @@ import numpy as np
 import numpy.testing as npt
 
 from astroNN.apogee import gap_delete, apogee_default_dr, bitmask_decompositor, chips_split, bitmask_boolean, \
-    apogee_continuum
+    apogee_continuum, wavelength_solution, wavelength_windows_mask
 from astroNN.apogee.apogee_shared import apogeeid_digit
 
 
@@ -45,6 +45,13 @@ class ApogeeToolsCase(unittest.TestCase):
         self.assertEqual(np.concatenate((blue, green, red), axis=1).shape == (1, 7514), True)
         self.assertRaises(ValueError, lambda: chips_split(raw_spectra, dr=10))
 
+        # wavelength windows mask
+        lambda_blue, lambda_green, lambda_red = wavelength_solution()
+        mask = wavelength_windows_mask([(lambda_blue[0], lambda_blue[9]), (lambda_red[-5], lambda_red[-1])])
+        self.assertEqual(mask.shape, (7514,))
+        self.assertEqual(np.sum(mask), 15)
+        self.assertTrue(np.all(mask[:10]) and np.all(mask[-5:]))
+
     def test_apogee_continuum(self):
         raw_spectra = np.ones((10, 8575)) * 2
         raw_spectra_err = np.zeros((10, 8575))
@@ -231,6 +231,78 @@ class LayerCase(unittest.TestCase):
         # make sure accelerated model has no variance (uncertainty) on deterministic model prediction
         self.assertAlmostEqual(np.sum(sy[:, :, 1]), 0.)
 
+        # block mode should give the same result on deterministic model, including the remainder block
+        block_model = FastMCInference(10, block_size=3)(model)
+        z = block_model.predict(random_xdata)
+        npt.assert_array_almost_equal(z, y, decimal=4)
+
+    def test_split_deterministic_trunk(self):
+        print('==========Deterministic trunk tests==========')
+        from astroNN.nn.layers import FastMCInference, MCDropout, split_deterministic_trunk
+
+        # Data preparation
+        random_xdata = np.random.normal(0, 1, (100, 7514))
+
+        # dropout disabled so the result is deterministic but the layer still counts as stochastic
+        input = Input(shape=[7514])
+        dense = Dense(100)(input)
+        b_dropout = MCDropout(0.2, disable=True)(dense)
+        output = Dense(25)(Dense(50)(b_dropout))
+        model = Model(inputs=input, outputs=output)
+
+        trunk_model, suffix_model = split_deterministic_trunk(model)
+        # trunk should stop right before the dropout
+        self.assertEqual(trunk_model.output_shape, (None, 100))
+        self.assertEqual(suffix_model.input_shape, (None, 100))
+        npt.assert_array_almost_equal(suffix_model.predict(trunk_model.predict(random_xdata)),
+                                      model.predict(random_xdata), decimal=4)
+
+        # Monte Carlo inference with trunk reuse should give the same result
+        acc_model = FastMCInference(10)(model)
+        npt.assert_array_almost_equal(acc_model.predict(random_xdata)[:, :, 0], model.predict(random_xdata), decimal=4)
+
+        # deterministic model cannot be split
+        det_model = Model(inputs=input, outputs=Dense(25)(dense))
+        self.assertEqual(split_deterministic_trunk(det_model), None)
+
+    def test_NormalizeLayer(self):
+        print('==========NormalizeLayer tests==========')
+        from astroNN.nn.layers import NormalizeLayer, DenormalizeLayer
+        from astroNN.nn.utilities.normalizer import Normalizer
+        from astroNN.config import MAGIC_NUMBER
+
+        # Data preparation
+        random_xdata = np.random.normal(0, 1, (100, 7514))
+        random_xdata[10, 5] = MAGIC_NUMBER
+
+        for mode in [2, '3s']:
+            normer = Normalizer(mode=mode)
+            norm_data = normer.normalize(random_xdata)
+
+            input = Input(shape=[7514])
+            normalized = NormalizeLayer(normer.mean_labels, normer.std_labels, mode=mode)(input)
+            norm_model = Model(inputs=input, outputs=normalized)
+            denormalized = DenormalizeLayer(normer.mean_labels, normer.std_labels, mode=mode)(input)
+            denorm_model = Model(inputs=input, outputs=denormalized)
+
+            # make sure the layers are equivalent to Normalizer and preserve magic number
+            x = norm_model.predict(random_xdata)
+            npt.assert_array_almost_equal(x, norm_data, decimal=4)
+            self.assertEqual(x[10, 5], MAGIC_NUMBER)
+            y = denorm_model.predict(x)
+            npt.assert_array_almost_equal(y, random_xdata, decimal=3)
+            self.assertEqual(y[10, 5], MAGIC_NUMBER)
+
+            # configuration should round-trip so the layers can be saved and loaded
+            config = norm_model.get_layer(index=1).get_config()
+            self.assertEqual(config['mode'], str(mode))
+            npt.assert_array_almost_equal(config['mean'], normer.mean_labels)
+            npt.assert_array_almost_equal(config['std'], normer.std_labels)
+            restored_config = NormalizeLayer.from_config(config).get_config()
+            self.assertEqual(restored_config['mode'], config['mode'])
+            npt.assert_array_equal(restored_config['mean'], config['mean'])
+            npt.assert_array_equal(restored_config['std'], config['std'])
+
 
 if __name__ == '__main__':
     unittest.main()
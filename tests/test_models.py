@@ -132,11 +132,51 @@ class Models_TestCase(unittest.TestCase):
         self.assertRaises(FileNotFoundError, load_folder, astroNN_CACHE_DIR)
         self.assertRaises(IOError, load_folder, 'i_am_not_a_fodler')
 
+    def test_model_registry(self):
+        import os
+        import sys
+        import tempfile
+        from astroNN.models import register_model, registered_models
+        from astroNN.models.registry import find_model
+
+        # built-in models should be registered without importing them
+        self.assertIn('ApogeeBCNN', registered_models())
+        self.assertIs(find_model('Cifar10CNN'), Cifar10CNN)
+
+        @register_model('RegistryTest_Alias')
+        class RegistryTest(Cifar10CNN):
+            pass
+
+        self.assertIs(find_model('RegistryTest_Alias'), RegistryTest)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(os.path.join(tmp_dir, 'registry_test_models.py'), 'w') as f:
+                f.write('class RegistryTest_Custom(object):\n    pass\n')
+            with open(os.path.join(tmp_dir, 'registry_test_broken.py'), 'w') as f:
+                f.write('raise RuntimeError("should not be imported")\n')
+            # models imported from other modules or defined with annotations should be found too
+            with open(os.path.join(tmp_dir, 'registry_test_reexport.py'), 'w') as f:
+                f.write('from registry_test_models import RegistryTest_Custom as RegistryTest_Reexported\n'
+                        'RegistryTest_Annotated: type = RegistryTest_Reexported\n')
+            paths = [os.path.join(tmp_dir, f) for f in sorted(os.listdir(tmp_dir))]
+            # only the file defining the identifier should be imported
+            self.assertEqual(find_model('RegistryTest_Custom', search_paths=paths).__name__, 'RegistryTest_Custom')
+            self.assertEqual(find_model('RegistryTest_Reexported', search_paths=paths).__name__, 'RegistryTest_Custom')
+            self.assertEqual(find_model('RegistryTest_Annotated', search_paths=paths).__name__, 'RegistryTest_Custom')
+            # custom model file named like another module should not replace it
+            with open(os.path.join(tmp_dir, 'json.py'), 'w') as f:
+                f.write('class RegistryTest_Json(object):\n    pass\n')
+            json_module = sys.modules['json']
+            self.assertEqual(find_model('RegistryTest_Json', search_paths=[os.path.join(tmp_dir, 'json.py')]).__name__,
+                             'RegistryTest_Json')
+            self.assertIs(sys.modules['json'], json_module)
+            self.assertRaises(TypeError, find_model, 'RegistryTest_Unknown', search_paths=paths)
+
     def test_custom_model(self):
         import shutil
         import os
         import astroNN
-        from astroNN.config import config_path
+        from astroNN.config import config_path, CONFIG
 
         test_config_path = os.path.join(os.path.dirname(astroNN.__path__[0]), 'tests', 'config.ini')
         astroNN_config_path = config_path()
@@ -147,6 +187,8 @@ class Models_TestCase(unittest.TestCase):
         test_modelsource_path = os.path.join(os.path.dirname(astroNN.__path__[0]), 'tests', 'custom_model',
                                              'custom_models.py')
         shutil.copy(test_modelsource_path, os.path.join('/home/travis/build/henrysky', 'custom_models.py'))
+        # configuration is cached, reload it to pick up the custom model path
+        CONFIG.reload()
 
         import sys
         from importlib import import_module
@@ -19,6 +19,24 @@ class UtilitiesTestCase(unittest.TestCase):
         self.assertEqual(sha1_pred, '733C0227CF93DB0CD6106B5349402F251E7ED735'.lower())
         self.assertEqual(sha256_pred, '36C265C907F440114D747DA21D2A014D32B5E442D541F183C0EE862F5865FD26'.lower())
 
+    def test_cache_size_limit(self):
+        import tempfile
+        import time
+        from astroNN.shared.downloader_tools import cache_size_limit
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            for i, name in enumerate(['old', 'middle', 'new']):
+                path = os.path.join(tmp_dir, name)
+                with open(path, 'wb') as f:
+                    f.write(b'0' * 1024 ** 2)
+                os.utime(path, (time.time() + i, time.time() + i))
+            # no limit
+            self.assertEqual(cache_size_limit(tmp_dir, None), [])
+            # least recently used file should be deleted first but never the one to keep
+            deleted = cache_size_limit(tmp_dir, 1.5, keep=os.path.join(tmp_dir, 'old'))
+            self.assertEqual(deleted, [os.path.join(tmp_dir, 'middle'), os.path.join(tmp_dir, 'new')])
+            self.assertEqual(os.listdir(tmp_dir), ['old'])
+
     def test_normalizer(self):
         from astroNN.nn.utilities.normalizer import Normalizer
         from astroNN.config import MAGIC_NUMBER
@@ -41,6 +59,32 @@ class UtilitiesTestCase(unittest.TestCase):
         self.assertEqual(data_denorm[magic_idx], MAGIC_NUMBER)
         npt.assert_array_almost_equal(data_denorm, data)
 
+        # streaming statistics should be the same as computing on the whole dataset
+        for mode in [1, 2, 3]:
+            normer = Normalizer(mode=mode)
+            norm_data = normer.normalize(data)
+            stream_normer = Normalizer(mode=mode)
+            for i in range(0, data.shape[0], 30):
+                stream_normer.partial_fit(data[i:i + 30])
+            stream_normer.finalize()
+            npt.assert_array_almost_equal(stream_normer.mean_labels, normer.mean_labels)
+            npt.assert_array_almost_equal(stream_normer.std_labels, normer.std_labels)
+            npt.assert_array_almost_equal(stream_normer.normalize(data, calc=False), norm_data)
+
+        # in-place normalization on float32 should give the same result without touching magic number
+        data_32 = data.astype(np.float32)
+        normer = Normalizer(mode=2)
+        norm_data = normer.normalize(data_32)
+        normer_inplace = Normalizer(mode=2)
+        normer_inplace.normalize(data_32, out=data_32)
+        npt.assert_array_almost_equal(data_32, norm_data, decimal=5)
+        self.assertEqual(data_32[magic_idx], MAGIC_NUMBER)
+        normer_inplace.denormalize(data_32, out=data_32)
+        npt.assert_array_almost_equal(data_32, data, decimal=4)
+
+        # make sure finalize without data raises error
+        self.assertRaises(ValueError, Normalizer(mode=1).finalize)
+
         errorous_norm = Normalizer(mode=-1234)
 
         self.assertRaises(ValueError, errorous_norm.normalize, data)
@@ -50,6 +94,83 @@ class UtilitiesTestCase(unittest.TestCase):
         data = np.random.normal(0, 1, (100, 10))
         npt.assert_array_almost_equal(s3_norm.denormalize(s3_norm.normalize(data)), data)
 
+    def test_generator_exploration_order(self):
+        from astroNN.models.CNNBase import CNNDataGenerator
+        import numpy as np
+
+        idx_list = range(1000)
+        # locality-aware shuffling should still visit every index exactly once
+        gen = CNNDataGenerator(batch_size=64, shuffle='chunk', chunk_size=16, buffer_size=4)
+        indexes = gen._get_exploration_order(idx_list)
+        npt.assert_array_equal(np.sort(indexes), np.arange(1000))
+        # indices inside each batch are sorted
+        for i in range(0, 1000, 64):
+            batch = indexes[i:i + 64]
+            npt.assert_array_equal(batch, np.sort(batch))
+
+        # no shuffling should preserve the original order
+        gen = CNNDataGenerator(batch_size=64, shuffle=False)
+        npt.assert_array_equal(gen._get_exploration_order(idx_list), np.arange(1000))
+
+        # make sure unknown strategy raises error
+        self.assertRaises(ValueError, CNNDataGenerator, batch_size=64, shuffle='random')
+        gen = CNNDataGenerator(batch_size=64)
+        gen.shuffle = 'random'
+        self.assertRaises(ValueError, gen._get_exploration_order, idx_list)
+
+    def test_generator_benchmark(self):
+        from astroNN.nn.utilities.benchmark import generator_benchmark
+
+        results = generator_benchmark(batch_sizes=(16,), workers=(1, 2), num_data=64, steps=2, verbose=False)
+        # 4 generators x 2 data shapes x 3 backends x 2 workers settings
+        self.assertEqual(len(results), 48)
+        self.assertTrue(all(r['batches_per_sec'] > 0 for r in results))
+        # h5 backend should always use locality-aware shuffling
+        self.assertTrue(all(r['shuffle'] == 'chunk' for r in results if r['backend'] == 'h5'))
+
+    def test_import_time_benchmark(self):
+        from astroNN.nn.utilities.benchmark import import_time_benchmark
+
+        results = import_time_benchmark(modules=('astroNN.apogee.chips', 'astroNN.gaia', 'astroNN.models',
+                                                 'astroNN.models.batch_predict'), repeat=1, verbose=False)
+        self.assertEqual(len(results), 4)
+        self.assertTrue(all(r['import_sec'] > 0 for r in results))
+        # heavy dependencies should only be loaded on first use
+        self.assertTrue(all(r['heavy_modules'] == [] for r in results))
+
+    def test_inference_server(self):
+        import json
+        import urllib.request
+        from concurrent.futures import ThreadPoolExecutor
+        import numpy as np
+        from astroNN.models.server import InferenceServer
+
+        def dummy_predictor(x, x_err=None):
+            return 2. * x, {'total': np.ones_like(x)}
+
+        def post(server, x):
+            request = urllib.request.Request(f'http://{server.host}:{server.port}/predict',
+                                             data=json.dumps({'x': x.tolist()}).encode('utf-8'))
+            with urllib.request.urlopen(request) as response:
+                return json.loads(response.read().decode('utf-8'))
+
+        data = np.random.normal(0, 1, (32, 5))
+        with InferenceServer(dummy_predictor, max_batch_size=16, max_latency=0.05) as server:
+            with ThreadPoolExecutor(8) as executor:
+                results = list(executor.map(lambda i: post(server, data[i:i + 2]), range(0, 32, 2)))
+            with urllib.request.urlopen(f'http://{server.host}:{server.port}/stats') as response:
+                stats = json.loads(response.read().decode('utf-8'))
+
+        # every request gets back its own result
+        for i, result in zip(range(0, 32, 2), results):
+            npt.assert_array_almost_equal(result['prediction'], 2. * data[i:i + 2])
+            self.assertEqual(np.array(result['uncertainty']['total']).shape, (2, 5))
+        self.assertEqual(stats['num_requests'], 16)
+        self.assertEqual(sum(stats['latency_counts']), 16)
+        # concurrent requests should be coalesced
+        self.assertLess(stats['num_batches'], 16)
+        self.assertEqual(sum(stats['batch_fill_counts']), stats['num_batches'])
+
     def test_cpu_gpu_management(self):
         from astroNN.shared.nn_tools import cpu_fallback
 
@@ -77,6 +198,21 @@ class UtilitiesTestCase(unittest.TestCase):
         config_path(flag=1)
         config_path(flag=2)
 
+        # configuration is cached until reload, environment variables override config.ini
+        from astroNN.config import CONFIG
+        os.environ['ASTRONN_NUM_WORKERS'] = '3'
+        os.environ['ASTRONN_CACHE_MAX_SIZE'] = '1.5'
+        try:
+            CONFIG.reload()
+            self.assertEqual(CONFIG.num_workers, 3)
+            self.assertEqual(CONFIG.cache_max_size, 1.5)
+        finally:
+            del os.environ['ASTRONN_NUM_WORKERS']
+            del os.environ['ASTRONN_CACHE_MAX_SIZE']
+        CONFIG.reload()
+        self.assertEqual(CONFIG.num_workers, os.cpu_count())
+        self.assertIsNone(CONFIG.cache_max_size)
+
         from astroNN.config import switch_keras
         switch_keras('tensorflow')
         switch_keras('keras')